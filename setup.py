@@ -60,6 +60,7 @@ setup(name='duckietown-world',
           'console_scripts': [
               # 'dt-world-draw-log = duckietown_world.svg_drawing:draw_logs_main',
               'dt-world-draw-maps = duckietown_world.svg_drawing:draw_maps_main',
+              'dt-world-evaluate-episodes = duckietown_world.rules:evaluate_episodes_main',
           ]
       }
       )
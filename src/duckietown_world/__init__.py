@@ -7,9 +7,9 @@ import logging
 
 logging.basicConfig()
 logger = logging.getLogger('dt-world')
-logger.setLevel(logging.DEBUG)
+logger.setLevel(logging.INFO)
 
-logger.info('duckietown-world %s' % __version__)
+logger.debug('duckietown-world %s' % __version__)
 # for templating work
 from zuper_json import logger as l
 _ = l
@@ -19,12 +19,32 @@ from duckietown_serialization_ds1 import logger as dslogger
 dslogger.setLevel(logging.CRITICAL)
 
 from contracts import disable_all, __version__ as contracts_version
-logger.info('contracts %s ' % contracts_version)
+logger.debug('contracts %s ' % contracts_version)
 disable_all()
 
 
 from .geo import *
 from .seqs import *
-from .svg_drawing import *
 from .world_duckietown import *
 
+# The SVG drawing functions (which need svgwrite and bs4) are imported
+# on first use, for example by "from duckietown_world import draw_static".
+import importlib as _importlib
+import sys as _sys
+import types as _types
+
+
+class _LazyModule(_types.ModuleType):
+
+    def __getattr__(self, name):
+        if not name.startswith('_'):
+            svg_drawing = _importlib.import_module(__name__ + '.svg_drawing')
+            if name == 'svg_drawing':
+                return svg_drawing
+            if name in svg_drawing.__dict__:
+                return getattr(svg_drawing, name)
+        msg = 'module %r has no attribute %r' % (__name__, name)
+        raise AttributeError(msg)
+
+
+_sys.modules[__name__].__class__ = _LazyModule
@@ -3,3 +3,4 @@ from .measurements_utils import *
 from .placed_object import *
 from .rectangular_area import *
 from .transforms import *
+from .se2_array import *
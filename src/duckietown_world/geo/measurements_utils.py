@@ -2,9 +2,7 @@
 from dataclasses import dataclass
 from typing import Tuple, List, Iterator, Callable
 
-import networkx as nx
 import numpy as np
-from networkx import MultiDiGraph
 
 from duckietown_world.seqs import Sequence
 from .placed_object import PlacedObject, FQN, SpatialRelation
@@ -35,7 +33,8 @@ def iterate_measurements_relations(po_name: FQN, po: PlacedObject) -> Iterator[T
         yield from iterate_measurements_relations(cname, child)
 
 
-def get_meausurements_graph(po: PlacedObject) -> MultiDiGraph:
+def get_meausurements_graph(po: PlacedObject) -> 'networkx.MultiDiGraph':
+    from networkx import MultiDiGraph
     G = MultiDiGraph()
     for name, sr in iterate_measurements_relations((), po):
         a = sr.a
@@ -75,7 +74,21 @@ def get_static_and_dynamic(po: PlacedObject) -> Tuple[List, List]:
     return static, dynamic
 
 
-def get_flattened_measurement_graph(po: PlacedObject, include_root_to_self=False) -> nx.DiGraph:
+def get_flattened_measurement_graph(po: PlacedObject, include_root_to_self=False) -> 'networkx.DiGraph':
+    """
+        Returns a graph with an edge from the root to each node,
+        with the attribute "transform_sequence".
+
+        The result is cached in the object, so it must not be modified.
+        It is computed again after set_object() or remove_object() in the tree;
+        after other changes in place, call PlacedObject.invalidate_cache().
+    """
+    key = ('flattened_measurement_graph', include_root_to_self)
+    return po.get_cached(key, lambda: _get_flattened_measurement_graph(po, include_root_to_self))
+
+
+def _get_flattened_measurement_graph(po: PlacedObject, include_root_to_self: bool) -> 'networkx.DiGraph':
+    import networkx as nx
     G = get_meausurements_graph(po)
     G2 = nx.DiGraph()
     root_name = ()
@@ -1,8 +1,9 @@
 # coding=utf-8
 
 import copy
+import weakref
 from dataclasses import dataclass, field
-from typing import Tuple, Dict, List, Union
+from typing import Tuple, Dict, List, Union, Any, Callable, Hashable
 
 import six
 import yaml
@@ -10,6 +11,7 @@ import yaml
 from contracts import check_isinstance, indent
 from duckietown_serialization_ds1 import Serializable
 from duckietown_world.seqs import UndefinedAtTime
+from duckietown_world.utils.memoizing import MEMOIZED_ATTRIBUTE, reset_memoized
 from .rectangular_area import RectangularArea
 from .transforms import Transform
 
@@ -77,8 +79,24 @@ class GroundTruth(SpatialRelation):
 root: FQN = ()
 
 
+@dataclass
+class CacheEntry:
+    value: Any
+    # the tree version of the object when the value was computed
+    tree_version: int
+
+
 @dataclass
 class PlacedObject(Serializable):
+    """
+        An object with children placed by spatial relations.
+
+        Some values computed from the subtree (the flattened measurement graph, the tile index, ...)
+        are cached in the object; see get_cached(). They are recomputed after set_object()
+        and remove_object() on the object or on any of its descendants. After any other
+        modification in place (of children, spatial_relations, of the transforms, or of the
+        parameters of an object), call invalidate_cache() on the object that was modified.
+    """
     children: Dict[str, 'PlacedObject'] = field(default_factory=dict)
     spatial_relations: Dict[str, SpatialRelation] = field(default_factory=dict)
 
@@ -128,10 +146,94 @@ class PlacedObject(Serializable):
                 self.spatial_relations[child] = sr
 
     def remove_object(self, k):
-        self.children.pop(k)
+        child = self.children.pop(k)
         for sr_id, sr in list(self.spatial_relations.items()):
             if sr.b == (k,):
                 self.spatial_relations.pop(sr_id)
+        if not any(_ is child for _ in self.children.values()):
+            parents = child.__dict__.get('_parents', None)
+            if parents is not None:
+                parents.pop(id(self), None)
+        self._modified()
+
+    def invalidate_cache(self):
+        """
+            Discards the cached values of this object and of the objects containing it.
+
+            Call this after modifying the object in place, other than with set_object()
+            and remove_object().
+        """
+        self._modified()
+
+    def _modified(self):
+        """ Called when the children or the spatial relations change. """
+        self._reset_cache()
+        # the tree version of this object and of all the objects containing it
+        seen = set()
+        todo = [self]
+        while todo:
+            ob = todo.pop()
+            if id(ob) in seen:
+                continue
+            seen.add(id(ob))
+            ob.__dict__['_tree_version'] = ob.__dict__.get('_tree_version', 0) + 1
+            parents = ob.__dict__.get('_parents', None)
+            if parents is not None:
+                todo.extend(parents.values())
+
+    def _link_subtree(self):
+        """ Records in each object of the subtree its parents, so that _modified() can reach this object. """
+        for child in self.children.values():
+            parents = child.__dict__.get('_parents', None)
+            if parents is None:
+                parents = child.__dict__['_parents'] = weakref.WeakValueDictionary()
+            parents[id(self)] = self
+            child._link_subtree()
+
+    def _reset_cache(self):
+        self.__dict__.pop('_cache', None)
+        reset_memoized(self)
+
+    def __getstate__(self):
+        # the cached values are not pickled
+        state = dict(self.__dict__)
+        state.pop('_cache', None)
+        state.pop(MEMOIZED_ATTRIBUTE, None)
+        state.pop('_parents', None)
+        state.pop('_tree_version', None)
+        return state
+
+    def __copy__(self):
+        # the copy does not share the caches, which would become invalid
+        # as soon as its children are changed
+        res = type(self).__new__(type(self))
+        res.__dict__.update(self.__getstate__())
+        return res
+
+    def get_cached(self, key: Hashable, f: Callable[[], Any]) -> Any:
+        """
+            Returns the result of f(), which must depend only on
+            the subtree rooted at this object.
+
+            The result is cached until any object in the subtree is modified
+            using set_object() or remove_object(), or invalidate_cache() is called on it.
+            Modifications in place of the children, of the spatial relations
+            or of the transforms are not detected.
+
+            Each object has a tree version, which is incremented when
+            the object or one of its descendants is modified,
+            so the check is constant-time.
+        """
+        cache = self.__dict__.setdefault('_cache', {})
+        tree_version = self.__dict__.get('_tree_version', 0)
+        entry = cache.get(key, None)
+        if entry is not None and entry.tree_version == tree_version:
+            return entry.value
+
+        self._link_subtree()
+        value = f()
+        cache[key] = CacheEntry(value=value, tree_version=tree_version)
+        return value
 
     def _simplecopy(self, *args, **kwargs):
         children = dict((k, v) for k, v in self.children.items())
@@ -234,6 +336,7 @@ class PlacedObject(Serializable):
             st = klass(a=root, b=(name,), transform=v)
             i = len(self.spatial_relations)
             self.spatial_relations[i] = st
+        self._modified()
 
     def draw_svg(self, drawing, g):
         from duckietown_world.svg_drawing import draw_axes
@@ -0,0 +1,148 @@
+# coding=utf-8
+from typing import List, Sequence, Union
+
+import numpy as np
+
+from .transforms import SE2Transform
+
+__all__ = [
+    'SE2Array',
+]
+
+
+def _wrap_angle(theta: np.ndarray) -> np.ndarray:
+    """ Wraps the angles to [-pi, pi). """
+    return (theta + np.pi) % (2 * np.pi) - np.pi
+
+
+class SE2Array(object):
+    """
+        N poses, stored as an array of shape (N, 3) with columns x, y, theta.
+
+        This takes 24 bytes per pose, instead of an SE2Transform object each,
+        and the operations are vectorized.
+        The result of compose() and inverse() have the angles in [-pi, pi).
+    """
+    __slots__ = ['data']
+
+    def __init__(self, data):
+        data = np.array(data, dtype='float64')
+        if data.ndim != 2 or data.shape[1] != 3:
+            msg = 'Expected an array of shape (N, 3), got %s.' % (data.shape,)
+            raise ValueError(msg)
+        self.data = data
+
+    @classmethod
+    def identity(cls, n: int) -> 'SE2Array':
+        return SE2Array(np.zeros((n, 3)))
+
+    @classmethod
+    def from_transforms(cls, transforms: Sequence[SE2Transform]) -> 'SE2Array':
+        data = np.zeros((len(transforms), 3))
+        for i, q in enumerate(transforms):
+            data[i, 0:2] = q.p
+            data[i, 2] = q.theta
+        return SE2Array(data)
+
+    @classmethod
+    def from_SE2(cls, matrices) -> 'SE2Array':
+        """ From an array of matrices of shape (N, 3, 3). """
+        matrices = np.asarray(matrices, dtype='float64')
+        theta = np.arctan2(matrices[:, 1, 0], matrices[:, 0, 0])
+        return SE2Array(np.column_stack((matrices[:, 0, 2], matrices[:, 1, 2], theta)))
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    def __getitem__(self, i) -> Union[SE2Transform, 'SE2Array']:
+        """ An integer gives an SE2Transform; a slice or an array of indices gives an SE2Array. """
+        if isinstance(i, (int, np.integer)):
+            x, y, theta = self.data[i].tolist()
+            return SE2Transform([x, y], theta)
+        return SE2Array(self.data[i])
+
+    def __iter__(self):
+        for x, y, theta in self.data.tolist():
+            yield SE2Transform([x, y], theta)
+
+    def __repr__(self):
+        return 'SE2Array(%d poses)' % len(self)
+
+    @property
+    def p(self) -> np.ndarray:
+        """ The translations, of shape (N, 2). """
+        return self.data[:, 0:2]
+
+    @property
+    def theta(self) -> np.ndarray:
+        """ The angles, of shape (N,). """
+        return self.data[:, 2]
+
+    def as_transforms(self) -> List[SE2Transform]:
+        return list(self)
+
+    def as_SE2(self) -> np.ndarray:
+        """ Returns the matrices, of shape (N, 3, 3). """
+        n = len(self)
+        c = np.cos(self.theta)
+        s = np.sin(self.theta)
+        M = np.zeros((n, 3, 3))
+        M[:, 0, 0] = c
+        M[:, 0, 1] = -s
+        M[:, 1, 0] = s
+        M[:, 1, 1] = c
+        M[:, 0:2, 2] = self.p
+        M[:, 2, 2] = 1.0
+        return M
+
+    def compose(self, other: Union['SE2Array', SE2Transform]) -> 'SE2Array':
+        """
+            Returns the poses self[i] * other[i] (as products of matrices).
+
+            The other can be a single SE2Transform, which is then used for all the poses.
+        """
+        a = _as_array(self)
+        b = _as_array(other)
+        c = np.cos(a[:, 2])
+        s = np.sin(a[:, 2])
+        x = a[:, 0] + c * b[:, 0] - s * b[:, 1]
+        y = a[:, 1] + s * b[:, 0] + c * b[:, 1]
+        theta = _wrap_angle(a[:, 2] + b[:, 2])
+        return SE2Array(np.column_stack(np.broadcast_arrays(x, y, theta)))
+
+    def inverse(self) -> 'SE2Array':
+        """ Returns the inverses of the poses. """
+        c = np.cos(self.theta)
+        s = np.sin(self.theta)
+        x, y = self.data[:, 0], self.data[:, 1]
+        data = np.column_stack((-c * x - s * y, s * x - c * y, _wrap_angle(-self.theta)))
+        return SE2Array(data)
+
+    def relative(self, other: Union['SE2Array', SE2Transform]) -> 'SE2Array':
+        """ Returns the poses of other with respect to self, that is, inverse(self[i]) * other[i]. """
+        return self.inverse().compose(other)
+
+    def apply(self, points) -> np.ndarray:
+        """
+            Applies each pose to a point. The points have shape (N, 2),
+            or (2,) to apply all the poses to the same point.
+
+            Returns an array of shape (N, 2).
+        """
+        points = np.asarray(points, dtype='float64')
+        c = np.cos(self.theta)
+        s = np.sin(self.theta)
+        px = points[..., 0]
+        py = points[..., 1]
+        x = self.data[:, 0] + c * px - s * py
+        y = self.data[:, 1] + s * px + c * py
+        return np.column_stack((x, y))
+
+
+def _as_array(q: Union[SE2Array, SE2Transform]) -> np.ndarray:
+    if isinstance(q, SE2Array):
+        return q.data
+    if isinstance(q, SE2Transform):
+        return np.array([[q.p[0], q.p[1], q.theta]])
+    msg = 'Expected SE2Array or SE2Transform, got %s.' % type(q).__name__
+    raise TypeError(msg)
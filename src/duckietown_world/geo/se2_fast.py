@@ -0,0 +1,247 @@
+# coding=utf-8
+"""
+    Closed-form operations on SE(2) and se(2).
+
+    These give the same results as the generic matrix exponential and logarithm
+    of the geometry package, for a fraction of the cost.
+
+    All functions work on a single matrix of shape (3, 3) or on a batch
+    of shape (..., 3, 3); for se(2) the matrices are the ones of geometry.se2,
+    [[0, -w, vx], [w, 0, vy], [0, 0, 0]].
+
+    For a single matrix, the computation is done on Python floats,
+    which is faster than numpy for such small arrays.
+"""
+import math
+
+import numpy as np
+
+__all__ = [
+    'SE2_from_xytheta',
+    'xytheta_from_SE2',
+    'SE2_inverse',
+    'SE2_multiply',
+    'SE2_relative',
+    'E2_inverse',
+    'se2_exp',
+    'SE2_log',
+    'SE2_interpolate',
+    'SE2_distance',
+    'SE2_belongs',
+    'se2_belongs',
+]
+
+# below this angle, the Taylor expansions are used
+_SMALL_ANGLE = 1e-6
+
+
+def SE2_from_xytheta(xytheta) -> np.ndarray:
+    """ From an array of shape (..., 3) with x, y, theta to matrices of shape (..., 3, 3). """
+    xytheta = np.asarray(xytheta, dtype='float64')
+    theta = xytheta[..., 2]
+    c = np.cos(theta)
+    s = np.sin(theta)
+    M = np.zeros(xytheta.shape[:-1] + (3, 3))
+    M[..., 0, 0] = c
+    M[..., 0, 1] = -s
+    M[..., 1, 0] = s
+    M[..., 1, 1] = c
+    M[..., 0, 2] = xytheta[..., 0]
+    M[..., 1, 2] = xytheta[..., 1]
+    M[..., 2, 2] = 1.0
+    return M
+
+
+def xytheta_from_SE2(q) -> np.ndarray:
+    """ From matrices of shape (..., 3, 3) to an array of shape (..., 3) with x, y, theta. """
+    q = np.asarray(q, dtype='float64')
+    theta = np.arctan2(q[..., 1, 0], q[..., 0, 0])
+    return np.stack((q[..., 0, 2], q[..., 1, 2], theta), axis=-1)
+
+
+def _SE2_from_floats(x: float, y: float, theta: float) -> np.ndarray:
+    c = math.cos(theta)
+    s = math.sin(theta)
+    return np.array([[c, -s, x], [s, c, y], [0.0, 0.0, 1.0]])
+
+
+def SE2_inverse(q) -> np.ndarray:
+    """ Inverse of rigid transforms: [R^T, -R^T t]. """
+    q = np.asarray(q, dtype='float64')
+    if q.ndim == 2:
+        (r00, r01, tx), (r10, r11, ty), _ = q.tolist()
+        return np.array([[r00, r10, -(r00 * tx + r10 * ty)],
+                         [r01, r11, -(r01 * tx + r11 * ty)],
+                         [0.0, 0.0, 1.0]])
+    Rt = np.swapaxes(q[..., 0:2, 0:2], -1, -2)
+    t = q[..., 0:2, 2]
+    res = np.zeros(q.shape)
+    res[..., 0:2, 0:2] = Rt
+    res[..., 0:2, 2] = -np.einsum('...ij,...j->...i', Rt, t)
+    res[..., 2, 2] = 1.0
+    return res
+
+
+def E2_inverse(m) -> np.ndarray:
+    """
+        Inverse of affine transforms [A, t] where A is any invertible 2x2 matrix
+        (for example, a rotation composed with a scaling).
+    """
+    m = np.asarray(m, dtype='float64')
+    if m.ndim == 2:
+        (a, b, tx), (c, d, ty), _ = m.tolist()
+        det = a * d - b * c
+        if det == 0:
+            msg = 'The matrix is not invertible:\n%s' % m
+            raise np.linalg.LinAlgError(msg)
+        ia, ib, ic, id_ = d / det, -b / det, -c / det, a / det
+        return np.array([[ia, ib, -(ia * tx + ib * ty)],
+                         [ic, id_, -(ic * tx + id_ * ty)],
+                         [0.0, 0.0, 1.0]])
+    a = m[..., 0, 0]
+    b = m[..., 0, 1]
+    c = m[..., 1, 0]
+    d = m[..., 1, 1]
+    det = a * d - b * c
+    if np.any(det == 0):
+        msg = 'The matrix is not invertible:\n%s' % m
+        raise np.linalg.LinAlgError(msg)
+    res = np.zeros(m.shape)
+    res[..., 0, 0] = d / det
+    res[..., 0, 1] = -b / det
+    res[..., 1, 0] = -c / det
+    res[..., 1, 1] = a / det
+    res[..., 0:2, 2] = -np.einsum('...ij,...j->...i', res[..., 0:2, 0:2], m[..., 0:2, 2])
+    res[..., 2, 2] = 1.0
+    return res
+
+
+def SE2_multiply(q0, q1) -> np.ndarray:
+    return np.matmul(q0, q1)
+
+
+def SE2_relative(base, pose) -> np.ndarray:
+    """ Returns the pose with respect to base, that is, inverse(base) * pose. """
+    if np.ndim(base) == 2 and np.ndim(pose) == 2:
+        return np.dot(SE2_inverse(base), pose)
+    return np.matmul(SE2_inverse(base), pose)
+
+
+def _V_coefficients_float(theta: float):
+    """ As _V_coefficients(), for one angle. """
+    if abs(theta) < _SMALL_ANGLE:
+        theta2 = theta * theta
+        return 1.0 - theta2 / 6.0, theta / 2.0 - theta * theta2 / 24.0
+    return math.sin(theta) / theta, (1.0 - math.cos(theta)) / theta
+
+
+def _log_floats(q: np.ndarray):
+    """ Returns vx, vy, w of the logarithm of one matrix. """
+    (r00, _, tx), (r10, _, ty), _ = q.tolist()
+    w = math.atan2(r10, r00)
+    a, b = _V_coefficients_float(w)
+    n = a * a + b * b
+    return (a * tx + b * ty) / n, (-b * tx + a * ty) / n, w
+
+
+def _V_coefficients(theta: np.ndarray):
+    """
+        Returns a = sin(theta) / theta, b = (1 - cos(theta)) / theta,
+        such that exp() maps the linear velocity v to the translation [[a, -b], [b, a]] v.
+    """
+    theta = np.asarray(theta, dtype='float64')
+    small = np.abs(theta) < _SMALL_ANGLE
+    safe = np.where(small, 1.0, theta)
+    theta2 = theta * theta
+    a = np.where(small, 1.0 - theta2 / 6.0, np.sin(safe) / safe)
+    b = np.where(small, theta / 2.0 - theta * theta2 / 24.0, (1.0 - np.cos(safe)) / safe)
+    return a, b
+
+
+def se2_exp(v) -> np.ndarray:
+    """ Exponential map, from se(2) to SE(2). """
+    v = np.asarray(v, dtype='float64')
+    if v.ndim == 2:
+        (_, _, vx), (w, _, vy), _ = v.tolist()
+        a, b = _V_coefficients_float(w)
+        return _SE2_from_floats(a * vx - b * vy, b * vx + a * vy, w)
+    vx = v[..., 0, 2]
+    vy = v[..., 1, 2]
+    w = v[..., 1, 0]
+    a, b = _V_coefficients(w)
+    xytheta = np.stack((a * vx - b * vy, b * vx + a * vy, w), axis=-1)
+    return SE2_from_xytheta(xytheta)
+
+
+def SE2_log(q) -> np.ndarray:
+    """ Logarithm map, from SE(2) to se(2), with the angle in [-pi, pi]. """
+    q = np.asarray(q, dtype='float64')
+    if q.ndim == 2:
+        vx, vy, w = _log_floats(q)
+        return np.array([[0.0, -w, vx], [w, 0.0, vy], [0.0, 0.0, 0.0]])
+    w = np.arctan2(q[..., 1, 0], q[..., 0, 0])
+    tx = q[..., 0, 2]
+    ty = q[..., 1, 2]
+    a, b = _V_coefficients(w)
+    # inverse of [[a, -b], [b, a]]
+    n = a * a + b * b
+    vx = (a * tx + b * ty) / n
+    vy = (-b * tx + a * ty) / n
+    res = np.zeros(q.shape)
+    res[..., 0, 1] = -w
+    res[..., 1, 0] = w
+    res[..., 0, 2] = vx
+    res[..., 1, 2] = vy
+    return res
+
+
+def SE2_interpolate(q0, q1, alpha) -> np.ndarray:
+    """
+        Geodesic interpolation: q0 * exp(alpha * log(inverse(q0) * q1)).
+
+        alpha can be an array, broadcast against the batch dimensions.
+    """
+    q0 = np.asarray(q0, dtype='float64')
+    if q0.ndim == 2 and np.ndim(q1) == 2 and np.ndim(alpha) == 0:
+        vx, vy, w = _log_floats(SE2_relative(q0, q1))
+        alpha = float(alpha)
+        vx, vy, w = alpha * vx, alpha * vy, alpha * w
+        a, b = _V_coefficients_float(w)
+        return np.dot(q0, _SE2_from_floats(a * vx - b * vy, b * vx + a * vy, w))
+    alpha = np.asarray(alpha, dtype='float64')[..., np.newaxis, np.newaxis]
+    v = SE2_log(SE2_relative(q0, q1))
+    return np.matmul(q0, se2_exp(alpha * v))
+
+
+def SE2_distance(q0, q1) -> np.ndarray:
+    """ Returns the norm of the linear part of log(inverse(q0) * q1). """
+    if np.ndim(q0) == 2 and np.ndim(q1) == 2:
+        vx, vy, _ = _log_floats(SE2_relative(q0, q1))
+        return math.hypot(vx, vy)
+    v = SE2_log(SE2_relative(q0, q1))
+    return np.hypot(v[..., 0, 2], v[..., 1, 2])
+
+
+def SE2_belongs(q, atol: float = 1e-6):
+    """ Raises ValueError if q is not a matrix in SE(2). """
+    if not isinstance(q, np.ndarray) or q.shape != (3, 3):
+        msg = 'Expected a 3x3 array, got %r.' % (q,)
+        raise ValueError(msg)
+    (r00, r01, _), (r10, r11, _), (z0, z1, one) = q.tolist()
+    errors = [r00 * r00 + r10 * r10 - 1, r01 * r01 + r11 * r11 - 1, r00 * r01 + r10 * r11,
+              r00 * r11 - r01 * r10 - 1, z0, z1, one - 1]
+    if not all(abs(_) <= atol for _ in errors):
+        msg = 'The matrix is not in SE(2):\n%s' % q
+        raise ValueError(msg)
+
+
+def se2_belongs(v, atol: float = 1e-6):
+    """ Raises ValueError if v is not a matrix in se(2). """
+    if not isinstance(v, np.ndarray) or v.shape != (3, 3):
+        msg = 'Expected a 3x3 array, got %r.' % (v,)
+        raise ValueError(msg)
+    (a00, a01, _), (a10, a11, _), (z0, z1, z2) = v.tolist()
+    errors = [a00, a11, a01 + a10, z0, z1, z2]
+    if not all(abs(_) <= atol for _ in errors):
+        msg = 'The matrix is not in se(2):\n%s' % v
+        raise ValueError(msg)
@@ -1,5 +1,5 @@
 # coding=utf-8
-
+import math
 from abc import ABCMeta, abstractmethod
 from typing import NewType
 
@@ -99,8 +99,7 @@ class SE2Transform(Transform, Serializable):
     @classmethod
     def from_SE2(cls, q: SE2value) -> 'SE2Transform':
         """ From a matrix """
-        translation, angle = geo.translation_angle_from_SE2(q)
-        return SE2Transform(translation, angle)
+        return SE2Transform([q[0, 2], q[1, 2]], math.atan2(q[1, 0], q[0, 0]))
 
     def params_to_json_dict(self):
         res = {}
@@ -136,14 +135,17 @@ class SE2Transform(Transform, Serializable):
 
         return dict(p=p, theta=theta)
 
+    def _get_matrix(self) -> SE2value:
+        # not cached: it would take more memory than p and theta, and it is cheap to compute
+        x, y = self.p.tolist()
+        c, s = math.cos(self.theta), math.sin(self.theta)
+        return np.array([[c, -s, x], [s, c, y], [0.0, 0.0, 1.0]])
+
     def as_SE2(self) -> SE2value:
-        import geometry
-        M = geometry.SE2_from_translation_angle(self.p, self.theta)
-        return M
+        return self._get_matrix()
 
     def asmatrix2d(self):
-        M = self.as_SE2()
-        return Matrix2D(M)
+        return Matrix2D(self._get_matrix())
 
 
 new_contract('SE2Transform', SE2Transform)
@@ -162,7 +164,7 @@ class Scale2D(Transform, Serializable):
 class Matrix2D(Transform, Serializable):
 
     def __init__(self, m):
-        self.m = np.array(m, 'float32')
+        self.m = np.array(m, 'float64')
         assert self.m.shape == (3, 3)
 
     def asmatrix2d(self):
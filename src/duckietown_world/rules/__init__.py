@@ -1,2 +1,5 @@
 from .rule import *
 from .in_drivable_lane import *
+from .shared import *
+from .batch import *
+from .incremental import *
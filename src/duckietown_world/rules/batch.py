@@ -0,0 +1,206 @@
+# coding=utf-8
+import argparse
+import json
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+import geometry as geo
+from duckietown_world import logger
+from duckietown_world.geo import PlacedObject, SE2Transform
+from duckietown_world.seqs import SampledSequence
+from .rule import RuleEvaluationContext, evaluate_rules_in_context
+
+__all__ = [
+    'EpisodeJob',
+    'EpisodeEvaluation',
+    'evaluate_episode',
+    'evaluate_episodes',
+    'evaluate_episodes_main',
+]
+
+
+@dataclass
+class EpisodeJob:
+    """
+        An episode to evaluate: a trajectory on one of the maps.
+
+        The trajectory is stored as arrays, which are cheap to send to a worker
+        (the parametrized SampledSequence classes cannot be pickled).
+    """
+    map_name: str
+    # shape (n,)
+    timestamps: np.ndarray
+    # shape (n, 3): x, y, theta
+    poses: np.ndarray
+    name: Optional[str] = None
+
+    @classmethod
+    def from_sequence(cls, map_name: str, poses_sequence: SampledSequence,
+                      name: Optional[str] = None) -> 'EpisodeJob':
+        poses = []
+        for _, q in poses_sequence:
+            if isinstance(q, SE2Transform):
+                poses.append([q.p[0], q.p[1], q.theta])
+            else:
+                t, theta = geo.translation_angle_from_SE2(q)
+                poses.append([t[0], t[1], theta])
+        return EpisodeJob(map_name=map_name,
+                          timestamps=np.array(poses_sequence.timestamps, dtype='float64'),
+                          poses=np.array(poses, dtype='float64').reshape(-1, 3),
+                          name=name)
+
+    def get_poses_sequence(self) -> SampledSequence[SE2Transform]:
+        values = [SE2Transform([x, y], theta) for x, y, theta in self.poses.tolist()]
+        return SampledSequence[SE2Transform](self.timestamps.tolist(), values)
+
+
+@dataclass
+class EpisodeEvaluation:
+    # position of the job in the list given to evaluate_episodes()
+    index: int
+    name: Optional[str]
+    map_name: str
+    # total of each metric, with the keys used by make_timeseries()
+    totals: Dict[str, float]
+    # as returned by evaluate_rules()
+    timing: Dict[str, float]
+    # the traceback, if the evaluation failed
+    error: Optional[str] = None
+
+    def as_json_dict(self):
+        return dict(index=self.index, name=self.name, map_name=self.map_name,
+                    totals=self.totals, timing=self.timing, error=self.error)
+
+
+# The maps, with their indices already computed.
+# They are loaded in the parent process before creating the workers,
+# which then inherit them (copy-on-write, if processes are forked).
+_maps: Dict[str, PlacedObject] = {}
+
+
+def _get_map(map_name: str) -> PlacedObject:
+    if map_name not in _maps:
+        from duckietown_world.world_duckietown import load_map, get_tile_index
+        dw = load_map(map_name)
+        tile_index = get_tile_index(dw)
+        tile_index.get_arrays()
+        for tls in tile_index.lane_segments:
+            tls.lane_segment.center_line_arcs()
+        _maps[map_name] = dw
+    return _maps[map_name]
+
+
+def evaluate_episode(job: EpisodeJob, index: int = 0) -> EpisodeEvaluation:
+    """ Evaluates the default rules on one episode, in this process. """
+    from duckietown_world.world_duckietown.tile import GetClosestLane
+
+    timing = {}
+    totals = {}
+    try:
+        world = _get_map(job.map_name)
+        poses_sequence = job.get_poses_sequence()
+        interval = SampledSequence.from_iterator(enumerate(poses_sequence.timestamps))
+
+        # as create_lane_highlight(), without adding the visualization to the map
+        t0 = time.perf_counter()
+        lane_pose_seq = poses_sequence.transform_values(GetClosestLane(world))
+        timing['lane_poses'] = time.perf_counter() - t0
+
+        context = RuleEvaluationContext(interval=interval, world=world, ego_name='ego',
+                                        lane_pose_seq=lane_pose_seq, pose_seq=poses_sequence)
+        evaluated = evaluate_rules_in_context(context, timing=timing)
+        for k, rer in evaluated.items():
+            for km, evaluated_metric in rer.metrics.items():
+                totals["/".join((k,) + km)] = float(evaluated_metric.total)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+
+    return EpisodeEvaluation(index=index, name=job.name, map_name=job.map_name,
+                             totals=totals, timing=timing, error=error)
+
+
+def evaluate_episodes(jobs: Iterable[EpisodeJob], processes: Optional[int] = None) -> Iterator[EpisodeEvaluation]:
+    """
+        Evaluates the episodes on a pool of processes, yielding the results
+        as they are completed (not in order; see EpisodeEvaluation.index).
+
+        The maps are loaded once, before starting the pool.
+
+        :param processes: number of processes (default: number of CPUs);
+                          if 0, the episodes are evaluated in this process.
+    """
+    jobs = list(jobs)
+    for map_name in sorted(set(_.map_name for _ in jobs)):
+        try:
+            _get_map(map_name)
+        except Exception:
+            # reported by evaluate_episode() for each job on this map
+            logger.error('Could not load map %r.' % map_name)
+
+    if processes == 0:
+        for i, job in enumerate(jobs):
+            yield evaluate_episode(job, i)
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(evaluate_episode, job, i) for i, job in enumerate(jobs)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def evaluate_episodes_main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    parser = argparse.ArgumentParser(description='Evaluates the rules on many episodes.')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of processes (0: evaluate in this process)')
+    parser.add_argument('--output', help='output file (JSON lines); default: stdout', default=None)
+    parser.add_argument('filename',
+                        help='input file (JSON lines), with one episode per line: '
+                             '{"map_name": ..., "timestamps": [...], "poses": [[x, y, theta], ...], "name": ...}')
+    parsed = parser.parse_args(args)
+
+    jobs = read_episode_jobs(parsed.filename)
+    logger.info('Evaluating %d episodes.' % len(jobs))
+
+    f = open(parsed.output, 'w') if parsed.output else sys.stdout
+    try:
+        nfailed = 0
+        for res in evaluate_episodes(jobs, processes=parsed.processes):
+            if res.error:
+                nfailed += 1
+                logger.error('Episode %s failed:\n%s' % (res.name or res.index, res.error))
+            f.write(json.dumps(res.as_json_dict()) + '\n')
+            f.flush()
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    if nfailed:
+        logger.error('%d of %d episodes failed.' % (nfailed, len(jobs)))
+        sys.exit(1)
+
+
+def read_episode_jobs(filename: str) -> List[EpisodeJob]:
+    jobs = []
+    with open(filename) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            d = json.loads(line)
+            jobs.append(EpisodeJob(map_name=d['map_name'],
+                                   timestamps=np.array(d['timestamps'], dtype='float64'),
+                                   poses=np.array(d['poses'], dtype='float64').reshape(-1, 3),
+                                   name=d.get('name', None)))
+    return jobs
+
+
+if __name__ == '__main__':
+    evaluate_episodes_main()
@@ -2,11 +2,8 @@ import textwrap
 
 import numpy as np
 
-import geometry as geo
-from duckietown_world.seqs import SampledSequence, UndefinedAtTime, iterate_with_dt
+from duckietown_world.seqs import SampledSequence, iterate_with_dt, ArraySampledSequence
 from duckietown_world.seqs.tsequence import SampledSequenceBuilder
-from duckietown_world.world_duckietown import LanePose, GetLanePoseResult
-from duckietown_world.world_duckietown.tile import relative_pose
 from .rule import Rule, RuleEvaluationContext, RuleEvaluationResult
 
 __all__ = [
@@ -26,6 +23,8 @@ def integrate(sequence: SampledSequence[float]) -> SampledSequence[float]:
     if not sequence:
         msg = 'Cannot integrate empty sequence.'
         raise ValueError(msg)
+    if isinstance(sequence, ArraySampledSequence):
+        return sequence.integrate()
     total = 0.0
     timestamps = []
     values = []
@@ -43,6 +42,8 @@ def integrate(sequence: SampledSequence[float]) -> SampledSequence[float]:
 def accumulate(sequence: SampledSequence[float]) -> SampledSequence[float]:
     """ Integrates with respect to time.
         Sums the values along the horizontal. """
+    if isinstance(sequence, ArraySampledSequence):
+        return sequence.accumulate()
     total = 0.0
     timestamps = []
     values = []
@@ -55,9 +56,6 @@ def accumulate(sequence: SampledSequence[float]) -> SampledSequence[float]:
     return SampledSequence[float](timestamps, values)
 
 
-from typing import cast
-
-
 class SurvivalTime(Rule):
 
     def evaluate(self, context: RuleEvaluationContext, result: RuleEvaluationResult):
@@ -83,33 +81,9 @@ class SurvivalTime(Rule):
 class DeviationFromCenterLine(Rule):
 
     def evaluate(self, context: RuleEvaluationContext, result: RuleEvaluationResult):
-
-        interval = cast(SampledSequence, context.get_interval())
-        lane_pose_seq = context.get_lane_pose_seq()
-
-        timestamps = []
-        values = []
-
-        for i, timestamp in interval:
-            try:
-                name2lpr = lane_pose_seq.at(timestamp)
-            except UndefinedAtTime:
-                d = 0.0
-            else:
-                if name2lpr:
-                    first = name2lpr[sorted(name2lpr)[0]]
-                    assert isinstance(first, GetLanePoseResult)
-
-                    lp = first.lane_pose
-                    assert isinstance(lp, LanePose)
-
-                    d = lp.distance_from_center
-                else:
-                    # no lp
-                    d = 0.0
-
-            values.append(d)
-            timestamps.append(timestamp)
+        shared = context.get_shared()
+        timestamps = shared.times
+        values = shared.distance_from_center.tolist()
 
         sequence = SampledSequence[float](timestamps, values)
 
@@ -131,33 +105,9 @@ class DeviationFromCenterLine(Rule):
 class DeviationHeading(Rule):
 
     def evaluate(self, context: RuleEvaluationContext, result: RuleEvaluationResult):
-
-        interval = cast(SampledSequence, context.get_interval())
-        lane_pose_seq = context.get_lane_pose_seq()
-
-        timestamps = []
-        values = []
-
-        for i, timestamp in interval:
-            try:
-                name2lpr = lane_pose_seq.at(timestamp)
-            except UndefinedAtTime:
-                d = 0.0
-            else:
-                if name2lpr:
-                    first = name2lpr[sorted(name2lpr)[0]]
-                    assert isinstance(first, GetLanePoseResult)
-
-                    lp = first.lane_pose
-                    assert isinstance(lp, LanePose)
-
-                    d = np.abs(lp.relative_heading)
-                else:
-                    # no lp
-                    d = 0.0
-
-            values.append(d)
-            timestamps.append(timestamp)
+        shared = context.get_shared()
+        timestamps = shared.times
+        values = shared.abs_relative_heading.tolist()
 
         sequence = SampledSequence[float](timestamps, values)
         if len(sequence) <= 1:
@@ -179,26 +129,9 @@ class DeviationHeading(Rule):
 class InDrivableLane(Rule):
 
     def evaluate(self, context: RuleEvaluationContext, result: RuleEvaluationResult):
-        interval = cast(SampledSequence, context.get_interval())
-        lane_pose_seq = context.get_lane_pose_seq()
-
-        timestamps = []
-        values = []
-
-        for i, timestamp in interval:
-            try:
-                name2lpr = lane_pose_seq.at(timestamp)
-            except UndefinedAtTime:
-                d = 1.0
-            else:
-                if name2lpr:
-                    d = 0.0
-                else:
-                    # no lp
-                    d = 1.0
-
-            values.append(d)
-            timestamps.append(timestamp)
+        shared = context.get_shared()
+        timestamps = shared.times
+        values = np.where(shared.in_lane, 0.0, 1.0).tolist()
 
         sequence = SampledSequence[float](timestamps, values)
         if len(sequence) <= 1:
@@ -223,47 +156,15 @@ class InDrivableLane(Rule):
 class DrivenLength(Rule):
 
     def evaluate(self, context: RuleEvaluationContext, result: RuleEvaluationResult):
-        interval = context.get_interval()
-        lane_pose_seq = context.get_lane_pose_seq()
-        ego_pose_sequence = context.get_ego_pose_global()
+        shared = context.get_shared()
 
         driven_any_builder = SampledSequenceBuilder[float]()
         driven_lanedir_builder = SampledSequenceBuilder[float]()
 
-        for idt in iterate_with_dt(interval):
-            t0, t1 = idt.v0, idt.v1  # not v
-            try:
-                name2lpr = lane_pose_seq.at(t0)
-
-                p0 = ego_pose_sequence.at(t0).as_SE2()
-                p1 = ego_pose_sequence.at(t1).as_SE2()
-            except UndefinedAtTime:
-                dr_any = dr_lanedir = 0.0
-
-            else:
-                prel = relative_pose(p0, p1)
-                translation, _ = geo.translation_angle_from_SE2(prel)
-                dr_any = np.linalg.norm(translation)
-
-                if name2lpr:
-
-                    ds = []
-                    for k, lpr in name2lpr.items():
-                        assert isinstance(lpr, GetLanePoseResult)
-                        c0 = lpr.center_point
-                        ctas = geo.translation_angle_scale_from_E2(c0.asmatrix2d().m)
-                        c0_ = geo.SE2_from_translation_angle(ctas.translation, ctas.angle)
-                        prelc0 = relative_pose(c0_, p1)
-                        tas = geo.translation_angle_scale_from_E2(prelc0)
-
-                        # otherwise this lane should not be reported
-                        # assert tas.translation[0] >= 0, tas
-                        ds.append(tas.translation[0])
-
-                    dr_lanedir = max(ds)
-                else:
-                    # no lp
-                    dr_lanedir = 0.0
+        for i, t0 in enumerate(shared.times[:-1]):
+            dr_any = shared.driven_any[i]
+            progress = shared.lanedir_progress[i]
+            dr_lanedir = max(d for _, d in progress) if progress else 0.0
 
             driven_any_builder.add(t0, dr_any)
             driven_lanedir_builder.add(t0, dr_lanedir)
@@ -307,59 +208,27 @@ class DrivenLength(Rule):
 class DrivenLengthConsecutive(Rule):
 
     def evaluate(self, context: RuleEvaluationContext, result: RuleEvaluationResult):
-        interval = context.get_interval()
-        lane_pose_seq = context.get_lane_pose_seq()
-        ego_pose_sequence = context.get_ego_pose_global()
+        shared = context.get_shared()
 
         timestamps = []
-        driven_any = []
         driven_lanedir = []
 
         tile_fqn2lane_fqn = {}
-        for idt in iterate_with_dt(interval):
-            t0, t1 = idt.v0, idt.v1  # not v
-            try:
-                name2lpr = lane_pose_seq.at(t0)
-
-                p0 = ego_pose_sequence.at(t0).as_SE2()
-                p1 = ego_pose_sequence.at(t1).as_SE2()
-            except UndefinedAtTime:
-                dr_any = dr_lanedir = 0.0
-
-            else:
-                prel = relative_pose(p0, p1)
-                translation, _ = geo.translation_angle_from_SE2(prel)
-                dr_any = np.linalg.norm(translation)
-
-                if name2lpr:
-
-                    ds = []
-                    for k, lpr in name2lpr.items():
-                        if lpr.tile_fqn in tile_fqn2lane_fqn:
-                            if lpr.lane_segment_fqn != tile_fqn2lane_fqn[lpr.tile_fqn]:
-                                # msg = 'Backwards detected'
-                                # print(msg)
-                                continue
-
-                        tile_fqn2lane_fqn[lpr.tile_fqn] = lpr.lane_segment_fqn
-
-                        assert isinstance(lpr, GetLanePoseResult)
-                        c0 = lpr.center_point
-                        ctas = geo.translation_angle_scale_from_E2(c0.asmatrix2d().m)
-                        c0_ = geo.SE2_from_translation_angle(ctas.translation, ctas.angle)
-                        prelc0 = relative_pose(c0_, p1)
-                        tas = geo.translation_angle_scale_from_E2(prelc0)
-
-                        # otherwise this lane should not be reported
-                        # assert tas.translation[0] >= 0, tas
-                        ds.append(tas.translation[0])
-
-                    dr_lanedir = max(ds) if ds else 0.0
-                else:
-                    # no lp
-                    dr_lanedir = 0.0
-
-            driven_any.append(dr_any)
+        for i, t0 in enumerate(shared.times[:-1]):
+            name2lpr = shared.name2lpr[i]
+            ds = []
+            for k, d in shared.lanedir_progress[i]:
+                lpr = name2lpr[k]
+                if lpr.tile_fqn in tile_fqn2lane_fqn:
+                    if lpr.lane_segment_fqn != tile_fqn2lane_fqn[lpr.tile_fqn]:
+                        # msg = 'Backwards detected'
+                        # print(msg)
+                        continue
+
+                tile_fqn2lane_fqn[lpr.tile_fqn] = lpr.lane_segment_fqn
+                ds.append(d)
+
+            dr_lanedir = max(ds) if ds else 0.0
             driven_lanedir.append(dr_lanedir)
             timestamps.append(t0)
 
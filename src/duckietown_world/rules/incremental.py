@@ -0,0 +1,211 @@
+# coding=utf-8
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from duckietown_world.geo import PlacedObject, SE2Transform
+from duckietown_world.seqs.tsequence import Timestamp
+from duckietown_world.world_duckietown import GetLanePoseResult
+from .shared import get_driven_distance, get_first_lane_pose, get_lanedir_progress
+
+__all__ = [
+    'IncrementalStep',
+    'IncrementalRule',
+    'IncrementalSurvivalTime',
+    'IncrementalDeviationFromCenterLine',
+    'IncrementalDeviationHeading',
+    'IncrementalInDrivableLane',
+    'IncrementalDrivenLength',
+    'IncrementalDrivenLengthConsecutive',
+    'IncrementalRulesEvaluator',
+    'get_default_incremental_rules',
+]
+
+Metrics = Dict[Tuple[str, ...], float]
+
+
+@dataclass
+class IncrementalStep:
+    """ A new sample of the episode, with the quantities needed by the rules. """
+    t: Timestamp
+    # shape (3, 3)
+    pose: np.ndarray
+    name2lpr: Dict[Any, GetLanePoseResult]
+
+    # The following refer to the previous sample; they are None for the first one.
+    previous_t: Optional[Timestamp]
+    previous_name2lpr: Optional[Dict[Any, GetLanePoseResult]]
+    dt: Optional[float]
+    # distance from the previous pose
+    driven_any: Optional[float]
+    # progress of this pose along the center points of the previous lane poses;
+    # see get_lanedir_progress()
+    lanedir_progress: Optional[List[Tuple[Any, float]]]
+
+
+class IncrementalRule(metaclass=ABCMeta):
+    """
+        A rule that is updated with one sample at a time.
+
+        After the same samples, the metrics have the same totals
+        as the corresponding Rule evaluated on the whole episode.
+    """
+
+    @abstractmethod
+    def update(self, step: IncrementalStep) -> Metrics:
+        """ Processes a new sample, and returns the current totals of the metrics. """
+
+
+class IncrementalSurvivalTime(IncrementalRule):
+
+    def __init__(self):
+        self.total = 0.0
+
+    def update(self, step: IncrementalStep) -> Metrics:
+        if step.dt is not None:
+            self.total += 1.0 * step.dt
+        return {(): self.total}
+
+
+class IncrementalIntegral(IncrementalRule, metaclass=ABCMeta):
+    """ Integrates a quantity over time (as rules.integrate()). """
+
+    def __init__(self):
+        self.total = 0.0
+        self.previous_value = None
+
+    @abstractmethod
+    def get_value(self, name2lpr: Dict[Any, GetLanePoseResult]) -> float:
+        """ Returns the value for one sample. """
+
+    def update(self, step: IncrementalStep) -> Metrics:
+        if self.previous_value is not None:
+            self.total += self.previous_value * step.dt
+        self.previous_value = self.get_value(step.name2lpr)
+        return {(): self.total}
+
+
+class IncrementalDeviationFromCenterLine(IncrementalIntegral):
+
+    def get_value(self, name2lpr):
+        return get_first_lane_pose(name2lpr).distance_from_center if name2lpr else 0.0
+
+
+class IncrementalDeviationHeading(IncrementalIntegral):
+
+    def get_value(self, name2lpr):
+        return np.abs(get_first_lane_pose(name2lpr).relative_heading) if name2lpr else 0.0
+
+
+class IncrementalInDrivableLane(IncrementalIntegral):
+
+    def get_value(self, name2lpr):
+        return 0.0 if name2lpr else 1.0
+
+
+class IncrementalDrivenLength(IncrementalRule):
+
+    def __init__(self):
+        self.npairs = 0
+        self.driven_any = 0.0
+        self.driven_lanedir = 0.0
+
+    def update(self, step: IncrementalStep) -> Metrics:
+        if step.dt is not None:
+            self.npairs += 1
+            self.driven_any += step.driven_any
+            progress = step.lanedir_progress
+            self.driven_lanedir += max(d for _, d in progress) if progress else 0.0
+
+        # as DrivenLength, which reports 0 unless there are at least two intervals
+        if self.npairs <= 1:
+            return {('driven_any',): 0, ('driven_lanedir',): 0}
+        return {('driven_any',): self.driven_any, ('driven_lanedir',): self.driven_lanedir}
+
+
+class IncrementalDrivenLengthConsecutive(IncrementalRule):
+
+    def __init__(self):
+        self.npairs = 0
+        self.driven_lanedir = 0.0
+        self.tile_fqn2lane_fqn = {}
+
+    def update(self, step: IncrementalStep) -> Metrics:
+        if step.dt is not None:
+            self.npairs += 1
+            ds = []
+            for k, d in step.lanedir_progress:
+                lpr = step.previous_name2lpr[k]
+                if lpr.tile_fqn in self.tile_fqn2lane_fqn:
+                    if lpr.lane_segment_fqn != self.tile_fqn2lane_fqn[lpr.tile_fqn]:
+                        continue
+                self.tile_fqn2lane_fqn[lpr.tile_fqn] = lpr.lane_segment_fqn
+                ds.append(d)
+            self.driven_lanedir += max(ds) if ds else 0.0
+
+        if self.npairs <= 1:
+            return {('driven_lanedir_consec',): 0}
+        return {('driven_lanedir_consec',): self.driven_lanedir}
+
+
+def get_default_incremental_rules() -> Dict[str, IncrementalRule]:
+    """ The incremental versions of get_default_rules(), with the same names. """
+    rules = OrderedDict()
+    rules['deviation-heading'] = IncrementalDeviationHeading()
+    rules['in-drivable-lane'] = IncrementalInDrivableLane()
+    rules['deviation-center-line'] = IncrementalDeviationFromCenterLine()
+    rules['driving-distance'] = IncrementalDrivenLength()
+    rules['driving-distance-consecutive'] = IncrementalDrivenLengthConsecutive()
+    rules['survival_time'] = IncrementalSurvivalTime()
+    return rules
+
+
+class IncrementalRulesEvaluator(object):
+    """
+        Evaluates the rules on an episode while it is running.
+
+        Each call to update() computes the lane poses of the new pose once,
+        and then updates each rule in constant time.
+    """
+
+    def __init__(self, world: PlacedObject, rules: Optional[Dict[str, IncrementalRule]] = None):
+        from duckietown_world.world_duckietown.tile import GetClosestLane
+        self.get_closest_lane = GetClosestLane(world)
+        self.rules = rules if rules is not None else get_default_incremental_rules()
+        self.previous = None
+
+    def update(self, t: Timestamp, pose) -> Dict[str, Metrics]:
+        """
+            Adds the pose at time t (an SE2Transform or an SE2 matrix),
+            and returns the current totals of the metrics of each rule.
+        """
+        if isinstance(pose, SE2Transform):
+            pose = pose.as_SE2()
+        t = float(t)
+        name2lpr = self.get_closest_lane(pose)
+
+        previous = self.previous
+        if previous is None:
+            step = IncrementalStep(t=t, pose=pose, name2lpr=name2lpr,
+                                   previous_t=None, previous_name2lpr=None, dt=None,
+                                   driven_any=None, lanedir_progress=None)
+        else:
+            dt = t - previous.t
+            if dt <= 0:
+                msg = 'Invalid dt = %s: t = %s after %s' % (dt, t, previous.t)
+                raise ValueError(msg)
+            step = IncrementalStep(t=t, pose=pose, name2lpr=name2lpr,
+                                   previous_t=previous.t,
+                                   previous_name2lpr=previous.name2lpr,
+                                   dt=dt,
+                                   driven_any=get_driven_distance(previous.pose, pose),
+                                   lanedir_progress=get_lanedir_progress(previous.name2lpr, pose))
+        self.previous = step
+
+        res = OrderedDict()
+        for name, rule in self.rules.items():
+            res[name] = rule.update(step)
+        return res
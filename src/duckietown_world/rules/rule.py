@@ -1,3 +1,4 @@
+import time
 from abc import ABCMeta, abstractmethod
 from collections import OrderedDict
 from dataclasses import dataclass
@@ -10,13 +11,14 @@ from duckietown_world import LanePose
 from duckietown_world.geo import PlacedObject, SE2Transform
 from duckietown_world.seqs import SampledSequence
 from duckietown_world.seqs.tsequence import Timestamp
-from duckietown_world.svg_drawing.misc import TimeseriesPlot
 
 __all__ = [
     'RuleEvaluationContext',
     'RuleEvaluationResult',
     'Rule',
     'evaluate_rules',
+    'evaluate_rules_in_context',
+    'get_default_rules',
 ]
 
 
@@ -50,6 +52,17 @@ class RuleEvaluationContext:
         """ Returns the global pose of the vehicle. """
         return self.pose_seq
 
+    def get_shared(self) -> 'RuleSharedQuantities':
+        """ Returns the quantities shared among rules (computed on first use). """
+        shared = self.__dict__.get('_shared', None)
+        if shared is None:
+            from .shared import compute_shared_quantities
+            shared = compute_shared_quantities(interval=self.interval,
+                                               lane_pose_seq=self.lane_pose_seq,
+                                               pose_seq=self.pose_seq)
+            self.__dict__['_shared'] = shared
+        return shared
+
 
 class EvaluatedMetric(Serializable):
     total: float
@@ -109,13 +122,8 @@ class Rule(metaclass=ABCMeta):
         """
 
 
-def evaluate_rules(poses_sequence,
-                   interval: SampledSequence[Timestamp],
-                   world: PlacedObject,
-                   ego_name: str) -> Dict[
-    str, RuleEvaluationResult]:
-    from duckietown_world.world_duckietown import create_lane_highlight
-    lane_pose_seq = create_lane_highlight(poses_sequence, world)
+def get_default_rules() -> Dict[str, Rule]:
+    """ Returns the rules evaluated by evaluate_rules(), by name. """
     from duckietown_world.rules import DeviationFromCenterLine
     from duckietown_world.rules import InDrivableLane
     from duckietown_world.rules import DeviationHeading
@@ -130,14 +138,55 @@ def evaluate_rules(poses_sequence,
     rules['driving-distance'] = DrivenLength()
     rules['driving-distance-consecutive'] = DrivenLengthConsecutive()
     rules['survival_time'] = SurvivalTime()
+    return rules
+
+
+def evaluate_rules(poses_sequence,
+                   interval: SampledSequence[Timestamp],
+                   world: PlacedObject,
+                   ego_name: str,
+                   timing: Optional[Dict[str, float]] = None) -> Dict[
+    str, RuleEvaluationResult]:
+    """
+        Evaluates all the rules.
+
+        If timing is given, it is filled with the time (in seconds) spent computing
+        the lane poses ("lane_poses"), the quantities shared among rules ("shared"),
+        and each rule (by name).
+    """
+    if timing is None:
+        timing = {}
+    from duckietown_world.world_duckietown import create_lane_highlight
+    t0 = time.perf_counter()
+    lane_pose_seq = create_lane_highlight(poses_sequence, world)
+    timing['lane_poses'] = time.perf_counter() - t0
 
     context = RuleEvaluationContext(interval=interval, world=world, ego_name=ego_name,
                                     lane_pose_seq=lane_pose_seq, pose_seq=poses_sequence)
+    return evaluate_rules_in_context(context, timing=timing)
+
+
+def evaluate_rules_in_context(context: RuleEvaluationContext,
+                              rules: Optional[Dict[str, Rule]] = None,
+                              timing: Optional[Dict[str, float]] = None) -> Dict[str, RuleEvaluationResult]:
+    """
+        Evaluates the rules (by default, get_default_rules()) in a context
+        whose lane poses were already computed.
+    """
+    if rules is None:
+        rules = get_default_rules()
+    if timing is None:
+        timing = {}
+    t0 = time.perf_counter()
+    context.get_shared()
+    timing['shared'] = time.perf_counter() - t0
 
     evaluated = OrderedDict()
     for name, rule in rules.items():
         result = RuleEvaluationResult(rule)
+        t0 = time.perf_counter()
         rule.evaluate(context, result)
+        timing[name] = time.perf_counter() - t0
         evaluated[name] = result
     return evaluated
 
@@ -0,0 +1,135 @@
+# coding=utf-8
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import geometry as geo
+from duckietown_world.seqs import SampledSequence, UndefinedAtTime, iterate_with_dt
+from duckietown_world.world_duckietown import GetLanePoseResult, LanePose
+from duckietown_world.world_duckietown.tile import relative_pose
+
+__all__ = [
+    'RuleSharedQuantities',
+    'compute_shared_quantities',
+    'get_first_lane_pose',
+    'get_driven_distance',
+    'get_lanedir_progress',
+]
+
+
+@dataclass
+class RuleSharedQuantities:
+    """
+        The quantities that several rules need, computed once per episode.
+
+        The arrays indexed by step have one entry per sample of the interval;
+        the ones indexed by pair have one entry per consecutive pair of samples.
+    """
+    # the values of the interval, that is, the timestamps of the episode
+    times: List[Any]
+
+    # per step: the lane pose results, or None if not defined at that time
+    name2lpr: List[Optional[Dict[Any, GetLanePoseResult]]]
+    # per step: whether at least one lane pose was found
+    in_lane: np.ndarray
+    # per step: distance from center and absolute relative heading
+    # for the first lane pose (0 if there is none)
+    distance_from_center: np.ndarray
+    abs_relative_heading: np.ndarray
+
+    # per pair: whether the lane poses and the ego poses are defined
+    pair_defined: np.ndarray
+    # per pair: distance driven between the two ego poses
+    driven_any: np.ndarray
+    # per pair: for each lane pose at the first step, in order,
+    # the key and the progress of the second ego pose along its center point
+    lanedir_progress: List[List[Tuple[Any, float]]]
+
+
+def compute_shared_quantities(interval: SampledSequence,
+                              lane_pose_seq: SampledSequence,
+                              pose_seq: SampledSequence) -> RuleSharedQuantities:
+    times = []
+    name2lprs = []
+    n = len(interval)
+    in_lane = np.zeros(n, dtype=bool)
+    distance_from_center = np.zeros(n)
+    abs_relative_heading = np.zeros(n)
+    for i, (_, timestamp) in enumerate(interval):
+        times.append(timestamp)
+        try:
+            name2lpr = lane_pose_seq.at(timestamp)
+        except UndefinedAtTime:
+            name2lprs.append(None)
+            continue
+        name2lprs.append(name2lpr)
+        if name2lpr:
+            in_lane[i] = True
+            lp = get_first_lane_pose(name2lpr)
+            distance_from_center[i] = lp.distance_from_center
+            abs_relative_heading[i] = np.abs(lp.relative_heading)
+
+    m = max(n - 1, 0)
+    pair_defined = np.zeros(m, dtype=bool)
+    driven_any = np.zeros(m)
+    lanedir_progress = []
+    pose_cache = {}
+
+    def pose_at(t):
+        if t not in pose_cache:
+            pose_cache[t] = pose_seq.at(t).as_SE2()
+        return pose_cache[t]
+
+    for i, idt in enumerate(iterate_with_dt(interval)):
+        t0, t1 = idt.v0, idt.v1
+        name2lpr = name2lprs[i]
+        progress = []
+        lanedir_progress.append(progress)
+        if name2lpr is None:
+            continue
+        try:
+            p0 = pose_at(t0)
+            p1 = pose_at(t1)
+        except UndefinedAtTime:
+            continue
+
+        pair_defined[i] = True
+        driven_any[i] = get_driven_distance(p0, p1)
+        progress.extend(get_lanedir_progress(name2lpr, p1))
+
+    return RuleSharedQuantities(times=times, name2lpr=name2lprs,
+                                in_lane=in_lane,
+                                distance_from_center=distance_from_center,
+                                abs_relative_heading=abs_relative_heading,
+                                pair_defined=pair_defined,
+                                driven_any=driven_any,
+                                lanedir_progress=lanedir_progress)
+
+
+def get_first_lane_pose(name2lpr: Dict[Any, GetLanePoseResult]) -> LanePose:
+    """ Returns the lane pose with the smallest key (the rules only look at this one). """
+    return name2lpr[sorted(name2lpr)[0]].lane_pose
+
+
+def get_driven_distance(p0: np.ndarray, p1: np.ndarray) -> float:
+    """ Returns the distance between two poses. """
+    prel = relative_pose(p0, p1)
+    translation, _ = geo.translation_angle_from_SE2(prel)
+    return np.linalg.norm(translation)
+
+
+def get_lanedir_progress(name2lpr: Dict[Any, GetLanePoseResult], p1: np.ndarray) -> List[Tuple[Any, float]]:
+    """
+        For each lane pose, in order, returns the key and the
+        longitudinal coordinate of the pose p1 with respect to its center point.
+    """
+    res = []
+    for k, lpr in name2lpr.items():
+        c0 = lpr.center_point
+        ctas = geo.translation_angle_scale_from_E2(c0.asmatrix2d().m)
+        c0_ = geo.SE2_from_translation_angle(ctas.translation, ctas.angle)
+        prelc0 = relative_pose(c0_, p1)
+        tas = geo.translation_angle_scale_from_E2(prelc0)
+        res.append((k, tas.translation[0]))
+    return res
@@ -1,3 +1,4 @@
 # coding=utf-8
 from .constant import *
 from .tsequence import *
+from .array_sequence import *
@@ -0,0 +1,166 @@
+# coding=utf-8
+import numbers
+import typing
+from dataclasses import dataclass
+from typing import Callable, List
+
+import numpy as np
+
+from .tsequence import SampledSequence, IterateDT, Timestamp, UndefinedAtTime
+
+__all__ = [
+    'ArraySampledSequence',
+]
+
+
+@dataclass(eq=False)
+class ArraySampledSequence(SampledSequence[float]):
+    """
+        A sampled sequence of numbers or vectors, stored as float64 arrays.
+
+        timestamps has shape (n,); values has shape (n,) or (n, d).
+
+        It can be used wherever a SampledSequence is expected.
+    """
+    timestamps: np.ndarray
+    values: np.ndarray
+
+    def __post_init__(self):
+        timestamps = np.array(self.timestamps, dtype='float64').reshape(-1)
+        values = np.array(self.values, dtype='float64')
+
+        if len(timestamps) != len(values):
+            msg = 'Length mismatch'
+            raise ValueError(msg)
+
+        dts = np.diff(timestamps)
+        if np.any(~(dts > 0)):
+            i = int(np.argmin(dts > 0))
+            msg = 'Invalid dt = %s at i = %s; ts= %s' % (dts[i], i, timestamps)
+            raise ValueError(msg)
+
+        self.timestamps = timestamps
+        self.values = values
+
+    @classmethod
+    def from_sequence(cls, sequence: SampledSequence) -> 'ArraySampledSequence':
+        """ Converts a SampledSequence with numeric values. """
+        if isinstance(sequence, ArraySampledSequence):
+            return sequence
+        values = sequence.values if len(sequence) else np.zeros(0)
+        return ArraySampledSequence(sequence.timestamps, values)
+
+    def as_sampled_sequence(self) -> SampledSequence[float]:
+        """ Returns a plain SampledSequence with Python floats or arrays as values. """
+        values = self.values.tolist() if self.values.ndim == 1 else list(self.values)
+        return SampledSequence[float](self.timestamps.tolist(), values)
+
+    def __eq__(self, other):
+        if not isinstance(other, SampledSequence):
+            return NotImplemented
+        return (np.array_equal(self.timestamps, np.asarray(other.timestamps)) and
+                np.array_equal(self.values, np.asarray(other.values)))
+
+    def at_or_previous(self, t: Timestamp):
+        try:
+            return self.at(t)
+        except UndefinedAtTime:
+            pass
+        i = int(np.searchsorted(self.timestamps, t, side='left')) - 1
+        return self.values[max(i, 0)]
+
+    def at_or_next(self, t: Timestamp):
+        try:
+            return self.at(t)
+        except UndefinedAtTime:
+            pass
+        i = int(np.searchsorted(self.timestamps, t, side='right'))
+        return self.values[min(i, len(self.values) - 1)]
+
+    def at_many(self, ts: typing.Sequence[Timestamp]) -> np.ndarray:
+        """ Same as SampledSequence.at_many(), but returns an array. """
+        ts = np.asarray(ts, dtype='float64').reshape(-1)
+        i = np.searchsorted(self.timestamps, ts)
+        found = i < len(self.timestamps)
+        found[found] = self.timestamps[i[found]] == ts[found]
+        if not np.all(found):
+            missing = ts[~found].tolist()
+            msg = 'Could not find timestamps %s in %s' % (missing, self.timestamps)
+            raise UndefinedAtTime(msg)
+        return self.values[i]
+
+    def get_sampling_points(self) -> List[Timestamp]:
+        return self.timestamps.tolist()
+
+    def get_start(self) -> Timestamp:
+        if not len(self.timestamps):
+            msg = 'Empty sequence'
+            raise ValueError(msg)
+        return float(self.timestamps[0])
+
+    def get_end(self) -> Timestamp:
+        if not len(self.timestamps):
+            msg = 'Empty sequence'
+            raise ValueError(msg)
+        return float(self.timestamps[-1])
+
+    def transform_values(self, f: Callable, vectorized: bool = False) -> SampledSequence:
+        """
+            If vectorized is True, f is called once on the array of values
+            and must return an array with the same length.
+
+            Otherwise, f is called on each value as in SampledSequence.transform_values();
+            the result is an ArraySampledSequence if all the results are real numbers
+            (or arrays of them, all with the same shape).
+        """
+        if vectorized:
+            return ArraySampledSequence(self.timestamps, f(self.values))
+
+        res = SampledSequence.transform_values(self, f)
+        if not all(_is_real(_) for _ in res.values):
+            return res
+        try:
+            return ArraySampledSequence.from_sequence(res)
+        except ValueError:
+            return res
+
+    def upsample(self, n: int) -> 'ArraySampledSequence':
+        ts = self.timestamps
+        k = np.arange(n) * 1.0 / n
+        inner = ts[:-1, np.newaxis] + k[np.newaxis, :] * np.diff(ts)[:, np.newaxis]
+        timestamps = np.concatenate((inner.reshape(-1), ts[-1:]))
+        values = np.concatenate((np.repeat(self.values[:-1], n, axis=0), self.values[-1:]))
+        return ArraySampledSequence(timestamps, values)
+
+    def get_dts(self) -> np.ndarray:
+        """ Returns the intervals between timestamps, shape (n - 1,). """
+        return np.diff(self.timestamps)
+
+    def iterate_with_dt(self) -> typing.Iterator[IterateDT]:
+        """ Same as iterate_with_dt(). """
+        ts = self.timestamps.tolist()
+        dts = self.get_dts().tolist()
+        values = self.values.tolist() if self.values.ndim == 1 else list(self.values)
+        for i in range(len(ts) - 1):
+            yield IterateDT[float](ts[i], ts[i + 1], dts[i], values[i], values[i + 1])
+
+    def integrate(self) -> 'ArraySampledSequence':
+        """ Same as rules.integrate(): the running sum of value times dt. """
+        if not len(self):
+            msg = 'Cannot integrate empty sequence.'
+            raise ValueError(msg)
+        dts = self.get_dts()
+        dts = dts.reshape((-1,) + (1,) * (self.values.ndim - 1))
+        values = np.cumsum(self.values[:-1] * dts, axis=0)
+        return ArraySampledSequence(self.timestamps[:-1], values)
+
+    def accumulate(self) -> 'ArraySampledSequence':
+        """ Same as rules.accumulate(): the running sum of the values. """
+        return ArraySampledSequence(self.timestamps, np.cumsum(self.values, axis=0))
+
+
+def _is_real(x) -> bool:
+    """ Returns True if x is a real number or an array of real numbers. """
+    if isinstance(x, np.ndarray):
+        return x.dtype.kind in 'biuf'
+    return isinstance(x, numbers.Real)
@@ -22,6 +22,13 @@ class Constant(GenericSequence[X]):
     def at_or_previous(self, t: Timestamp) -> X:
         return self.always
 
+    # noinspection PyUnusedLocal
+    def at_or_next(self, t: Timestamp) -> X:
+        return self.always
+
+    def at_many(self, ts: Sequence[Timestamp]) -> List[X]:
+        return [self.always] * len(ts)
+
     def get_sampling_points(self) -> str:
         return GenericSequence.CONTINUOUS
 
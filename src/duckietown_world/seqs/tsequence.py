@@ -1,8 +1,11 @@
 # coding=utf-8
+import bisect
 import typing
 from abc import abstractmethod
 from dataclasses import dataclass
-from typing import TypeVar, Generic, Optional, Union, ClassVar, Any, List, Type, Callable
+from typing import TypeVar, Generic, Optional, Union, ClassVar, Any, List, Type, Callable, Dict
+
+import numpy as np
 
 __all__ = [
     'Sequence',
@@ -92,30 +95,76 @@ class SampledSequence(Base):
         self.timestamps = timestamps
         self.values = values
 
+    def _get_cached(self, key: str, f: Callable[[List[Timestamp]], Any]) -> Any:
+        # recomputed if the timestamps were replaced or appended to
+        timestamps = self.timestamps
+        cached = self.__dict__.get(key, None)
+        if cached is None or cached[0] is not timestamps or cached[1] != len(timestamps):
+            cached = self.__dict__[key] = (timestamps, len(timestamps), f(timestamps))
+        return cached[2]
+
+    def _get_index(self) -> Dict[Timestamp, int]:
+        """ Returns a dict from timestamp to position. """
+        return self._get_cached('_index', lambda ts: {t: i for i, t in enumerate(ts)})
+
+    def _get_timestamps_array(self) -> np.ndarray:
+        """ Returns the timestamps as a float64 array. """
+        return self._get_cached('_timestamps_array', lambda ts: np.array(ts, dtype='float64'))
+
     def at(self, t: Timestamp) -> X:
         try:
-            i = self.timestamps.index(t)
-        except ValueError:
+            i = self._get_index()[t]
+        except (KeyError, TypeError):
             msg = 'Could not find timestamp %s in %s' % (t, self.timestamps)
             raise UndefinedAtTime(msg)
         else:
             return self.values[i]
 
     def at_or_previous(self, t: Timestamp) -> X:
+        """
+            Returns the value at t, or at the last timestamp before t.
+
+            If t is before the start, returns the first value.
+        """
+        try:
+            return self.at(t)
+        except UndefinedAtTime:
+            pass
+
+        i = bisect.bisect_left(self.timestamps, t) - 1
+        return self.values[max(i, 0)]
+
+    def at_or_next(self, t: Timestamp) -> X:
+        """
+            Returns the value at t, or at the first timestamp after t.
+
+            If t is after the end, returns the last value.
+        """
         try:
             return self.at(t)
         except UndefinedAtTime:
             pass
 
-        # last_t = self.timestamps[0]
-        last_i = 0
-        for i in range(len(self.timestamps)):
-            if self.timestamps[i] < t:
-                # last_t = self.timestamps[i]
-                last_i = i
-            else:
-                break
-        return self.values[last_i]
+        i = bisect.bisect_right(self.timestamps, t)
+        return self.values[min(i, len(self.values) - 1)]
+
+    def at_many(self, ts: typing.Sequence[Timestamp]) -> List[X]:
+        """
+            Returns the values at all the timestamps ts.
+
+            Raises UndefinedAtTime if any of them is not a sampling point.
+        """
+        ts = np.asarray(ts, dtype='float64').reshape(-1)
+        a = self._get_timestamps_array()
+        i = np.searchsorted(a, ts)
+        found = i < len(a)
+        found[found] = a[i[found]] == ts[found]
+        if not np.all(found):
+            missing = ts[~found].tolist()
+            msg = 'Could not find timestamps %s in %s' % (missing, self.timestamps)
+            raise UndefinedAtTime(msg)
+        values = self.values
+        return [values[_] for _ in i.tolist()]
 
     def get_sampling_points(self) -> List[Timestamp]:
         return list(self.timestamps)
@@ -184,6 +233,11 @@ class IterateDT(Generic[X]):
 
 def iterate_with_dt(sequence: SampledSequence) -> typing.Iterator[IterateDT[X]]:
     """ yields t0, t1, dt, v0, v1 """
+    from .array_sequence import ArraySampledSequence
+    if isinstance(sequence, ArraySampledSequence):
+        yield from sequence.iterate_with_dt()
+        return
+
     timestamps = sequence.timestamps
     values = sequence.values
     for i in range(len(timestamps) - 1):
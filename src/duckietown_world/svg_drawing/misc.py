@@ -19,7 +19,7 @@ from duckietown_world import logger
 from duckietown_world.geo import RectangularArea, get_extent_points, get_static_and_dynamic
 from duckietown_world.seqs import SampledSequence, UndefinedAtTime
 from duckietown_world.seqs.tsequence import Timestamp
-from duckietown_world.utils import memoized_reset
+from duckietown_world.utils import memoized_function
 
 __all__ = [
     'draw_recursive',
@@ -131,7 +131,7 @@ def recurive_draw_list(draw_list, prefix):
 
 def draw_static(root, output_dir, pixel_size=(480, 480), area=None, images=None,
                 timeseries=None, height_of_stored_images: Optional[int] = None) -> Sequence[str]:
-    from duckietown_world.world_duckietown import get_sampling_points, ChooseTime
+    from duckietown_world.world_duckietown import get_sampling_points, get_time_snapshots
     images = images or {}
     timeseries = timeseries or {}
     if not os.path.exists(output_dir):
@@ -141,6 +141,7 @@ def draw_static(root, output_dir, pixel_size=(480, 480), area=None, images=None,
     fn_html = os.path.join(output_dir, 'drawing.html')
 
     timestamps = get_sampling_points(root)
+    snapshots = get_time_snapshots(root)
     if len(timestamps) == 0:
         keyframes = SampledSequence[Timestamp]([0], [0])
     else:
@@ -152,7 +153,7 @@ def draw_static(root, output_dir, pixel_size=(480, 480), area=None, images=None,
         all_keyframes = keyframes.values
         keyframes_for_extent = [all_keyframes[0], all_keyframes[-1]]
         for t in keyframes_for_extent:
-            root_t = root.filter_all(ChooseTime(t))
+            root_t = snapshots.at(t)
             # print(i, root_t)
             rarea = get_extent_points(root_t)
             areas.append(rarea)
@@ -167,7 +168,7 @@ def draw_static(root, output_dir, pixel_size=(480, 480), area=None, images=None,
     static, dynamic = get_static_and_dynamic(root)
 
     t0 = keyframes.values[0]
-    root_t0 = root.filter_all(ChooseTime(t0))
+    root_t0 = snapshots.at(t0)
     g_static = drawing.g()
     g_static.attribs['class'] = 'static'
 
@@ -185,7 +186,7 @@ def draw_static(root, output_dir, pixel_size=(480, 480), area=None, images=None,
         g_t = drawing.g()
         g_t.attribs['class'] = 'keyframe keyframe%d' % i
 
-        root_t = root.filter_all(ChooseTime(t))
+        root_t = snapshots.at(t)
 
         draw_recursive(drawing, root_t, g_t, draw_list=dynamic)
         base.add(g_t)
@@ -714,7 +715,7 @@ def draw_axes(drawing, g, L=0.1, stroke_width=0.01, klass='axes'):
     g.add(g2)
 
 
-@memoized_reset
+@memoized_function(maxsize=64)
 def get_jpeg_bytes(fn):
     from PIL import Image
     pl = logging.getLogger('PIL')
@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 import functools
-
+import weakref
+from collections import OrderedDict, namedtuple
 
 __all__ = [
     'memoized_reset',
+    'memoized_function',
+    'memoized_method',
+    'LRUCache',
+    'CacheInfo',
+    'reset_memoized',
 ]
 
 
@@ -26,6 +32,9 @@ class memoized_reset(object):
     """Decorator that caches a function's return value each time it is called.
     If called later with the same arguments, the cached value is returned, and
     not re-evaluated.
+
+    The cache is shared by all the instances and never evicts anything;
+    use memoized_function or memoized_method instead.
     """
 
     def __init__(self, func):
@@ -59,3 +68,214 @@ class memoized_reset(object):
 
     def _reset(self):
         self.cache = {}
+
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+
+class LRUCache(object):
+    """
+        A dict with at most maxsize entries (unbounded if maxsize is None);
+        when it is full, the least recently used entry is evicted.
+    """
+    __slots__ = ['maxsize', 'data', 'hits', 'misses']
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, f):
+        """ Returns the value for key, computing it with f() if needed. """
+        try:
+            value = self.data[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable arguments: do not cache
+            self.misses += 1
+            return f()
+        else:
+            self.hits += 1
+            self.data.move_to_end(key)
+            return value
+
+        self.misses += 1
+        value = f()
+        self.data[key] = value
+        if self.maxsize is not None and len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.data.clear()
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(hits=self.hits, misses=self.misses, maxsize=self.maxsize, currsize=len(self.data))
+
+
+def _make_key(args, kwargs):
+    if kwargs:
+        return args + tuple(sorted(kwargs.items()))
+    return args
+
+
+def _check_decorated(func, name: str):
+    if func is not None and not callable(func):
+        msg = 'Expected a function, got %r; use @%s(maxsize=...).' % (func, name)
+        raise TypeError(msg)
+
+
+class memoized_function(object):
+    """
+        Decorator that caches the results of a function in an LRUCache.
+
+        Use as @memoized_function or @memoized_function(maxsize=...).
+        The decorated function has cache_info() and cache_clear().
+    """
+
+    def __init__(self, func=None, *, maxsize=128):
+        _check_decorated(func, 'memoized_function')
+        self.maxsize = maxsize
+        self.func = None
+        self.cache = LRUCache(maxsize)
+        if func is not None:
+            self._wrap(func)
+
+    def _wrap(self, func):
+        self.func = func
+        functools.update_wrapper(self, func)
+
+    def __call__(self, *args, **kwargs):
+        if self.func is None:
+            # used as @memoized_function(maxsize=...)
+            func, = args
+            self._wrap(func)
+            return self
+        return self.cache.get(_make_key(args, kwargs), lambda: self.func(*args, **kwargs))
+
+    def cache_info(self) -> CacheInfo:
+        return self.cache.cache_info()
+
+    def cache_clear(self):
+        self.cache.clear()
+
+
+# name of the attribute where memoized_method stores the caches of an object
+MEMOIZED_ATTRIBUTE = '_memoized'
+
+
+def reset_memoized(obj):
+    """ Clears all the caches of memoized_method for the object. """
+    d = getattr(obj, '__dict__', None)
+    if d is not None:
+        d.pop(MEMOIZED_ATTRIBUTE, None)
+
+
+class memoized_method(object):
+    """
+        Decorator that caches the results of a method, separately for each object.
+
+        The cache of each object is an LRUCache of at most maxsize entries,
+        stored in the object itself, so that it is released with it.
+        (Objects without __dict__ use a weak dictionary, if they are hashable.)
+
+        Use as @memoized_method or @memoized_method(maxsize=...).
+        The bound method has cache_info() and cache_clear(); the hits and misses
+        summed over all the objects are given by Class.method.cache_info().
+    """
+
+    def __init__(self, func=None, *, maxsize=128):
+        _check_decorated(func, 'memoized_method')
+        self.maxsize = maxsize
+        self.func = None
+        self.hits = 0
+        self.misses = 0
+        self.weak_caches = weakref.WeakKeyDictionary()
+        if func is not None:
+            self._wrap(func)
+
+    def _wrap(self, func):
+        self.func = func
+        self.key = func.__qualname__
+        functools.update_wrapper(self, func)
+
+    def __call__(self, func):
+        # used as @memoized_method(maxsize=...)
+        self._wrap(func)
+        return self
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return _BoundMemoizedMethod(self, obj)
+
+    def get_cache(self, obj, create: bool = True):
+        d = getattr(obj, '__dict__', None)
+        if d is not None:
+            caches = d.get(MEMOIZED_ATTRIBUTE, None)
+            if caches is None:
+                if not create:
+                    return None
+                caches = d[MEMOIZED_ATTRIBUTE] = {}
+        else:
+            try:
+                caches = self.weak_caches.get(obj, None)
+                if caches is None:
+                    if not create:
+                        return None
+                    caches = self.weak_caches[obj] = {}
+            except TypeError:
+                return None
+        cache = caches.get(self.key, None)
+        if cache is None and create:
+            cache = caches[self.key] = LRUCache(self.maxsize)
+        return cache
+
+    def call(self, obj, args, kwargs):
+        cache = self.get_cache(obj)
+        if cache is None:
+            self.misses += 1
+            return self.func(obj, *args, **kwargs)
+        hits = cache.hits
+        value = cache.get(_make_key(args, kwargs), lambda: self.func(obj, *args, **kwargs))
+        if cache.hits > hits:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return value
+
+    def cache_info(self, obj=None) -> CacheInfo:
+        """ The statistics of the cache of one object, or the total if obj is None. """
+        if obj is None:
+            return CacheInfo(hits=self.hits, misses=self.misses, maxsize=self.maxsize, currsize=None)
+        cache = self.get_cache(obj, create=False)
+        if cache is None:
+            return CacheInfo(hits=0, misses=0, maxsize=self.maxsize, currsize=0)
+        return cache.cache_info()
+
+    def cache_clear(self, obj):
+        cache = self.get_cache(obj, create=False)
+        if cache is not None:
+            cache.clear()
+
+
+class _BoundMemoizedMethod(object):
+    __slots__ = ['method', 'obj']
+
+    def __init__(self, method: memoized_method, obj):
+        self.method = method
+        self.obj = obj
+
+    def __call__(self, *args, **kwargs):
+        return self.method.call(self.obj, args, kwargs)
+
+    def cache_info(self) -> CacheInfo:
+        return self.method.cache_info(self.obj)
+
+    def cache_clear(self):
+        self.method.cache_clear(self.obj)
+
+    def __repr__(self):
+        return '<memoized method %s of %r>' % (self.method.key, self.obj)
@@ -14,4 +14,11 @@ from .duckietown_map import *
 from .duckiebot import  *
 from .transformations import  *
 from .segmentify import *
+from .lane_geometry import *
+from .lane_index import *
+from .tile_index import *
+from .lane_poses_batch import *
 from .pwm_dynamics import *
+from .batch_dynamics import *
+from .pwm_sysid import *
+from .road_network import *
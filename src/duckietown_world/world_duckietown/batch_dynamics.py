@@ -0,0 +1,275 @@
+# coding=utf-8
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from duckietown_world.geo import se2_fast
+from .differential_drive_dynamics import DifferentialDriveDynamics, DifferentialDriveDynamicsParameters, \
+    WheelVelocityCommands
+from .generic_kinematics import GenericKinematicsSE2
+from .pwm_dynamics import DynamicModel, DynamicModelEvaluator, DynamicModelParameters, PWMCommands
+
+__all__ = [
+    'BatchGenericKinematicsSE2',
+    'BatchDifferentialDriveDynamics',
+    'BatchDynamicModel',
+    'BatchRollout',
+    'rollout_batch',
+]
+
+
+def _twist_exp(vx: np.ndarray, vy: np.ndarray, w: np.ndarray) -> np.ndarray:
+    """ As se2_fast.se2_exp(), for the twists given by components; returns shape (M, 3, 3). """
+    a, b = se2_fast._V_coefficients(w)
+    xytheta = np.stack((a * vx - b * vy, b * vx + a * vy, w), axis=-1)
+    return se2_fast.SE2_from_xytheta(xytheta)
+
+
+def _parameter_arrays(parameters, names: Sequence[str], n: int) -> Dict[str, np.ndarray]:
+    """
+        Returns the given attributes of the parameters as arrays of shape (n,).
+
+        The parameters are either one object, used for all the robots, or a sequence of n objects.
+    """
+    if isinstance(parameters, (list, tuple)):
+        if len(parameters) != n:
+            msg = 'Expected %d parameters, got %d.' % (n, len(parameters))
+            raise ValueError(msg)
+        return {k: np.array([getattr(_, k) for _ in parameters], dtype='float64') for k in names}
+    return {k: np.full(n, getattr(parameters, k), dtype='float64') for k in names}
+
+
+def _pairs_from_commands(commands, klass: type, fields: Tuple[str, str], n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+        Returns the two fields of the commands, as arrays of shape (n,).
+
+        The commands are either one instance of klass, used for all the robots,
+        a sequence of n instances, or an array of shape (n, 2) or (2,).
+    """
+    f0, f1 = fields
+    if isinstance(commands, klass):
+        values = np.array([getattr(commands, f0), getattr(commands, f1)], dtype='float64')
+    elif isinstance(commands, (list, tuple)) and commands and isinstance(commands[0], klass):
+        values = np.array([[getattr(_, f0), getattr(_, f1)] for _ in commands], dtype='float64')
+    else:
+        values = np.asarray(commands, dtype='float64')
+    values = np.broadcast_to(values, (n, 2))
+    return values[:, 0], values[:, 1]
+
+
+class BatchGenericKinematicsSE2(object):
+    """
+        The state of M robots with the dynamics of GenericKinematicsSE2.
+
+        The poses are kept as an array of shape (M, 3, 3) and the velocities
+        as an array of shape (M, 3), with columns vx, vy, omega.
+        The computation is the same as the one of the scalar class, operation by operation,
+        so the results are equal to the ones obtained integrating each robot separately.
+
+        Commands = velocities in se(2): an array of shape (M, 3, 3) or (3, 3),
+        or the components vx, vy, omega as an array of shape (M, 3) or (3,).
+        With M = 3 robots, an array of shape (3, 3) is read as components;
+        to give the same velocity in se(2) to all of them, use shape (1, 3, 3).
+    """
+
+    def __init__(self, q: np.ndarray, v: np.ndarray, t0: float):
+        q = np.asarray(q, dtype='float64')
+        if q.ndim != 3 or q.shape[1:] != (3, 3):
+            msg = 'Expected poses of shape (M, 3, 3), got %s.' % (q.shape,)
+            raise ValueError(msg)
+        self.q = q
+        self.v = np.array(np.broadcast_to(v, (q.shape[0], 3)), dtype='float64')
+        self.t0 = t0
+
+    @classmethod
+    def from_states(cls, states: Sequence[GenericKinematicsSE2]) -> 'BatchGenericKinematicsSE2':
+        """ Collects the states of M robots (which must have the same time). """
+        q, v, t0 = _collect_states(states)
+        return BatchGenericKinematicsSE2(q, v, t0)
+
+    def __len__(self) -> int:
+        return self.q.shape[0]
+
+    def _twist_from_commands(self, dt: float, commands) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Returns the new velocities vx, vy, omega, each of shape (M,). """
+        commands = np.asarray(commands, dtype='float64')
+        M = len(self)
+        is_se2 = commands.ndim == 3 or (commands.ndim == 2 and commands.shape == (3, 3) and M != 3)
+        if is_se2:
+            commands = np.broadcast_to(commands, (M, 3, 3))
+            return commands[:, 0, 2], commands[:, 1, 2], commands[:, 1, 0]
+        commands = np.broadcast_to(commands, (M, 3))
+        return commands[:, 0], commands[:, 1], commands[:, 2]
+
+    def _next(self, q: np.ndarray, v: np.ndarray, t1: float) -> 'BatchGenericKinematicsSE2':
+        return BatchGenericKinematicsSE2(q, v, t1)
+
+    def integrate(self, dt: float, commands) -> 'BatchGenericKinematicsSE2':
+        """ Returns the result of applying the commands for dt to all the robots. """
+        dt = float(dt)
+        vx, vy, w = self._twist_from_commands(dt, commands)
+        diff = _twist_exp(dt * vx, dt * vy, dt * w)
+        # one product for each robot, computed as for a single robot
+        q1 = np.matmul(self.q, diff)
+        v1 = np.stack((vx, vy, w), axis=-1)
+        return self._next(q1, v1, self.t0 + dt)
+
+    def TSE2_from_state(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns the poses, shape (M, 3, 3), and the velocities in se(2), shape (M, 3, 3). """
+        return self.q, _se2_from_components(self.v)
+
+    def get_state(self, i: int) -> GenericKinematicsSE2:
+        """ Returns the state of robot i, as an instance of the scalar class. """
+        return GenericKinematicsSE2((self.q[i].copy(), _se2_from_components(self.v[i])), self.t0)
+
+
+class BatchDifferentialDriveDynamics(BatchGenericKinematicsSE2):
+    """
+        The state of M robots with the dynamics of DifferentialDriveDynamics,
+        each with its own parameters.
+
+        Commands: a WheelVelocityCommands for all the robots, a sequence of M of them,
+        or an array of shape (M, 2) with the left and right angular velocities.
+    """
+    fields = ('radius_left', 'radius_right', 'wheel_distance')
+
+    def __init__(self, parameters: Union[DifferentialDriveDynamicsParameters,
+                                         Sequence[DifferentialDriveDynamicsParameters]],
+                 q: np.ndarray, v: np.ndarray, t0: float):
+        BatchGenericKinematicsSE2.__init__(self, q, v, t0)
+        self.parameters = parameters
+        self.p = _parameter_arrays(parameters, self.fields, len(self))
+
+    @classmethod
+    def from_states(cls, states: Sequence[DifferentialDriveDynamics]) -> 'BatchDifferentialDriveDynamics':
+        q, v, t0 = _collect_states(states)
+        return BatchDifferentialDriveDynamics([_.parameters for _ in states], q, v, t0)
+
+    def _next(self, q, v, t1) -> 'BatchDifferentialDriveDynamics':
+        res = BatchDifferentialDriveDynamics.__new__(BatchDifferentialDriveDynamics)
+        res.q, res.v, res.t0 = q, v, t1
+        res.parameters, res.p = self.parameters, self.p
+        return res
+
+    def _twist_from_commands(self, dt, commands):
+        left, right = _pairs_from_commands(commands, WheelVelocityCommands,
+                                           ('left_wheel_angular_velocity', 'right_wheel_angular_velocity'),
+                                           len(self))
+        p = self.p
+        v_r = p['radius_right'] * right
+        v_l = p['radius_left'] * left
+        longitudinal = (v_r + v_l) * 0.5
+        angular = (v_r - v_l) / p['wheel_distance']
+        return longitudinal, np.zeros(len(self)), angular
+
+    def get_state(self, i: int) -> DifferentialDriveDynamics:
+        parameters = self.parameters[i] if isinstance(self.parameters, (list, tuple)) else self.parameters
+        c = self.q[i].copy(), _se2_from_components(self.v[i])
+        return DifferentialDriveDynamics(parameters, c, self.t0)
+
+
+class BatchDynamicModel(BatchGenericKinematicsSE2):
+    """
+        The state of M robots with the dynamics of pwm_dynamics.DynamicModel,
+        each with its own parameters.
+
+        Commands: a PWMCommands for all the robots, a sequence of M of them,
+        or an array of shape (M, 2) with motor_left and motor_right.
+    """
+
+    def __init__(self, parameters: Union[DynamicModelParameters, Sequence[DynamicModelParameters]],
+                 q: np.ndarray, v: np.ndarray, t0: float):
+        BatchGenericKinematicsSE2.__init__(self, q, v, t0)
+        self.parameters = parameters
+        if isinstance(parameters, (list, tuple)):
+            if len(parameters) != len(self):
+                msg = 'Expected %d parameters, got %d.' % (len(self), len(parameters))
+                raise ValueError(msg)
+            self.evaluator = DynamicModelEvaluator.from_parameters(parameters)
+        else:
+            self.evaluator = parameters.get_evaluator()
+
+    @classmethod
+    def from_states(cls, states: Sequence[DynamicModel]) -> 'BatchDynamicModel':
+        q, v, t0 = _collect_states(states)
+        return BatchDynamicModel([_.parameters for _ in states], q, v, t0)
+
+    def _next(self, q, v, t1) -> 'BatchDynamicModel':
+        res = BatchDynamicModel.__new__(BatchDynamicModel)
+        res.q, res.v, res.t0 = q, v, t1
+        res.parameters, res.evaluator = self.parameters, self.evaluator
+        return res
+
+    def _twist_from_commands(self, dt, commands):
+        left, right = _pairs_from_commands(commands, PWMCommands, ('motor_left', 'motor_right'), len(self))
+        # as DynamicModel.integrate()
+        longitudinal, angular = self.evaluator.step(self.v[:, 0], self.v[:, 2], left, right, dt)
+        return longitudinal, np.zeros(len(self)), angular
+
+    def get_state(self, i: int) -> DynamicModel:
+        parameters = self.parameters[i] if isinstance(self.parameters, (list, tuple)) else self.parameters
+        c = self.q[i].copy(), _se2_from_components(self.v[i])
+        return DynamicModel(parameters, c, self.t0)
+
+
+def _collect_states(states: Sequence[GenericKinematicsSE2]) -> Tuple[np.ndarray, np.ndarray, float]:
+    if not states:
+        raise ValueError('Expected at least one state.')
+    t0 = states[0].t0
+    if any(_.t0 != t0 for _ in states):
+        msg = 'The states must have the same time; got %s.' % sorted(set(_.t0 for _ in states))
+        raise ValueError(msg)
+    q = np.array([_.q0 for _ in states], dtype='float64')
+    v = np.array([[_.v0[0, 2], _.v0[1, 2], _.v0[1, 0]] for _ in states], dtype='float64')
+    return q, v, t0
+
+
+def _se2_from_components(v: np.ndarray) -> np.ndarray:
+    """ From vx, vy, omega, shape (..., 3), to matrices in se(2), shape (..., 3, 3). """
+    res = np.zeros(v.shape[:-1] + (3, 3))
+    res[..., 0, 1] = -v[..., 2]
+    res[..., 1, 0] = v[..., 2]
+    res[..., 0, 2] = v[..., 0]
+    res[..., 1, 2] = v[..., 1]
+    return res
+
+
+@dataclass
+class BatchRollout:
+    # shape (K + 1,)
+    timestamps: np.ndarray
+    # shape (K + 1, M, 3, 3)
+    poses: np.ndarray
+    # shape (K + 1, M, 3): vx, vy, omega
+    velocities: np.ndarray
+    # the state after the last step
+    final: BatchGenericKinematicsSE2
+
+
+def rollout_batch(state: BatchGenericKinematicsSE2, dt: float, commands: Sequence,
+                  record: bool = True) -> BatchRollout:
+    """
+        Integrates all the robots for K steps of length dt.
+
+        :param state: the initial state
+        :param commands: the K commands, one for each step,
+                         each of them in any of the forms accepted by state.integrate()
+        :param record: if False, only the initial and the final states are returned
+    """
+    timestamps: List[float] = [state.t0]
+    poses = [state.q]
+    velocities = [state.v]
+    for u in commands:
+        state = state.integrate(dt, u)
+        if record:
+            timestamps.append(state.t0)
+            poses.append(state.q)
+            velocities.append(state.v)
+    if not record:
+        # the initial and the final states
+        timestamps.append(state.t0)
+        poses.append(state.q)
+        velocities.append(state.v)
+    return BatchRollout(timestamps=np.array(timestamps), poses=np.array(poses),
+                        velocities=np.array(velocities), final=state)
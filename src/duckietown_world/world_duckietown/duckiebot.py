@@ -1,6 +1,5 @@
 # coding=utf-8
 from duckietown_world.geo import PlacedObject
-from duckietown_world.svg_drawing import draw_axes
 from .other_objects import Vehicle
 
 __all__ = [
@@ -29,6 +28,7 @@ class Duckiebot(Vehicle):
         rect.width = "0.1em"
         g.add(rect)
 
+        from duckietown_world.svg_drawing import draw_axes
         draw_axes(drawing, g)
         # print(g.tostring())
 
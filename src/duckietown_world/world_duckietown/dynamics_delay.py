@@ -1,7 +1,5 @@
-import math
-from typing import Tuple, Any
-
-import numpy as np
+import bisect
+from typing import Tuple, Any, List
 
 from duckietown_world.world_duckietown.types import TSE2v
 from .platform_dynamics import PlatformDynamicsFactory, PlatformDynamics
@@ -32,33 +30,119 @@ class ApplyDelay(PlatformDynamicsFactory):
         return DelayedDynamics(state0, self.delay, t0, self.u0)
 
 
+class CommandsBuffer(object):
+    """
+        An append-only list of (timestamp, commands), shared by successive DelayedDynamics.
+
+        The entries are addressed by an absolute index; the entry j is
+        stored at position j - offset. An entry is never modified after it
+        is appended, so a state keeps seeing the same entries however
+        many states are obtained after it.
+    """
+
+    def __init__(self, offset: int = 0):
+        self.offset = offset
+        self.timestamps: List[float] = []
+        self.commands: List[Any] = []
+
+    @property
+    def end(self) -> int:
+        """ Absolute index of the next entry. """
+        return self.offset + len(self.timestamps)
+
+    def append(self, t: float, commands):
+        self.timestamps.append(t)
+        self.commands.append(commands)
+
+    def fork(self, start: int, end: int) -> 'CommandsBuffer':
+        """ Returns a new buffer containing the entries start..end-1. """
+        res = CommandsBuffer(start)
+        res.timestamps = self.timestamps[start - self.offset:end - self.offset]
+        res.commands = self.commands[start - self.offset:end - self.offset]
+        return res
+
+    def t(self, j: int) -> float:
+        return self.timestamps[j - self.offset]
+
+    def u(self, j: int):
+        return self.commands[j - self.offset]
+
+
 class DelayedDynamics(PlatformDynamics):
+    """
+        Applies the commands given "delay" seconds before.
+
+        The commands are kept in a CommandsBuffer shared with the previous states;
+        this state refers to the entries start..end-1.
+        The states are immutable: integrate() appends to the buffer only if
+        this is the newest state using it; otherwise, its entries are first
+        copied to a new buffer. The same happens when the entries before
+        start, which no state after this one needs, take more space than the
+        ones after, so that the memory does not grow with the length of the rollout.
+
+        Because the delayed time only increases, the lookup starts from
+        where the previous one ended; start and cursor only move forward,
+        so each step takes amortized constant time.
+    """
     state: PlatformDynamics
 
-    def __init__(self, state, delay, t0, u0, commands=None, timestamps=None):
+    # the buffer is compacted only when it has at least these many unused entries
+    min_compact = 16
+
+    def __init__(self, state, delay, t0, u0, commands=None, timestamps=None,
+                 buffer: CommandsBuffer = None, start: int = 0, end: int = 0, cursor: int = 0):
         self.state = state
-        self.commands = commands or []
-        self.timestamps = timestamps or []
         self.t = t0
         self.delay = delay
         self.u0 = u0
 
-        if self.timestamps:
-            i, _, _  = self.get_commands_at(self.timestamps[-1]-self.delay)
-            self.commands = self.commands[i:]
-            self.timestamps = self.timestamps[i:]
+        if buffer is None:
+            buffer = CommandsBuffer()
+            for t, u in zip(timestamps or [], commands or []):
+                buffer.append(t, u)
+            start, end, cursor = 0, buffer.end, 0
+            if end:
+                start = cursor = self._first_not_before(buffer, start, end, buffer.t(end - 1) - self.delay)
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        # index of the first entry not before the last delayed time
+        self.cursor = cursor
+
+    @property
+    def timestamps(self) -> List[float]:
+        return self.buffer.fork(self.start, self.end).timestamps
+
+    @property
+    def commands(self) -> List[Any]:
+        return self.buffer.fork(self.start, self.end).commands
+
+    @staticmethod
+    def _first_not_before(buffer: CommandsBuffer, j: int, end: int, t: float) -> int:
+        """ Returns the first index from j on whose timestamp is >= t, or end. """
+        while j < end and buffer.t(j) < t:
+            j += 1
+        return j
+
+    def _nearest(self, idx: int, end: int, t: float):
+        """ Returns the commands closest in time to t, given the first index idx not before t. """
+        buffer = self.buffer
+        if idx == self.start:
+            # before the first entry
+            return self.u0 if t < buffer.t(idx) else buffer.u(idx)
+        if idx == end or abs(t - buffer.t(idx - 1)) < abs(t - buffer.t(idx)):
+            return buffer.u(idx - 1)
+        return buffer.u(idx)
 
     def get_commands_at(self, t) -> Tuple[int, float, Any]:
-        if t < self.timestamps[0]:
+        """ Returns the index (relative to the start), the timestamp and the commands closest to t. """
+        timestamps = self.timestamps
+        if not timestamps or t < timestamps[0]:
             return 0, 0, self.u0
-
-        a = np.array(self.timestamps)
-        idx = np.searchsorted(a, t, side="left")
-
-        if idx > 0 and (idx == len(a) or math.fabs(t - a[idx - 1]) < math.fabs(t - a[idx])):
-            return idx, a[idx], self.commands[idx - 1]
-        else:
-            return idx, a[idx], self.commands[idx]
+        idx = bisect.bisect_left(timestamps, t)
+        u = self._nearest(self.start + idx, self.end, t)
+        told = timestamps[min(idx, len(timestamps) - 1)]
+        return idx, told, u
 
     def integrate(self, dt: float, commands) -> 'DelayedDynamics':
         """
@@ -68,15 +152,24 @@ class DelayedDynamics(PlatformDynamics):
             :param commands: class-specific commands
             :return: the next state
         """
-        self.commands.append(commands)
-        self.timestamps.append(self.t)
-        self.t += dt
-        i, told, use_commands = self.get_commands_at(self.t - self.delay)
-        # print(f't = {self.t}, t old = {told}'  )
-        state2 = self.state.integrate(dt, use_commands)
-
-        next = DelayedDynamics(state2, self.delay, self.t, self.u0, commands=list(self.commands),
-                               timestamps=list(self.timestamps))
+        buffer = self.buffer
+        unused = self.start - buffer.offset
+        if buffer.end != self.end or unused >= max(self.min_compact, self.end - self.start):
+            # another state was obtained from this one, or most entries are not needed anymore
+            buffer = buffer.fork(self.start, self.end)
+        buffer.append(self.t, commands)
+        end = self.end + 1
+
+        t = self.t + dt
+        t_delayed = t - self.delay
+        next = DelayedDynamics(None, self.delay, t, self.u0, buffer=buffer, start=self.start, end=end)
+        idx = self._first_not_before(buffer, max(self.cursor, self.start), end, t_delayed)
+        use_commands = next._nearest(idx, end, t_delayed)
+
+        # the following lookups are after the delayed time of the last entry
+        next.start = self._first_not_before(buffer, self.start, end, self.t - self.delay)
+        next.cursor = max(idx, next.start)
+        next.state = self.state.integrate(dt, use_commands)
         return next
 
     def TSE2_from_state(self) -> TSE2v:
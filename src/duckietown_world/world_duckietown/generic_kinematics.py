@@ -1,7 +1,7 @@
 # coding=utf-8
 from duckietown_serialization_ds1 import Serializable
 
-import geometry as geo
+from duckietown_world.geo import se2_fast
 from .platform_dynamics import PlatformDynamicsFactory, PlatformDynamics
 from .types import *
 
@@ -28,8 +28,8 @@ class GenericKinematicsSE2(PlatformDynamicsFactory, PlatformDynamics, Serializab
     def __init__(self, c0: TSE2v, t0: float):
         # start at q0, v0
         q0, v0 = c0
-        geo.SE2.belongs(q0)
-        geo.se2.belongs(v0)
+        se2_fast.SE2_belongs(q0)
+        se2_fast.se2_belongs(v0)
         self.t0 = t0
         self.v0 = v0
         self.q0 = q0
@@ -39,12 +39,12 @@ class GenericKinematicsSE2(PlatformDynamicsFactory, PlatformDynamics, Serializab
         # convert to float
         dt = float(dt)
         # the commands must belong to se(2)
-        geo.se2.belongs(commands)
+        se2_fast.se2_belongs(commands)
         v = commands
         # suppose we hold v for dt, which pose are we going to?
-        diff = geo.SE2.group_from_algebra(dt * v)  # exponential map
+        diff = se2_fast.se2_exp(dt * v)  # exponential map
         # compute the absolute new pose; applying diff from q0
-        q1 = geo.SE2.multiply(self.q0, diff)
+        q1 = se2_fast.SE2_multiply(self.q0, diff)
         # the new configuration
         c1 = q1, v
         # the new time
@@ -0,0 +1,113 @@
+# coding=utf-8
+from typing import Dict, List
+
+import numpy as np
+
+from duckietown_world.geo import PlacedObject, FQN, Transform, se2_fast
+from duckietown_world.geo.measurements_utils import iterate_by_class
+from .lane_segment import LaneSegment
+from .transformations import is_static
+
+__all__ = [
+    'LaneGeometryCache',
+    'get_lane_geometry_cache',
+]
+
+
+class LaneGeometryCache(object):
+    """
+        The geometry of all the lane segments of a world, in world coordinates.
+
+        For the L lane segments, in the order given by iterate_by_class():
+
+            matrix:           shape (L, 3, 3), pose of the lane segment with respect to the root
+            matrix_inv:       shape (L, 3, 3), its inverse
+            polyline:         shape (P, 2), the center lines, one after the other;
+                              the one of lane segment k is polyline[polyline_start[k]:polyline_start[k + 1]]
+            polyline_start:   shape (L + 1,)
+            bbox_min:         shape (L, 2)
+            bbox_max:         shape (L, 2)
+
+        The bounding boxes contain every point that is inside the lane
+        (that is, at most width/2 from the center line).
+
+        The lane segments whose pose depends on time (placed by a Sequence,
+        like the ones added by create_lane_highlight()) are not included.
+    """
+
+    # number of points of the center line per pair of control points
+    points_per_segment = 10
+
+    # absolute tolerance added to the bounding boxes
+    eps = 1e-6
+
+    lane_segments: List[LaneSegment]
+    lane_segment_fqns: List[FQN]
+    # pose of the lane segments with respect to the root
+    lane_segment_transforms: List[Transform]
+    fqn2index: Dict[FQN, int]
+
+    def __init__(self, root: PlacedObject):
+        self.lane_segments = []
+        self.lane_segment_fqns = []
+        self.lane_segment_transforms = []
+        matrices = []
+        for it in iterate_by_class(root, LaneSegment):
+            if not is_static(it.transform_sequence):
+                continue
+            self.lane_segments.append(it.object)
+            self.lane_segment_fqns.append(it.fqn)
+            self.lane_segment_transforms.append(it.transform_sequence)
+            matrices.append(it.transform_sequence.asmatrix2d().m)
+        self.fqn2index = {fqn: k for k, fqn in enumerate(self.lane_segment_fqns)}
+
+        L = len(self.lane_segments)
+        self.matrix = np.array(matrices, dtype='float64').reshape((L, 3, 3))
+        self.matrix_inv = se2_fast.E2_inverse(self.matrix)
+
+        polylines = []
+        self.bbox_min = np.zeros((L, 2))
+        self.bbox_max = np.zeros((L, 2))
+        for k, lane_segment in enumerate(self.lane_segments):
+            M = self.matrix[k]
+            points = lane_segment.center_line_points(points_per_segment=self.points_per_segment)
+            xy = np.array([_[0:2, 2] for _ in points]).reshape((-1, 2))
+            world = np.dot(xy, M[0:2, 0:2].T) + M[0:2, 2]
+            polylines.append(world)
+
+            # the transforms can include a scaling
+            scale = np.sqrt(np.abs(np.linalg.det(M[0:2, 0:2])))
+            # between two samples, the arc is at most half a chord away from the polyline
+            chords = np.hypot(*np.diff(world, axis=0).T) if len(world) > 1 else np.zeros(1)
+            margin = scale * lane_segment.width / 2 + np.max(chords) / 2 + self.eps
+            self.bbox_min[k] = world.min(axis=0) - margin
+            self.bbox_max[k] = world.max(axis=0) + margin
+
+        self.polyline_start = np.cumsum([0] + [len(_) for _ in polylines])
+        self.polyline = np.concatenate(polylines) if polylines else np.zeros((0, 2))
+
+        # (x0, y0, x1, y1) as Python floats: faster than indexing the arrays for one lane at a time
+        self.bbox_tuples = np.hstack((self.bbox_min, self.bbox_max)).tolist()
+
+    def __len__(self) -> int:
+        return len(self.lane_segments)
+
+    def get_polyline(self, k: int) -> np.ndarray:
+        """ Returns the center line of lane segment k in world coordinates, shape (n, 2). """
+        return self.polyline[self.polyline_start[k]:self.polyline_start[k + 1]]
+
+    def bbox_contains(self, k: int, x: float, y: float) -> bool:
+        """ Returns True if the point (x, y) is in the bounding box of lane segment k. """
+        x0, y0, x1, y1 = self.bbox_tuples[k]
+        return x0 <= x <= x1 and y0 <= y <= y1
+
+    def lanes_containing(self, p) -> np.ndarray:
+        """ Returns the indices of the lane segments whose bounding box contains p. """
+        p = np.asarray(p, dtype='float64')
+        ok = np.all((self.bbox_min <= p) & (p <= self.bbox_max), axis=1)
+        return np.flatnonzero(ok)
+
+
+def get_lane_geometry_cache(root: PlacedObject) -> LaneGeometryCache:
+    """ Returns the lane geometry cache for the world (cached in the object, see PlacedObject.get_cached()). """
+    return root.get_cached('lane_geometry_cache', lambda: LaneGeometryCache(root))
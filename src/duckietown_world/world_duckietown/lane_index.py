@@ -0,0 +1,219 @@
+# coding=utf-8
+from collections import defaultdict
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from duckietown_world.geo import PlacedObject, Matrix2D
+from duckietown_world.world_duckietown.types import SE2v
+from .lane_geometry import LaneGeometryCache, get_lane_geometry_cache
+from .tile import GetLanePoseResult
+
+__all__ = [
+    'LaneSegmentIndex',
+    'get_lane_segment_index',
+    'get_lane_poses_generic',
+]
+
+
+class LaneSegmentIndex(object):
+    """
+        A uniform grid over the bounding boxes of the lane segments of a world.
+
+        Unlike TileIndex, this works for any world, including the ones
+        whose lane segments are not inside tiles
+        (for example, the "root2" returned by get_skeleton_graph()).
+
+        Each lane segment is registered in all the cells that its bounding box
+        overlaps; a query only looks at the cells it overlaps.
+        All the queries return indices in the LaneGeometryCache, in increasing order.
+    """
+
+    # the grid is never finer than this many cells per side
+    max_cells_per_side = 1024
+
+    def __init__(self, geometry: LaneGeometryCache, cell_size: Optional[float] = None):
+        self.geometry = geometry
+        L = len(geometry)
+        if L == 0:
+            self.origin = np.zeros(2)
+            self.cell_size = 1.0
+            self.cells = {}
+            self.cells_min = self.cells_max = (0, 0)
+            return
+
+        bbox_min, bbox_max = geometry.bbox_min, geometry.bbox_max
+        self.origin = bbox_min.min(axis=0)
+        extent = float(np.max(bbox_max.max(axis=0) - self.origin))
+        if cell_size is None:
+            # about one lane segment per cell
+            cell_size = float(np.median(np.max(bbox_max - bbox_min, axis=1)))
+        self.cell_size = max(cell_size, extent / self.max_cells_per_side, 1e-9)
+
+        cells = defaultdict(list)
+        imin = self._cell_of(bbox_min)
+        imax = self._cell_of(bbox_max)
+        for k in range(L):
+            for i in range(imin[k, 0], imax[k, 0] + 1):
+                for j in range(imin[k, 1], imax[k, 1] + 1):
+                    cells[(i, j)].append(k)
+        self.cells: Dict[Tuple[int, int], np.ndarray] = {ij: np.array(ks, dtype=int)
+                                                         for ij, ks in cells.items()}
+        self.cells_min = tuple(imin.min(axis=0).tolist())
+        self.cells_max = tuple(imax.max(axis=0).tolist())
+
+    def _cell_of(self, p) -> np.ndarray:
+        return np.floor((np.asarray(p, dtype='float64') - self.origin) / self.cell_size).astype(int)
+
+    def _candidates_box(self, pmin, pmax) -> np.ndarray:
+        """ Returns the lane segments registered in the cells overlapping the box, without duplicates. """
+        (i0, j0), (i1, j1) = self._cell_of(pmin), self._cell_of(pmax)
+        found = [self.cells[(i, j)]
+                 for i in range(i0, i1 + 1)
+                 for j in range(j0, j1 + 1)
+                 if (i, j) in self.cells]
+        if not found:
+            return np.zeros(0, dtype=int)
+        if len(found) == 1:
+            return found[0]
+        return np.unique(np.concatenate(found))
+
+    def query_point(self, p) -> np.ndarray:
+        """ Returns the lane segments whose bounding box contains the point p. """
+        p = np.asarray(p, dtype='float64')
+        ks = self.cells.get(tuple(self._cell_of(p).tolist()))
+        if ks is None:
+            return np.zeros(0, dtype=int)
+        g = self.geometry
+        ok = np.all((g.bbox_min[ks] <= p) & (p <= g.bbox_max[ks]), axis=1)
+        return ks[ok]
+
+    def query_box(self, pmin, pmax) -> np.ndarray:
+        """ Returns the lane segments whose bounding box intersects the box [pmin, pmax]. """
+        pmin = np.asarray(pmin, dtype='float64')
+        pmax = np.asarray(pmax, dtype='float64')
+        ks = self._candidates_box(pmin, pmax)
+        g = self.geometry
+        ok = np.all((g.bbox_min[ks] <= pmax) & (pmin <= g.bbox_max[ks]), axis=1)
+        return ks[ok]
+
+    def query_radius(self, p, r: float) -> np.ndarray:
+        """ Returns the lane segments whose bounding box is at distance at most r from p. """
+        p = np.asarray(p, dtype='float64')
+        ks = self._candidates_box(p - r, p + r)
+        g = self.geometry
+        d = np.maximum(np.maximum(g.bbox_min[ks] - p, p - g.bbox_max[ks]), 0)
+        ok = np.hypot(d[:, 0], d[:, 1]) <= r
+        return ks[ok]
+
+    def distance_from_center_line(self, k: int, p) -> float:
+        """ Returns the distance of p from the center line of lane segment k (as a polyline). """
+        polyline = self.geometry.get_polyline(k)
+        p = np.asarray(p, dtype='float64')
+        if len(polyline) == 1:
+            return float(np.hypot(*(p - polyline[0])))
+        a = polyline[:-1]
+        ab = polyline[1:] - a
+        ab2 = np.maximum(np.sum(ab * ab, axis=1), 1e-18)
+        t = np.clip(np.sum((p - a) * ab, axis=1) / ab2, 0, 1)
+        closest = a + t[:, np.newaxis] * ab
+        return float(np.min(np.hypot(*(p - closest).T)))
+
+    def nearest(self, p, max_distance: float = np.inf) -> Optional[Tuple[int, float]]:
+        """
+            Returns the lane segment whose center line is closest to p,
+            and the distance; None if there is none within max_distance.
+
+            The cells are visited in rings of increasing size around p,
+            until no unvisited lane segment can be closer than the best one.
+        """
+        if not self.cells:
+            return None
+        p = np.asarray(p, dtype='float64')
+        ci, cj = self._cell_of(p).tolist()
+        (i0, j0), (i1, j1) = self.cells_min, self.cells_max
+        # the rings before rmin and after rmax contain no cells
+        rmin = max(i0 - ci, ci - i1, j0 - cj, cj - j1, 0)
+        rmax = max(ci - i0, i1 - ci, cj - j0, j1 - cj)
+
+        px, py = p.tolist()
+        bboxes = self.geometry.bbox_tuples
+        best = None
+        best_d = max_distance
+        seen = set()
+        for r in range(rmin, rmax + 1):
+            # all the lane segments not seen yet are at least this far
+            if (r - 1) * self.cell_size > best_d:
+                break
+            for ij in _ring(ci, cj, r, self.cells_min, self.cells_max):
+                if ij not in self.cells:
+                    continue
+                for k in self.cells[ij].tolist():
+                    if k in seen:
+                        continue
+                    seen.add(k)
+                    # the center line is inside the bounding box
+                    x0, y0, x1, y1 = bboxes[k]
+                    dx = max(x0 - px, px - x1, 0)
+                    dy = max(y0 - py, py - y1, 0)
+                    if dx * dx + dy * dy > best_d * best_d:
+                        continue
+                    d = self.distance_from_center_line(k, p)
+                    if d <= best_d and (best is None or d < best_d or k < best):
+                        best, best_d = k, d
+        if best is None:
+            return None
+        return best, best_d
+
+
+def _ring(ci: int, cj: int, r: int, cells_min, cells_max) -> Iterator[Tuple[int, int]]:
+    """ Yields the cells at Chebyshev distance r from (ci, cj), within the given bounds. """
+    (i0, j0), (i1, j1) = cells_min, cells_max
+    if r == 0:
+        yield ci, cj
+        return
+    for j in (cj - r, cj + r):
+        if j0 <= j <= j1:
+            for i in range(max(ci - r, i0), min(ci + r, i1) + 1):
+                yield i, j
+    for i in (ci - r, ci + r):
+        if i0 <= i <= i1:
+            for j in range(max(cj - r + 1, j0), min(cj + r - 1, j1) + 1):
+                yield i, j
+
+
+def get_lane_segment_index(root: PlacedObject) -> LaneSegmentIndex:
+    """ Returns the lane segment index for the world (cached in the object, see PlacedObject.get_cached()). """
+    return root.get_cached('lane_segment_index', lambda: LaneSegmentIndex(get_lane_geometry_cache(root)))
+
+
+def get_lane_poses_generic(po: PlacedObject, q: SE2v, tol=0.000001,
+                           lane_index: LaneSegmentIndex = None) -> Iterator[GetLanePoseResult]:
+    """
+        As get_lane_poses(), for worlds whose lane segments are not necessarily inside tiles.
+
+        The candidate lane segments are looked up in the lane segment index,
+        which is computed using get_lane_segment_index() if not given.
+        The fields of the results that refer to the tile are None.
+    """
+    if lane_index is None:
+        lane_index = get_lane_segment_index(po)
+    geometry = lane_index.geometry
+
+    for k in lane_index.query_point((q[0, 2], q[1, 2])).tolist():
+        lane_segment = geometry.lane_segments[k]
+        lane_segment_relative_pose = np.dot(geometry.matrix_inv[k], q)
+        lane_pose = lane_segment.lane_pose_from_SE2(lane_segment_relative_pose, tol=tol)
+
+        if lane_pose.along_inside and lane_pose.inside and lane_pose.correct_direction:
+            center_point_abs = np.dot(geometry.matrix[k], lane_pose.center_point.as_SE2())
+            yield GetLanePoseResult(tile=None, tile_fqn=None,
+                                    tile_transform=None,
+                                    tile_relative_pose=None,
+                                    lane_segment=lane_segment,
+                                    lane_segment_relative_pose=Matrix2D(lane_segment_relative_pose),
+                                    lane_pose=lane_pose,
+                                    lane_segment_fqn=geometry.lane_segment_fqns[k],
+                                    lane_segment_transform=geometry.lane_segment_transforms[k],
+                                    tile_coords=None,
+                                    center_point=Matrix2D(center_point_abs))
@@ -0,0 +1,162 @@
+# coding=utf-8
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+from duckietown_world.geo import PlacedObject
+from .tile_index import TileIndex, TileLaneSegment, get_tile_index
+
+__all__ = [
+    'LANE_POSE_DTYPE',
+    'LanePosesBatch',
+    'get_lane_poses_batch',
+    'SE2_batch_from_poses',
+]
+
+LANE_POSE_DTYPE = np.dtype([
+    # index of the pose in the batch
+    ('pose', np.int64),
+    # index in LanePosesBatch.lane_segments
+    ('lane_segment', np.int64),
+    ('along_lane', np.float64),
+    ('lateral', np.float64),
+    ('relative_heading', np.float64),
+    ('distance_from_center', np.float64),
+    ('inside', np.bool_),
+    ('lateral_inside', np.bool_),
+    ('along_inside', np.bool_),
+    ('correct_direction', np.bool_),
+])
+
+
+@dataclass
+class LanePosesBatch:
+    # one row for each pair (pose, lane segment) such that
+    # the pose is in the footprint of the tile of the lane segment;
+    # sorted by pose, then in the same order as get_lane_poses()
+    candidates: np.ndarray
+    # the lane segments referred to by the "lane_segment" field
+    lane_segments: List[TileLaneSegment]
+
+    def get_matches(self) -> np.ndarray:
+        """ Returns the rows that would be returned by get_lane_poses(). """
+        c = self.candidates
+        return c[c['along_inside'] & c['inside'] & c['correct_direction']]
+
+
+def SE2_batch_from_poses(poses) -> np.ndarray:
+    """
+        Converts a batch of poses to an array of shape (N, 3, 3).
+
+        The poses are either given as matrices, shape (N, 3, 3),
+        or as rows (x, y, theta), shape (N, 3).
+    """
+    poses = np.asarray(poses, dtype='float64')
+    if poses.ndim == 3 and poses.shape[1:] == (3, 3):
+        return poses
+    if poses.ndim == 2 and poses.shape[1] == 3:
+        N = poses.shape[0]
+        c = np.cos(poses[:, 2])
+        s = np.sin(poses[:, 2])
+        qs = np.zeros((N, 3, 3))
+        qs[:, 0, 0] = c
+        qs[:, 0, 1] = -s
+        qs[:, 1, 0] = s
+        qs[:, 1, 1] = c
+        qs[:, 0, 2] = poses[:, 0]
+        qs[:, 1, 2] = poses[:, 1]
+        qs[:, 2, 2] = 1.0
+        return qs
+    msg = 'Expected an array of shape (N, 3, 3) or (N, 3), got %s' % (poses.shape,)
+    raise ValueError(msg)
+
+
+def get_lane_poses_batch(dw: PlacedObject, poses, tile_index: TileIndex = None) -> LanePosesBatch:
+    """
+        Vectorized version of get_lane_poses() for a batch of poses.
+
+        :param dw: the world
+        :param poses: shape (N, 3, 3) or (N, 3); see SE2_batch_from_poses()
+        :param tile_index: the tile index; computed using get_tile_index() if not given.
+    """
+    if tile_index is None:
+        tile_index = get_tile_index(dw)
+    arrays = tile_index.get_arrays()
+    qs = SE2_batch_from_poses(poses)
+    N = qs.shape[0]
+    points = qs[:, :2, 2]
+
+    # candidate (pose, tile) pairs
+    pose_ids = [np.repeat(np.arange(N), len(arrays.others))]
+    tile_ids = [np.tile(arrays.others, N)]
+    eps = TileIndex.eps
+    for grid in arrays.grids:
+        u = np.dot(points, grid.frame_inv[:2, :2].T) + grid.frame_inv[:2, 2]
+        ilo = np.floor(u[:, 0] - eps).astype(int)
+        ihi = np.floor(u[:, 0] + eps).astype(int)
+        jlo = np.floor(u[:, 1] - eps).astype(int)
+        jhi = np.floor(u[:, 1] + eps).astype(int)
+        ni, nj, _ = grid.cells.shape
+        for di in [0, 1]:
+            for dj in [0, 1]:
+                i = ilo + di - grid.i0
+                j = jlo + dj - grid.j0
+                ok = (ilo + di <= ihi) & (jlo + dj <= jhi) & (0 <= i) & (i < ni) & (0 <= j) & (j < nj)
+                which = np.nonzero(ok)[0]
+                cells = grid.cells[i[which], j[which]]
+                k_pose, k_slot = np.nonzero(cells >= 0)
+                pose_ids.append(which[k_pose])
+                tile_ids.append(cells[k_pose, k_slot])
+
+    pose_ids = np.concatenate(pose_ids)
+    tile_ids = np.concatenate(tile_ids)
+    order = np.lexsort((tile_ids, pose_ids))
+    pose_ids = pose_ids[order]
+    tile_ids = tile_ids[order]
+
+    # keep the tiles whose footprint contains the point
+    tile_relative = np.einsum('nij,njk->nik', arrays.tile_matrix_inv[tile_ids], qs[pose_ids])
+    p = tile_relative[:, :2, 2]
+    inside_tile = np.all((arrays.footprint_min[tile_ids] <= p) & (p <= arrays.footprint_max[tile_ids]), axis=1)
+    pose_ids = pose_ids[inside_tile]
+    tile_ids = tile_ids[inside_tile]
+    tile_relative = tile_relative[inside_tile]
+
+    # expand to (pose, lane segment) pairs
+    counts = arrays.tile_lanes_count[tile_ids]
+    rows = np.repeat(np.arange(len(tile_ids)), counts)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    lane_ids = arrays.tile_lanes_start[tile_ids][rows] + offsets
+    lane_relative = np.einsum('nij,njk->nik', arrays.lane_wrt_tile_inv[lane_ids], tile_relative[rows])
+
+    res = np.zeros(len(rows), dtype=LANE_POSE_DTYPE)
+    res['pose'] = pose_ids[rows]
+    res['lane_segment'] = lane_ids
+
+    # the lane coordinates, computed once for each distinct LaneSegment
+    objects = arrays.lane_object[lane_ids]
+    widths = np.zeros(len(rows))
+    lengths = np.zeros(len(rows))
+    for k, lane_segment in enumerate(arrays.lane_segment_objects):
+        which = objects == k
+        if not np.any(which):
+            continue
+        along_lane, lateral, relative_heading = lane_segment.lane_coordinates_from_SE2_batch(lane_relative[which])
+        res['along_lane'][which] = along_lane
+        res['lateral'][which] = lateral
+        res['relative_heading'][which] = relative_heading
+        widths[which] = lane_segment.width
+        lengths[which] = lane_segment.get_lane_length()
+
+    # the same conventions as LaneSegment.lane_pose()
+    W2 = widths / 2
+    lateral = res['lateral']
+    along_lane = res['along_lane']
+    res['distance_from_center'] = np.abs(lateral)
+    res['lateral_inside'] = (-W2 <= lateral) & (lateral <= W2)
+    res['along_inside'] = (0 <= along_lane) & (along_lane < lengths)
+    res['inside'] = res['lateral_inside'] & res['along_inside']
+    res['correct_direction'] = np.abs(res['relative_heading']) <= np.pi / 2
+
+    return LanePosesBatch(candidates=res, lane_segments=tile_index.lane_segments)
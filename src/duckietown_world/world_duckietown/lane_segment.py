@@ -1,13 +1,15 @@
 # coding=utf-8
+from dataclasses import dataclass
+from typing import List, Tuple
+
 import numpy as np
-import svgwrite
 from duckietown_serialization_ds1 import Serializable
 from duckietown_serialization_ds1.serialization1 import as_json_dict
 
 import geometry as geo
 from contracts import contract, check_isinstance, new_contract
-from duckietown_world.geo import SE2Transform, PlacedObject
-from duckietown_world.utils import memoized_reset, SE2_interpolate, SE2_apply_R2
+from duckietown_world.geo import SE2Transform, PlacedObject, se2_fast
+from duckietown_world.utils import memoized_method, SE2_interpolate, SE2_apply_R2
 from .tile import relative_pose
 
 __all__ = [
@@ -60,6 +62,17 @@ class LanePose(Serializable):
         self.correct_direction = correct_direction
 
 
+@dataclass
+class CenterLineArc:
+    # pose of the first control point
+    q0: np.ndarray
+    theta0: float
+    # twist (in the frame q0) that reaches the next control point in unit time
+    vx: float
+    vy: float
+    w: float
+
+
 def almost_equal(a, b):
     return (np.abs(a - b)) < 1e-7
 
@@ -89,18 +102,24 @@ class LaneSegment(PlacedObject):
     def _copy(self):
         return self._simplecopy(width=self.width, control_points=self.control_points)
 
-    @memoized_reset
-    def get_lane_lengths(self):
-        res = []
-        for i in range(len(self.control_points) - 1):
-            p0 = self.control_points[i]
-            p1 = self.control_points[i + 1]
-            sd = get_distance_two(p0.as_SE2(), p1.as_SE2())
-            res.append(sd)
-        return res
+    def get_lane_lengths(self) -> List[float]:
+        """ Returns the length of the center line between consecutive control points. """
+        return self.get_cached('lane_lengths', self._get_lane_lengths)
+
+    def _get_lane_lengths(self):
+        # same as get_distance_two() between consecutive control points
+        return [float(np.hypot(arc.vx, arc.vy)) for arc in self.center_line_arcs()]
+
+    def get_cumulative_lengths(self) -> np.ndarray:
+        """
+            Returns the along_lane coordinate of each control point,
+            as an array of shape (n,) that starts with 0.
+        """
+        return self.get_cached('cumulative_lengths',
+                               lambda: np.concatenate(([0.0], np.cumsum(self.get_lane_lengths()))))
 
     def get_lane_length(self):
-        return sum(self.get_lane_lengths())
+        return float(self.get_cumulative_lengths()[-1])
 
     def lane_pose_random(self):
         along_lane = np.random.uniform(0, self.get_lane_length())
@@ -189,47 +208,160 @@ class LaneSegment(PlacedObject):
 
     @contract(q='euclidean2')
     def lane_pose_from_SE2_generic(self, q, tol=0.001):
-        p, _, _ = geo.translation_angle_scale_from_E2(q)
+        p, theta, _ = geo.translation_angle_scale_from_E2(q)
 
-        beta, q0 = self.find_along_lane_closest_point(p, tol=tol)
-        along_lane = self.along_lane_from_beta(beta)
-        rel = relative_pose(q0, q)
-
-        r, relative_heading, _ = geo.translation_angle_scale_from_E2(rel)
-        lateral = r[1]
-        # extra = r[0]
-        # along_lane -= extra
-        # logger.info('ms: %s' % r[0])
-        return self.lane_pose(relative_heading=relative_heading,
-                              lateral=lateral,
-                              along_lane=along_lane)
+        betas, laterals, headings = self.find_along_lane_closest_points(p.reshape(1, 2))
+        along_lane = self.along_lane_from_beta(betas[0])
+        lateral = laterals[0]
+        delta = theta - headings[0]
+        relative_heading = np.arctan2(np.sin(delta), np.cos(delta))
+        return self.lane_pose(relative_heading=float(relative_heading),
+                              lateral=float(lateral),
+                              along_lane=float(along_lane))
 
     def find_along_lane_closest_point(self, p, tol=0.001):
+        """
+            Returns the parameter beta and the pose of the point
+            of the center line closest to p.
+
+            The projection is computed exactly using find_along_lane_closest_points();
+            the parameter tol is kept for compatibility.
+        """
+        betas, _, _ = self.find_along_lane_closest_points(np.reshape(p, (1, 2)))
+        beta = float(betas[0])
+        q0 = self.center_point(beta)
+        return beta, q0
 
-        def get_delta(beta):
-            q0 = self.center_point(beta)
-            t0, _ = geo.translation_angle_from_SE2(q0)
-            d = np.linalg.norm(p - t0)
-
-            d1 = np.array([0, -d])
-            p1 = SE2_apply_R2(q0, d1)
-
-            d2 = np.array([0, +d])
-            p2 = SE2_apply_R2(q0, d2)
+    def center_line_arcs(self) -> List['CenterLineArc']:
+        """
+            Returns the pieces of the center line between control points,
+            each described by the twist that moves from one control point to the next.
+        """
+        return self.get_cached('center_line_arcs', self._center_line_arcs)
 
-            D2 = np.linalg.norm(p2 - p)
-            D1 = np.linalg.norm(p1 - p)
-            res = np.minimum(D1, D2)
-            # print('%10f: q %s %f' % (beta, geo.SE2.friendly(q0), res))
-            return res
+    def _center_line_arcs(self):
+        res = []
+        for i in range(len(self.control_points) - 1):
+            q0 = self.control_points[i].as_SE2()
+            q1 = self.control_points[i + 1].as_SE2()
+            v = geo.SE2.algebra_from_group(geo.SE2.multiply(geo.SE2.inverse(q0), q1))
+            (vx, vy), w = geo.linear_angular_from_se2(v)
+            res.append(CenterLineArc(q0=q0, theta0=self.control_points[i].theta,
+                                     vx=float(vx), vy=float(vy), w=float(w)))
+        return res
 
-        import scipy.optimize
-        bracket = (-1.0, len(self.control_points))
-        res = scipy.optimize.minimize_scalar(get_delta, bracket=bracket, tol=tol)
-        # print(res)
-        beta = res.x
-        q0 = self.center_point(beta)
-        return beta, q0
+    def lane_coordinates_from_SE2_batch(self, qs: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+            Vectorized version of lane_pose_from_SE2().
+
+            :param qs: poses with respect to the lane segment, shape (N, 3, 3)
+            :return: along_lane, lateral, relative_heading; each of shape (N,)
+        """
+        qs = np.asarray(qs, dtype='float64')
+        if self.is_straight():
+            cp1 = self.control_points[0]
+            rel = np.einsum('ij,njk->nik', np.linalg.inv(cp1.as_SE2()), qs)
+            along_lane = rel[:, 0, 2]
+            lateral = rel[:, 1, 2]
+            relative_heading = np.arctan2(rel[:, 1, 0], rel[:, 0, 0])
+            return along_lane, lateral, relative_heading
+
+        beta, lateral, heading = self.find_along_lane_closest_points(qs[:, :2, 2])
+        along_lane = self._along_lane_from_beta_batch(beta)
+        theta = np.arctan2(qs[:, 1, 0], qs[:, 0, 0])
+        delta = theta - heading
+        relative_heading = np.arctan2(np.sin(delta), np.cos(delta))
+        return along_lane, lateral, relative_heading
+
+    def find_along_lane_closest_points(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+            Vectorized version of find_along_lane_closest_point().
+
+            Between two control points the center line is a geodesic of SE(2):
+            the frame rotates at a constant rate around a fixed center,
+            so the points where the longitudinal coordinate of p vanishes
+            can be found in closed form. Before the first and after the last
+            control point the center line continues straight, as in center_point().
+
+            Among all the solutions, the one with the smallest lateral
+            offset is chosen.
+
+            :param points: shape (N, 2)
+            :return: beta, lateral offset, heading of the center point; each of shape (N,)
+        """
+        P = np.asarray(points, dtype='float64').reshape(-1, 2)
+        n = len(self.control_points)
+        # for each candidate solution: beta, lateral, heading, valid
+        candidates = []
+
+        def local(q):
+            # coordinates of the points in the frame q
+            return np.dot(P - q[:2, 2], q[:2, :2])
+
+        # center_point() moves 0.1 along the x axis for each unit of beta
+        # outside of [0, n-1]
+        q_first = self.control_points[0].as_SE2()
+        pl = local(q_first)
+        beta = pl[:, 0] / 0.1
+        candidates.append((beta, pl[:, 1], np.full(len(P), self.control_points[0].theta), beta <= 0))
+
+        for i, arc in enumerate(self.center_line_arcs()):
+            vx, vy, w, theta0 = arc.vx, arc.vy, arc.w, arc.theta0
+            pl = local(arc.q0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                if np.abs(w) < 1e-9:
+                    alpha = pl[:, 0] / vx
+                    lateral = pl[:, 1] - alpha * vy
+                    valid = (0 <= alpha) & (alpha <= 1)
+                    candidates.append((i + alpha, lateral, np.full(len(P), theta0), valid))
+                    continue
+
+                # center of rotation, in the frame q0
+                c = np.array([-vy / w, vx / w])
+                d = pl - c
+                rho = np.hypot(d[:, 0], d[:, 1])
+                psi = np.arctan2(d[:, 1], d[:, 0])
+                # the longitudinal coordinate is rho * cos(psi - w * alpha) + c[0]
+                ratio = -c[0] / rho
+                exists = np.abs(ratio) <= 1
+                gamma = np.arccos(np.clip(ratio, -1, +1))
+                period = 2 * np.pi / np.abs(w)
+                for sign in [-1, +1]:
+                    alpha = np.mod((psi + sign * gamma) / w, period)
+                    lateral = c[1] - sign * rho * np.sin(gamma)
+                    valid = exists & (alpha <= 1)
+                    candidates.append((i + alpha, lateral, theta0 + w * alpha, valid))
+
+        q_last = self.control_points[-1].as_SE2()
+        pl = local(q_last)
+        beta = (n - 1) + pl[:, 0] / 0.1
+        candidates.append((beta, pl[:, 1], np.full(len(P), self.control_points[-1].theta), pl[:, 0] >= 0))
+
+        betas, laterals, headings, valids = [np.array(_) for _ in zip(*candidates)]
+        cost = np.where(valids, np.abs(laterals), np.inf)
+        best = np.argmin(cost, axis=0)
+        k = np.arange(len(P))
+        return betas[best, k], laterals[best, k], headings[best, k]
+
+    def _along_lane_from_beta_batch(self, beta: np.ndarray) -> np.ndarray:
+        cumulative = self.get_cumulative_lengths()
+        lengths = np.array(self.get_lane_lengths())
+        n = len(self.control_points)
+        i = np.clip(np.floor(beta).astype(int), 0, n - 2)
+        inside = cumulative[i] + lengths[i] * (beta - i)
+        after = cumulative[-1] + (beta - (n - 1))
+        return np.where(beta < 0, beta, np.where(beta >= n - 1, after, inside))
+
+    def _beta_from_along_lane_batch(self, along_lane: np.ndarray) -> np.ndarray:
+        cumulative = self.get_cumulative_lengths()
+        lengths = np.array(self.get_lane_lengths())
+        n = len(self.control_points)
+        S = cumulative[-1]
+        i = np.clip(np.searchsorted(cumulative, along_lane, side='right') - 1, 0, n - 2)
+        inside = i + (along_lane - cumulative[i]) / lengths[i]
+        after = (n - 1.0) + (along_lane - S)
+        inside = np.where(almost_equal(along_lane, S), n - 1.0, inside)
+        return np.where(along_lane < 0, along_lane, np.where(along_lane > S, after, inside))
 
     @contract(lane_pose=LanePose, returns=SE2Transform)
     def SE2Transform_from_lane_pose(self, lane_pose):
@@ -245,26 +377,31 @@ class LaneSegment(PlacedObject):
         return SE2Transform.from_SE2(res)
 
     def along_lane_from_beta(self, beta):
-        lengths = self.get_lane_lengths()
+        """ Converts beta (see center_point()) to along_lane. Works also on arrays. """
+        if np.ndim(beta) > 0:
+            return self._along_lane_from_beta_batch(np.asarray(beta, dtype='float64'))
+
         if beta < 0:
             return beta
-        elif beta >= len(self.control_points) - 1:
-            rest = beta - (len(self.control_points) - 1)
-            return sum(lengths) + rest
+        cumulative = self.get_cumulative_lengths()
+        n = len(self.control_points)
+        if beta >= n - 1:
+            rest = beta - (n - 1)
+            return float(cumulative[-1]) + rest
         else:
             i = int(np.floor(beta))
-
             rest = beta - i
-
-            res = sum(lengths[:i]) + lengths[i] * rest
-
-            return res
+            return float(cumulative[i] + self.get_lane_lengths()[i] * rest)
 
     def beta_from_along_lane(self, along_lane):
-        lengths = self.get_lane_lengths()
+        """ Converts along_lane to beta (see center_point()). Works also on arrays. """
+        if np.ndim(along_lane) > 0:
+            return self._beta_from_along_lane_batch(np.asarray(along_lane, dtype='float64'))
+
         x0 = along_lane
+        cumulative = self.get_cumulative_lengths()
         n = len(self.control_points)
-        S = sum(lengths)
+        S = float(cumulative[-1])
 
         if x0 < 0:
             beta = x0
@@ -278,18 +415,13 @@ class LaneSegment(PlacedObject):
             beta = (n - 1.0)
             return beta
 
-        assert 0 <= x0 < S, (x0, S)
-
-        for i in range(n - 1):
-            start_x = sum(lengths[:i])
-            end_x = sum(lengths[:i + 1])
-            if start_x <= x0 < end_x:
-                beta = i + (x0 - start_x) / lengths[i]
-                return beta
-
-        assert False
+        # the segment with cumulative[i] <= x0 < cumulative[i + 1]
+        i = min(int(np.searchsorted(cumulative, x0, side='right')) - 1, n - 2)
+        beta = i + (x0 - cumulative[i]) / self.get_lane_lengths()[i]
+        return float(beta)
 
     def draw_svg(self, drawing, g):
+        import svgwrite
         assert isinstance(drawing, svgwrite.Drawing)
         glane = drawing.g()
         glane.attribs['class'] = 'lane'
@@ -366,7 +498,7 @@ class LaneSegment(PlacedObject):
         q = SE2_interpolate(q0, q1, alpha)
         return q
 
-    @memoized_reset
+    @memoized_method(maxsize=8)
     def center_line_points(self, points_per_segment=5):
         n = len(self.control_points) - 1
         num = n * points_per_segment
@@ -377,7 +509,7 @@ class LaneSegment(PlacedObject):
             res.append(q)
         return res
 
-    @memoized_reset
+    @memoized_method(maxsize=8)
     def lane_profile(self, points_per_segment=5):
         points_left = []
         points_right = []
@@ -398,7 +530,4 @@ new_contract('LaneSegment', LaneSegment)
 
 
 def get_distance_two(q0, q1):
-    g = geo.SE2.multiply(geo.SE2.inverse(q0), q1)
-    v = geo.SE2.algebra_from_group(g)
-    linear, angular = geo.linear_angular_from_se2(v)
-    return np.linalg.norm(linear)
+    return float(se2_fast.SE2_distance(q0, q1))
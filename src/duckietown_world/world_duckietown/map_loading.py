@@ -1,7 +1,13 @@
 # coding=utf-8
+import hashlib
 import itertools
 import os
+import pickle
+import sys
+import time
 import traceback
+from collections import OrderedDict
+from typing import Dict, List, Optional
 
 import numpy as np
 import oyaml as yaml
@@ -15,16 +21,19 @@ from .tags_db import FloorTag
 from .tile import Tile
 from .tile_map import TileMap
 from .tile_template import load_tile_types
+from . import tile_template
 from .traffic_light import TrafficLight
-from .. import logger
+from .. import logger, __version__
 from ..geo import Scale2D, SE2Transform
-from ..geo.measurements_utils import iterate_by_class
 
 __all__ = [
     'create_map',
     'list_maps',
     'construct_map',
     'load_map',
+    'get_maps_cache_dir',
+    'get_texture_file',
+    'refresh_texture_index',
 ]
 
 
@@ -81,14 +90,173 @@ def _get_map_yaml(map_name) -> str:
     return data
 
 
-def load_map(map_name):
+def load_map(map_name, use_cache: bool = True):
+    """
+        Loads one of the maps in the library.
+
+        Unless use_cache is False, the constructed map is cached in this process
+        and on disk (see get_maps_cache_dir()); each call returns a new copy.
+    """
     logger.info('loading map %s' % map_name)
     data = _get_map_yaml(map_name)
-    yaml_data = yaml.load(data, Loader=yaml.SafeLoader)
+    if not use_cache:
+        return _construct_map_from_yaml(data)
+
+    key = _get_map_cache_key(data)
+    pickled = _maps_lru.pop(key, None)
+    if pickled is None:
+        pickled = _read_map_cache(key)
+    dm = None
+    if pickled is not None:
+        try:
+            dm = pickle.loads(pickled)
+        except Exception:
+            logger.warning('Ignoring invalid map cache for %s:\n%s' % (map_name, traceback.format_exc()))
+    if dm is None:
+        dm = _construct_map_from_yaml(data)
+        pickled = pickle.dumps(dm, protocol=pickle.HIGHEST_PROTOCOL)
+        _write_map_cache(key, pickled)
+
+    _maps_lru[key] = pickled
+    while len(_maps_lru) > MAPS_LRU_SIZE:
+        _maps_lru.popitem(last=False)
+    return dm
 
+
+def _construct_map_from_yaml(data: str):
+    yaml_data = yaml.load(data, Loader=yaml.SafeLoader)
     return construct_map(yaml_data)
 
 
+# number of maps kept in memory (pickled) by load_map()
+MAPS_LRU_SIZE = 16
+# number of maps kept on disk; the ones that were not used for the longest time are removed
+MAPS_CACHE_DIR_SIZE = 64
+_maps_lru = OrderedDict()
+
+
+def get_maps_cache_dir() -> Optional[str]:
+    """
+        Returns the directory for the cache of the maps, given by the environment
+        variable DUCKIETOWN_WORLD_CACHE_DIR (default: ~/.cache/duckietown-world/maps).
+
+        Returns None if the variable is set to the empty string,
+        which disables the cache on disk.
+
+        The cached maps become obsolete when the code changes; at most
+        MAPS_CACHE_DIR_SIZE files are kept, the least recently used are removed.
+    """
+    d = os.environ.get('DUCKIETOWN_WORLD_CACHE_DIR', None)
+    if d is None:
+        d = os.path.join(os.path.expanduser('~'), '.cache', 'duckietown-world', 'maps')
+    return d or None
+
+
+def _get_map_cache_key(data: str) -> str:
+    h = hashlib.sha256()
+    # the maps contain the paths of the textures
+    h.update(('%s %s %s %s\n' % (__version__, sys.version_info[:2], pickle.HIGHEST_PROTOCOL,
+                                  get_texture_dirs())).encode('utf-8'))
+    h.update(_get_code_hash().encode('utf-8'))
+    h.update(data.encode('utf-8'))
+    return h.hexdigest()
+
+
+_code_hash = None
+
+
+def _get_code_files() -> List[str]:
+    """ Returns the modules of the package, as paths relative to its directory. """
+    package_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    res = []
+    for dirpath, dirnames, filenames in os.walk(package_dir):
+        dirnames.sort()
+        for fn in sorted(filenames):
+            if fn.endswith('.py'):
+                res.append(os.path.relpath(os.path.join(dirpath, fn), package_dir))
+    return res
+
+
+def _get_code_hash() -> str:
+    """
+        Returns a hash of the tile templates and of the code of the package
+        (the maps contain objects of geo and seqs as well), so that the cached maps
+        are not used after they are edited. Computed once per process.
+    """
+    global _code_hash
+    if _code_hash is None:
+        h = hashlib.sha256()
+        h.update(tile_template.data.encode('utf-8'))
+        package_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        for fn in _get_code_files():
+            with open(os.path.join(package_dir, fn), 'rb') as f:
+                h.update(fn.encode('utf-8'))
+                h.update(f.read())
+        _code_hash = h.hexdigest()
+    return _code_hash
+
+
+def _read_map_cache(key: str) -> Optional[bytes]:
+    d = get_maps_cache_dir()
+    if d is None:
+        return None
+    fn = os.path.join(d, key + '.pickle')
+    if not os.path.exists(fn):
+        return None
+    try:
+        with open(fn, 'rb') as f:
+            pickled = f.read()
+        # for _prune_map_cache()
+        os.utime(fn)
+        return pickled
+    except FileNotFoundError:
+        # removed by another process
+        return None
+    except OSError:
+        logger.warning('Could not read map cache %s:\n%s' % (fn, traceback.format_exc()))
+        return None
+
+
+def _write_map_cache(key: str, pickled: bytes):
+    d = get_maps_cache_dir()
+    if d is None:
+        return
+    fn = os.path.join(d, key + '.pickle')
+    try:
+        if not os.path.exists(d):
+            os.makedirs(d, exist_ok=True)
+        tmp = '%s.%s.tmp' % (fn, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(pickled)
+        os.replace(tmp, fn)
+    except OSError:
+        logger.warning('Could not write map cache %s:\n%s' % (fn, traceback.format_exc()))
+        return
+    _prune_map_cache(d)
+
+
+def _prune_map_cache(d: str):
+    """ Removes the least recently used files, keeping MAPS_CACHE_DIR_SIZE. """
+    try:
+        fns = [os.path.join(d, _) for _ in os.listdir(d) if _.endswith('.pickle')]
+        if len(fns) <= MAPS_CACHE_DIR_SIZE:
+            return
+        mtimes = {}
+        for fn in fns:
+            try:
+                mtimes[fn] = os.path.getmtime(fn)
+            except FileNotFoundError:
+                pass
+        old = sorted(mtimes, key=lambda _: mtimes[_])[:len(mtimes) - MAPS_CACHE_DIR_SIZE]
+        for fn in old:
+            try:
+                os.remove(fn)
+            except FileNotFoundError:
+                pass
+    except OSError:
+        logger.warning('Could not prune map cache %s:\n%s' % (d, traceback.format_exc()))
+
+
 def construct_map(yaml_data: dict):
     tile_size = yaml_data['tile_size']
     dm = DuckietownMap(tile_size)
@@ -160,8 +328,10 @@ def construct_map(yaml_data: dict):
     else:
         raise ValueError(objects)
 
-    for it in list(iterate_by_class(tm, Tile)):
-        ob = it.object
+    # the tiles are children of the tile map; no need for the measurement graph
+    for ob in list(tm.children.values()):
+        if not isinstance(ob, Tile):
+            continue
         if 'slots' in ob.children:
             slots = ob.children['slots']
             for k, v in list(slots.children.items()):
@@ -275,13 +445,63 @@ def get_xy_slot(i):
     return x, y
 
 
+TEXTURE_SUFFIXES = ['', '_1', '_2', '_3', '_4']
+TEXTURE_EXTENSIONS = ['.jpg', '.png', '']
+
+# texture name -> path, built on first use by get_texture_index()
+_texture_index: Optional[Dict[str, str]] = None
+
+
+def get_texture_index() -> Dict[str, str]:
+    """
+        Returns the index from texture name to file, built by listing
+        the texture directories once per process.
+
+        Call refresh_texture_index() if the files change.
+    """
+    global _texture_index
+    if _texture_index is None:
+        t0 = time.perf_counter()
+        # name -> (priority, path); the priority is the order in which
+        # the directories, suffixes and extensions are tried
+        found = {}
+        nfiles = 0
+        for i, d in enumerate(get_texture_dirs()):
+            for entry in os.scandir(d):
+                nfiles += 1
+                for j, suffix in enumerate(TEXTURE_SUFFIXES):
+                    for k, ext in enumerate(TEXTURE_EXTENSIONS):
+                        ending = suffix + ext
+                        if not ending or (entry.name.endswith(ending) and len(entry.name) > len(ending)):
+                            name = entry.name[:len(entry.name) - len(ending)]
+                            priority = (i, j, k)
+                            if name not in found or priority < found[name][0]:
+                                found[name] = (priority, os.path.join(d, entry.name))
+        _texture_index = {name: path for name, (_, path) in found.items()}
+        logger.debug('Indexed %d texture files in %.1f ms.' % (nfiles, 1000 * (time.perf_counter() - t0)))
+    return _texture_index
+
+
+def refresh_texture_index():
+    """ Discards the texture index, so that it is built again on the next lookup. """
+    global _texture_index
+    _texture_index = None
+
+
 def get_texture_file(tex_name):
+    if os.sep not in tex_name:
+        try:
+            return get_texture_index()[tex_name]
+        except KeyError:
+            msg = 'Could not find any texture for %s' % tex_name
+            raise KeyError(msg)
+
+    # names with a directory are not in the index
     res = []
     tried = []
     for d in get_texture_dirs():
-        suffixes = ['', '_1', '_2', '_3', '_4']
-        for s in suffixes:
-            for ext in ['.jpg', '.png', '']:
+        for s in TEXTURE_SUFFIXES:
+            for ext in TEXTURE_EXTENSIONS:
                 path = os.path.join(d, tex_name + s + ext)
                 tried.append(path)
                 if os.path.exists(path):
@@ -1,7 +1,6 @@
 # coding=utf-8
 
 from duckietown_world import logger
-from duckietown_world.svg_drawing.misc import mime_from_fn, draw_axes
 
 from ..geo import PlacedObject
 
@@ -144,6 +143,7 @@ class Sign(PlacedObject):
         self.tag = tag
 
     def draw_svg(self, drawing, g):
+        from duckietown_world.svg_drawing.misc import data_encoded_for_src, draw_axes, mime_from_fn
         texture = self.get_name_texture()
         # x = -0.2
         CM = 0.01
@@ -172,8 +172,6 @@ class Sign(PlacedObject):
 
         else:
             texture = open(fn, 'rb').read()
-            from duckietown_world.world_duckietown.tile import data_encoded_for_src
-
             href = data_encoded_for_src(texture, mime_from_fn(fn))
 
             img = drawing.image(href=href,
@@ -1,9 +1,10 @@
 # coding=utf-8
 from dataclasses import dataclass
+from typing import List
 
 import numpy as np
 
-import geometry as geo
+from duckietown_world.utils.memoizing import memoized_method
 from duckietown_world.world_duckietown.dynamics_delay import ApplyDelay
 from .generic_kinematics import GenericKinematicsSE2
 from .platform_dynamics import PlatformDynamicsFactory
@@ -13,6 +14,7 @@ from .platform_dynamics import PlatformDynamicsFactory
 __all__ = [
     'DynamicModelParameters',
     'DynamicModel',
+    'DynamicModelEvaluator',
     'PWMCommands',
 ]
 
@@ -46,6 +48,112 @@ class DynamicModelParameters(PlatformDynamicsFactory):
     def initialize(self, c0, t0=0, seed=None) -> 'DynamicModel''':
         return DynamicModel(self, c0, t0)
 
+    def as_tuple(self) -> tuple:
+        return (self.u1, self.u2, self.u3, self.w1, self.w2, self.w3,
+                self.u_alpha_r, self.u_alpha_l, self.w_alpha_r, self.w_alpha_l)
+
+    def get_evaluator(self) -> 'DynamicModelEvaluator':
+        """ Returns the evaluator for these parameters (created again if they were changed). """
+        return self._get_evaluator(self.as_tuple())
+
+    @memoized_method(maxsize=1)
+    def _get_evaluator(self, values: tuple) -> 'DynamicModelEvaluator':
+        return DynamicModelEvaluator(values)
+
+
+def _clip(x, lower: float, upper: float):
+    if isinstance(x, np.ndarray):
+        return np.clip(x, lower, upper)
+    return min(max(x, lower), upper)
+
+
+class DynamicModelEvaluator(object):
+    """
+        The model of DynamicModel, with the parameters bound once.
+
+        All the methods work on Python floats or on arrays, which are broadcast together;
+        the parameters themselves can be arrays, one value per sample
+        (see from_parameters()).
+        The operations are the same for floats and arrays, so the results are equal.
+    """
+
+    # integration methods for step()
+    methods = ('euler', 'midpoint', 'rk4')
+
+    def __init__(self, values: tuple):
+        """ :param values: the parameters, in the order of DynamicModelParameters.as_tuple() """
+        self.values = tuple(values)
+        (self.u1, self.u2, self.u3, self.w1, self.w2, self.w3,
+         u_alpha_r, u_alpha_l, w_alpha_r, w_alpha_l) = self.values
+        # input matrix
+        self.B = ((u_alpha_r, u_alpha_l),
+                  (w_alpha_r, -w_alpha_l))
+
+    @classmethod
+    def from_parameters(cls, parameters: List[DynamicModelParameters]) -> 'DynamicModelEvaluator':
+        """ An evaluator whose parameters are arrays, with the i-th sample using parameters[i]. """
+        values = np.array([_.as_tuple() for _ in parameters], dtype='float64')
+        return cls(values.T)
+
+    def acceleration(self, u, w, motor_left, motor_right):
+        """
+            Returns the derivatives of the longitudinal and angular velocities u, w
+            given the PWM commands (which are clipped to [-1, 1]).
+        """
+        V0 = _clip(motor_right, -1, +1)
+        V1 = _clip(motor_left, -1, +1)
+        # nonlinear dynamics - autonomous response
+        f_dynamic0 = -self.u1 * u - self.u2 * w + self.u3 * w ** 2
+        f_dynamic1 = -self.w1 * w - self.w2 * u - self.w3 * u * w
+        # forced response
+        (b00, b01), (b10, b11) = self.B
+        f_forced0 = b00 * V0 + b01 * V1
+        f_forced1 = b10 * V0 + b11 * V1
+        return f_dynamic0 + f_forced0, f_dynamic1 + f_forced1
+
+    def step(self, u, w, motor_left, motor_right, dt: float, method: str = 'euler'):
+        """
+            Returns the velocities u, w after dt, holding the commands constant.
+
+            The method "euler" gives the same result as DynamicModel.integrate();
+            "midpoint" and "rk4" are more accurate for larger dt.
+        """
+        f = self.acceleration
+        du1, dw1 = f(u, w, motor_left, motor_right)
+        if method == 'euler':
+            return u + dt * du1, w + dt * dw1
+        h = dt / 2
+        du2, dw2 = f(u + h * du1, w + h * dw1, motor_left, motor_right)
+        if method == 'midpoint':
+            return u + dt * du2, w + dt * dw2
+        if method == 'rk4':
+            du3, dw3 = f(u + h * du2, w + h * dw2, motor_left, motor_right)
+            du4, dw4 = f(u + dt * du3, w + dt * dw3, motor_left, motor_right)
+            return (u + dt / 6 * (du1 + 2 * du2 + 2 * du3 + du4),
+                    w + dt / 6 * (dw1 + 2 * dw2 + 2 * dw3 + dw4))
+        msg = 'Unknown method %r; use one of %s.' % (method, ', '.join(self.methods))
+        raise ValueError(msg)
+
+    def simulate(self, u0, w0, motor_left, motor_right, dt: float, method: str = 'euler'):
+        """
+            Integrates the velocities for K steps.
+
+            :param motor_left, motor_right: the commands at each step; arrays of shape (K, ...)
+            :return: u, w, each of shape (K + 1, ...), starting with u0, w0
+        """
+        motor_left = np.asarray(motor_left, dtype='float64')
+        motor_right = np.asarray(motor_right, dtype='float64')
+        K = motor_left.shape[0]
+        u = np.asarray(u0, dtype='float64')
+        w = np.asarray(w0, dtype='float64')
+        shape = np.broadcast(u, w, motor_left[0], motor_right[0]).shape if K else np.broadcast(u, w).shape
+        us = np.zeros((K + 1,) + shape)
+        ws = np.zeros((K + 1,) + shape)
+        us[0], ws[0] = u, w
+        for k in range(K):
+            us[k + 1], ws[k + 1] = self.step(us[k], ws[k], motor_left[k], motor_right[k], dt, method)
+        return us, ws
+
 
 def get_DB18_nominal(delay: float) -> PlatformDynamicsFactory:
     ual = 1.5
@@ -83,61 +191,24 @@ class DynamicModel(GenericKinematicsSE2):
 
     @staticmethod
     def model(input: PWMCommands, parameters: DynamicModelParameters, u=None, w=None):
-        ## Unpack Inputs
-        U = np.array([input.motor_right, input.motor_left])
-        V = U.reshape(U.size, 1)
-        V = np.clip(V, -1, +1)
-        # parameters for autonomous dynamics
-        u1 = parameters.u1
-        u2 = parameters.u2
-        u3 = parameters.u3
-        w1 = parameters.w1
-        w2 = parameters.w2
-        w3 = parameters.w3
-        # parameters for forced dynamics
-        u_alpha_r = parameters.u_alpha_r
-        u_alpha_l = parameters.u_alpha_l
-        w_alpha_r = parameters.w_alpha_r
-        w_alpha_l = parameters.w_alpha_l
-
-        ## Calculate Dynamics
-        # nonlinear Dynamics - autonomous response
-        f_dynamic = np.array([
-            [-u1 * u - u2 * w + u3 * w ** 2],
-            [-w1 * w - w2 * u - w3 * u * w]
-        ])
-        # input Matrix
-        B = np.array([
-            [u_alpha_r, u_alpha_l],
-            [w_alpha_r, -w_alpha_l]
-        ])
-        # forced response
-        f_forced = np.matmul(B, V)
-        # acceleration
-        x_dot_dot = f_dynamic + f_forced
-
-        return x_dot_dot
+        """ Returns the derivatives of the velocities u, w as an array of shape (2, 1). """
+        x_dot_dot = parameters.get_evaluator().acceleration(u, w, input.motor_left, input.motor_right)
+        return np.array(x_dot_dot).reshape(2, 1)
 
     def integrate(self, dt: float, commands: PWMCommands) -> 'DynamicModel':
         # previous velocities (v0)
-        linear_angular_prev = geo.linear_angular_from_se2(self.v0)
-        linear_prev = linear_angular_prev[0]
-        longit_prev = linear_prev[0]
-        lateral_prev = linear_prev[1]
-        angular_prev = linear_angular_prev[1]
-
-        # predict the acceleration of the vehicle
-        x_dot_dot = self.model(commands, self.parameters, u=longit_prev, w=angular_prev)
-
-        # convert the acceleration to velocity by forward euler
-        longitudinal = longit_prev + dt * x_dot_dot[0]
-        angular = angular_prev + dt * x_dot_dot[1]
-        lateral = 0.0
-
-        linear = [longitudinal, lateral]
-
-        # represent this as se(2)
-        commands_se2 = geo.se2_from_linear_angular(linear, angular)
+        longit_prev = float(self.v0[0, 2])
+        angular_prev = float(self.v0[1, 0])
+
+        # the acceleration of the vehicle, converted to velocity by forward euler
+        evaluator = self.parameters.get_evaluator()
+        longitudinal, angular = evaluator.step(longit_prev, angular_prev,
+                                               commands.motor_left, commands.motor_right, dt)
+
+        # represent this as se(2) (with zero lateral velocity)
+        commands_se2 = np.array([[0.0, -angular, longitudinal],
+                                 [angular, 0.0, 0.0],
+                                 [0.0, 0.0, 0.0]])
 
         # call the "integrate" function of GenericKinematicsSE2
         s1 = GenericKinematicsSE2.integrate(self, dt, commands_se2)
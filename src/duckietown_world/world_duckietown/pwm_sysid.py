@@ -0,0 +1,198 @@
+# coding=utf-8
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from duckietown_world import logger
+from .batch_dynamics import BatchDynamicModel
+from .pwm_dynamics import DynamicModelParameters, get_DB18_nominal
+
+__all__ = [
+    'PWMLog',
+    'SysIdResult',
+    'PWM_PARAMETERS',
+    'rollout_parameters',
+    'evaluate_parameters',
+    'sample_parameters',
+    'fit_pwm_parameters',
+]
+
+# the fields of DynamicModelParameters, in the order of DynamicModelParameters.as_tuple()
+PWM_PARAMETERS = ('u1', 'u2', 'u3', 'w1', 'w2', 'w3', 'u_alpha_r', 'u_alpha_l', 'w_alpha_r', 'w_alpha_l')
+
+
+@dataclass
+class PWMLog:
+    """
+        A recorded trajectory of a robot driven with PWM commands.
+
+        The log is stored as arrays, which are cheap to send to a worker.
+    """
+    # shape (K + 1,)
+    timestamps: np.ndarray
+    # shape (K, 2): motor_left, motor_right, applied from timestamps[k] to timestamps[k + 1]
+    commands: np.ndarray
+    # shape (K + 1, 3): x, y, theta
+    poses: np.ndarray
+    # the initial longitudinal and angular velocities
+    v0: Tuple[float, float] = (0.0, 0.0)
+
+
+@dataclass
+class SysIdResult:
+    # the parameters with the smallest error
+    parameters: DynamicModelParameters
+    error: float
+    # the error of the parameters used as the starting point
+    nominal_error: float
+    # statistics of the residuals of the best parameters, along the log:
+    # rms_position, mean_position, max_position, final_position, rms_heading
+    residuals: Dict[str, float]
+    # the best error after each round
+    history: List[float]
+    # the number of parameter sets evaluated
+    nevaluated: int
+
+
+def _parameters_from_values(values: np.ndarray) -> List[DynamicModelParameters]:
+    return [DynamicModelParameters(*row) for row in values.tolist()]
+
+
+def _values_from_parameters(parameters: Sequence[DynamicModelParameters]) -> np.ndarray:
+    return np.array([_.as_tuple() for _ in parameters], dtype='float64').reshape(-1, len(PWM_PARAMETERS))
+
+
+def rollout_parameters(log: PWMLog, parameters: Sequence[DynamicModelParameters]) -> np.ndarray:
+    """
+        Simulates the commands of the log with each of the P parameter sets,
+        starting from the first pose of the log.
+
+        Returns the poses as an array of shape (K + 1, P, 3), with columns x, y, theta.
+    """
+    P = len(parameters)
+    x, y, theta = log.poses[0]
+    c, s = np.cos(theta), np.sin(theta)
+    q0 = np.array([[c, -s, x], [s, c, y], [0, 0, 1.0]])
+    u0, w0 = log.v0
+    state = BatchDynamicModel(list(parameters), np.tile(q0, (P, 1, 1)), np.array([u0, 0.0, w0]),
+                              float(log.timestamps[0]))
+    K = len(log.commands)
+    res = np.zeros((K + 1, P, 3))
+    for k in range(K + 1):
+        if k > 0:
+            dt = log.timestamps[k] - log.timestamps[k - 1]
+            state = state.integrate(dt, log.commands[k - 1])
+        q = state.q
+        res[k, :, 0] = q[:, 0, 2]
+        res[k, :, 1] = q[:, 1, 2]
+        res[k, :, 2] = np.arctan2(q[:, 1, 0], q[:, 0, 0])
+    return res
+
+
+def _residuals(log: PWMLog, poses: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Returns the position and heading errors, each of shape (K + 1, P). """
+    expected = log.poses[:, np.newaxis, :]
+    position = np.hypot(poses[:, :, 0] - expected[:, :, 0], poses[:, :, 1] - expected[:, :, 1])
+    delta = poses[:, :, 2] - expected[:, :, 2]
+    heading = np.arctan2(np.sin(delta), np.cos(delta))
+    return position, heading
+
+
+def _errors(log: PWMLog, values: np.ndarray, heading_weight: float) -> np.ndarray:
+    """ The error of each parameter set: the RMS, along the log, of the position (and heading) residuals. """
+    poses = rollout_parameters(log, _parameters_from_values(values))
+    position, heading = _residuals(log, poses)
+    return np.sqrt(np.mean(position ** 2 + heading_weight * heading ** 2, axis=0))
+
+
+def evaluate_parameters(log: PWMLog, parameters: Sequence[DynamicModelParameters],
+                        processes: Optional[int] = None, chunk_size: int = 512,
+                        heading_weight: float = 0.0) -> np.ndarray:
+    """
+        Returns the error of each parameter set on the log, as an array of shape (P,).
+
+        The parameter sets are simulated together, chunk_size at a time;
+        the chunks are distributed on a pool of processes.
+
+        :param processes: number of processes (default: number of CPUs);
+                          if 0, the chunks are evaluated in this process.
+        :param heading_weight: weight of the squared heading error (in rad^2),
+                               added to the squared position error
+    """
+    values = _values_from_parameters(parameters)
+    chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+    if not chunks:
+        return np.zeros(0)
+    if processes == 0 or len(chunks) == 1:
+        results = [_errors(log, _, heading_weight) for _ in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_errors, [log] * len(chunks), chunks, [heading_weight] * len(chunks)))
+    return np.concatenate(results)
+
+
+def sample_parameters(n: int, nominal: Optional[DynamicModelParameters] = None, spread: float = 0.2,
+                      fields: Sequence[str] = PWM_PARAMETERS, seed: Optional[int] = None) \
+        -> List[DynamicModelParameters]:
+    """
+        Returns n random parameter sets around the nominal ones
+        (by default, the ones of get_DB18_nominal()).
+
+        Each of the given fields is multiplied by (1 + spread * z), with z normally distributed;
+        the fields whose nominal value is 0 get the value spread * z instead.
+        The other fields keep the nominal value.
+    """
+    if nominal is None:
+        nominal = get_DB18_nominal(delay=0)
+    random = np.random.RandomState(seed)
+    values = np.tile(np.array(nominal.as_tuple(), dtype='float64'), (n, 1))
+    for field in fields:
+        j = PWM_PARAMETERS.index(field)
+        z = spread * random.standard_normal(n)
+        values[:, j] = values[:, j] * (1 + z) if values[0, j] != 0 else z
+    return _parameters_from_values(values)
+
+
+def fit_pwm_parameters(log: PWMLog, nominal: Optional[DynamicModelParameters] = None,
+                       n: int = 1000, rounds: int = 5, spread: float = 0.3, shrink: float = 0.5,
+                       fields: Sequence[str] = PWM_PARAMETERS, processes: Optional[int] = None,
+                       seed: Optional[int] = 0, heading_weight: float = 0.0) -> SysIdResult:
+    """
+        Fits the parameters of the PWM dynamics to a log, by random search.
+
+        Each round evaluates n parameter sets: the best set so far,
+        and n - 1 samples around it (see sample_parameters()).
+        After each round the spread is multiplied by shrink.
+
+        :param nominal: the starting point (default: get_DB18_nominal())
+        :param fields: the parameters to fit; the others keep their nominal value
+    """
+    if nominal is None:
+        nominal = get_DB18_nominal(delay=0)
+    random = np.random.RandomState(seed)
+
+    best = nominal
+    nominal_error = best_error = float(evaluate_parameters(log, [nominal], processes=0,
+                                                           heading_weight=heading_weight)[0])
+    history = []
+    nevaluated = 1
+    for r in range(rounds):
+        candidates = [best] + sample_parameters(n - 1, best, spread, fields, seed=random.randint(2 ** 31))
+        errors = evaluate_parameters(log, candidates, processes=processes, heading_weight=heading_weight)
+        nevaluated += len(candidates)
+        i = int(np.argmin(errors))
+        best, best_error = candidates[i], float(errors[i])
+        history.append(best_error)
+        logger.debug('round %d: error %.4f (spread %.3f)' % (r, best_error, spread))
+        spread *= shrink
+
+    position, heading = _residuals(log, rollout_parameters(log, [best]))
+    residuals = dict(rms_position=float(np.sqrt(np.mean(position ** 2))),
+                     mean_position=float(np.mean(position)),
+                     max_position=float(np.max(position)),
+                     final_position=float(position[-1, 0]),
+                     rms_heading=float(np.sqrt(np.mean(heading ** 2))))
+    return SysIdResult(parameters=best, error=best_error, nominal_error=nominal_error,
+                       residuals=residuals, history=history, nevaluated=nevaluated)
@@ -0,0 +1,242 @@
+# coding=utf-8
+import heapq
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from duckietown_world.geo import PlacedObject
+from duckietown_world.world_duckietown.types import SE2v
+from .lane_index import get_lane_poses_generic
+from .lane_segment import LaneSegment
+from .segmentify import SkeletonGraphResult, get_cached_skeleton_graph
+
+__all__ = [
+    'RoadNetwork',
+    'Route',
+    'get_road_network',
+]
+
+
+@dataclass
+class Route:
+    # length to travel along the lanes
+    distance: float
+    # the names of the lane segments (children of the skeleton "root2"), from the first to the last
+    lanes: List[str]
+
+
+class RoadNetwork(object):
+    """
+        The lane segments of the skeleton graph as a directed graph for routing.
+
+        The nodes are the meeting points of the skeleton graph and each lane segment
+        is an edge, weighted by its length. The edges leaving node i are
+        out_lanes[out_start[i]:out_start[i + 1]].
+
+        If there are at most all_pairs_max_nodes nodes, the distances between all
+        pairs of nodes and the first lane of each shortest path are computed
+        in advance (Floyd-Warshall), so a query only follows the table;
+        otherwise, each query runs an A* search.
+    """
+
+    all_pairs_max_nodes = 500
+
+    skeleton: SkeletonGraphResult
+    node_names: List[str]
+    lane_names: List[str]
+    lane2index: Dict[str, int]
+
+    def __init__(self, skeleton: SkeletonGraphResult, all_pairs_max_nodes: Optional[int] = None):
+        if all_pairs_max_nodes is not None:
+            self.all_pairs_max_nodes = all_pairs_max_nodes
+        self.skeleton = skeleton
+        G = skeleton.G
+
+        self.node_names = list(G.nodes)
+        node2index = {n: i for i, n in enumerate(self.node_names)}
+        N = len(self.node_names)
+        # shape (N, 2)
+        self.node_xy = np.array([G.nodes[n]['point'].p for n in self.node_names],
+                                dtype='float64').reshape((N, 2))
+
+        edges = sorted((data['lane'], node2index[a], node2index[b]) for a, b, data in G.edges(data=True))
+        self.lane_names = [_[0] for _ in edges]
+        self.lane2index = {l: e for e, l in enumerate(self.lane_names)}
+        E = len(edges)
+        # shape (E,)
+        self.lane_start = np.array([_[1] for _ in edges], dtype=int)
+        self.lane_end = np.array([_[2] for _ in edges], dtype=int)
+        self.lane_length = np.array([self.get_lane_segment(l).get_lane_length() for l in self.lane_names],
+                                    dtype='float64')
+
+        order = np.argsort(self.lane_start, kind='stable')
+        self.out_lanes = order
+        self.out_start = np.searchsorted(self.lane_start[order], np.arange(N + 1))
+
+        # (lane, end node, length) as Python values, for the searches
+        self._adjacency: List[List[Tuple[int, int, float]]] = [
+            [(e, int(self.lane_end[e]), float(self.lane_length[e]))
+             for e in order[self.out_start[i]:self.out_start[i + 1]].tolist()]
+            for i in range(N)]
+        self._node_xy = self.node_xy.tolist()
+        self._lane_start = self.lane_start.tolist()
+        self._lane_end = self.lane_end.tolist()
+
+        self.distance: Optional[np.ndarray] = None
+        self.first_lane: Optional[np.ndarray] = None
+        if 0 < N <= self.all_pairs_max_nodes:
+            self.distance, self.first_lane = self._all_pairs()
+            self._distance = self.distance.tolist()
+            self._first_lane = self.first_lane.tolist()
+
+    def __len__(self) -> int:
+        return len(self.node_names)
+
+    def get_lane_segment(self, lane: str) -> LaneSegment:
+        """ Returns the lane segment (in world coordinates) with the given name. """
+        return self.skeleton.root2.children[lane]
+
+    def _all_pairs(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+            Returns the distances between the nodes, shape (N, N), np.inf if there is no path,
+            and the first lane of the shortest paths, shape (N, N), -1 if there is none.
+        """
+        N = len(self)
+        distance = np.full((N, N), np.inf)
+        first_lane = np.full((N, N), -1, dtype=int)
+        for e in range(len(self.lane_names)):
+            i, j = self.lane_start[e], self.lane_end[e]
+            if self.lane_length[e] < distance[i, j]:
+                distance[i, j] = self.lane_length[e]
+                first_lane[i, j] = e
+        np.fill_diagonal(distance, 0.0)
+        np.fill_diagonal(first_lane, -1)
+        for k in range(N):
+            through_k = distance[:, k, np.newaxis] + distance[np.newaxis, k, :]
+            better = through_k < distance
+            distance = np.where(better, through_k, distance)
+            first_lane = np.where(better, first_lane[:, k, np.newaxis], first_lane)
+        return distance, first_lane
+
+    def _search(self, source: int, target: int, astar: bool) -> Optional[Tuple[float, List[int]]]:
+        """ Dijkstra, or A* using the straight-line distance, which is never more than the length of the lanes. """
+        adjacency = self._adjacency
+        xy = self._node_xy
+        tx, ty = xy[target]
+
+        def h(i):
+            if not astar:
+                return 0.0
+            x, y = xy[i]
+            return ((x - tx) ** 2 + (y - ty) ** 2) ** 0.5
+
+        best = {source: 0.0}
+        arrived_by = {source: -1}
+        queue = [(h(source), 0.0, source)]
+        done = set()
+        while queue:
+            _, d, i = heapq.heappop(queue)
+            if i in done:
+                continue
+            if i == target:
+                lanes = []
+                while i != source:
+                    e = arrived_by[i]
+                    lanes.append(e)
+                    i = self._lane_start[e]
+                return d, lanes[::-1]
+            done.add(i)
+            for e, j, length in adjacency[i]:
+                dj = d + length
+                if j not in done and dj < best.get(j, np.inf):
+                    best[j] = dj
+                    arrived_by[j] = e
+                    heapq.heappush(queue, (dj + h(j), dj, j))
+        return None
+
+    def shortest_path(self, source: int, target: int,
+                      method: Optional[str] = None) -> Optional[Tuple[float, List[int]]]:
+        """
+            Returns the length and the lanes (indices) of the shortest path between two nodes,
+            or None if there is none.
+
+            :param method: one of "table", "dijkstra", "astar"; by default,
+                           "table" if the table was computed, otherwise "astar".
+        """
+        if method is None:
+            method = 'table' if self.distance is not None else 'astar'
+        if method == 'table':
+            if self.distance is None:
+                msg = 'The all-pairs table was not computed for %d nodes.' % len(self)
+                raise ValueError(msg)
+            d = self._distance[source][target]
+            if d == np.inf:
+                return None
+            lanes = []
+            first_lane = self._first_lane
+            i = source
+            while i != target:
+                e = first_lane[i][target]
+                lanes.append(e)
+                i = self._lane_end[e]
+            return d, lanes
+        if method in ('dijkstra', 'astar'):
+            return self._search(source, target, astar=method == 'astar')
+        msg = 'Unknown method %r.' % method
+        raise ValueError(msg)
+
+    def route(self, lane0: str, along_lane0: float, lane1: str, along_lane1: float,
+              method: Optional[str] = None) -> Optional[Route]:
+        """
+            Returns the shortest route between two positions on the lanes,
+            or None if there is none.
+
+            :param lane0: the name of the lane segment
+            :param along_lane0: the position along it, between 0 and its length
+            :param method: as for shortest_path()
+        """
+        e0, e1 = self.lane2index[lane0], self.lane2index[lane1]
+        for e, along_lane in [(e0, along_lane0), (e1, along_lane1)]:
+            if not 0 <= along_lane <= self.lane_length[e]:
+                msg = 'Position %s outside the lane %s of length %s.' % (along_lane, self.lane_names[e],
+                                                                         self.lane_length[e])
+                raise ValueError(msg)
+
+        if e0 == e1 and along_lane0 <= along_lane1:
+            return Route(distance=float(along_lane1 - along_lane0), lanes=[lane0])
+
+        res = self.shortest_path(self._lane_end[e0], self._lane_start[e1], method)
+        if res is None:
+            return None
+        d, lanes = res
+        distance = float(self.lane_length[e0] - along_lane0) + d + along_lane1
+        return Route(distance=float(distance), lanes=[self.lane_names[_] for _ in [e0] + lanes + [e1]])
+
+    def locate(self, q: SE2v) -> Optional[Tuple[str, float]]:
+        """
+            Returns the lane segment containing the pose q, and the position along it;
+            None if the pose is not in a lane.
+            If there is more than one, the one whose center line is closest.
+        """
+        found = []
+        for r in get_lane_poses_generic(self.skeleton.root2, q):
+            lane = r.lane_segment_fqn[-1]
+            along_lane = min(max(r.lane_pose.along_lane, 0.0), float(self.lane_length[self.lane2index[lane]]))
+            found.append((abs(r.lane_pose.lateral), lane, along_lane))
+        if not found:
+            return None
+        _, lane, along_lane = min(found)
+        return lane, along_lane
+
+    def route_between_poses(self, q0: SE2v, q1: SE2v, method: Optional[str] = None) -> Optional[Route]:
+        """ Returns the shortest route between two poses, or None if they are not in a lane or there is none. """
+        p0, p1 = self.locate(q0), self.locate(q1)
+        if p0 is None or p1 is None:
+            return None
+        return self.route(p0[0], p0[1], p1[0], p1[1], method)
+
+
+def get_road_network(po: PlacedObject) -> RoadNetwork:
+    """ Returns the road network for the map (cached in the object, see PlacedObject.get_cached()). """
+    return po.get_cached('road_network', lambda: RoadNetwork(get_cached_skeleton_graph(po)))
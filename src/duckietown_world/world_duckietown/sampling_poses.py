@@ -1,47 +1,163 @@
 import random
+from dataclasses import dataclass
+from typing import List, Optional, Union
 
 import numpy as np
 
-import geometry as geo
-from duckietown_world import iterate_by_class, LaneSegment, IterateByTestResult, Tile, logger, PlacedObject, LanePose, \
-    SE2Transform
+from duckietown_world import iterate_by_class, LaneSegment, IterateByTestResult, Tile, PlacedObject, FQN
+from duckietown_world.geo import se2_fast
+from .transformations import is_static
 
-__all__ = ['sample_good_starting_pose']
+__all__ = [
+    'sample_good_starting_pose',
+    'PoseSampler',
+    'SampledPoses',
+    'get_pose_sampler',
+]
 
 
-# @dataclass
-# class SampledPose:
-#     # pose
-#     q: np.ndarray
-#     # pose as an SE2Transform
-#     qt: SE2Transform
-#     # corresponding  tile
-#     tile: Any
+@dataclass
+class SampledPoses:
+    # shape (N, 3, 3)
+    poses: np.ndarray
+    # shape (N,), index of the lane segment in PoseSampler.lane_segment_fqns
+    lanes: np.ndarray
+    # shape (N,)
+    along_lane: np.ndarray
 
 
-def sample_good_starting_pose(m: PlacedObject,
-                              only_straight: bool = True,
-                              along_lane: float = 0.2) -> np.ndarray:
-    """ Samples a good starting pose on a straight lane """
-    choices = list(iterate_by_class(m, LaneSegment))
+class PoseSampler(object):
+    """
+        Samples starting poses on the lane segments of a map.
+
+        The eligible lane segments, their poses in the world and their control points
+        are collected once, so that N poses can be drawn at once as arrays.
+        The lane segments are chosen with probability proportional to their length
+        (or uniformly, if weighted is False).
+        The lane segments whose pose depends on time (placed by a Sequence) are not eligible.
+
+        The poses are the same as the ones computed by LaneSegment.SE2Transform_from_lane_pose(),
+        composed with the pose of the lane segment, without the scale.
+    """
+
+    lane_segments: List[LaneSegment]
+    lane_segment_fqns: List[FQN]
+
+    def __init__(self, m: PlacedObject, only_straight: bool = True, weighted: bool = True,
+                 seed: Optional[int] = None):
+        self.random = np.random.RandomState(seed)
+        choices = [_ for _ in iterate_by_class(m, LaneSegment) if is_static(_.transform_sequence)]
+        if only_straight:
+            choices = [_ for _ in choices if is_straight(_)]
+
+        self.lane_segments = [_.object for _ in choices]
+        self.lane_segment_fqns = [_.fqn for _ in choices]
+        L = len(choices)
+        # shape (L, 3, 3)
+        self.matrix = np.array([_.transform_sequence.asmatrix2d().m for _ in choices],
+                               dtype='float64').reshape((L, 3, 3))
+        # shape (L,)
+        self.lengths = np.array([_.get_lane_length() for _ in self.lane_segments], dtype='float64')
+
+        # the pairs of consecutive control points of all the lane segments, one after the other;
+        # the ones of lane segment k are segment_start[k]:segment_start[k + 1]
+        q0, q1, cumulative, lengths = [], [], [], []
+        for ls in self.lane_segments:
+            points = [_.asmatrix2d().m for _ in ls.control_points]
+            q0.extend(points[:-1])
+            q1.extend(points[1:])
+            cumulative.extend(ls.get_cumulative_lengths()[:-1])
+            lengths.extend(ls.get_lane_lengths())
+        self.segment_start = np.cumsum([0] + [len(_.control_points) - 1 for _ in self.lane_segments])
+        self.segment_q0 = np.array(q0, dtype='float64').reshape((-1, 3, 3))
+        self.segment_q1 = np.array(q1, dtype='float64').reshape((-1, 3, 3))
+        # along_lane coordinate of the first control point of the pair, and length of the pair
+        self.segment_cumulative = np.array(cumulative, dtype='float64')
+        self.segment_lengths = np.array(lengths, dtype='float64')
+        # the lane segments laid one after the other, with a gap of 1 in between,
+        # so that all the pairs can be looked up with one call to searchsorted()
+        self.lane_offset = np.cumsum(np.concatenate(([0.0], self.lengths + 1)))[:-1]
+        lane_of_segment = np.repeat(np.arange(L), np.diff(self.segment_start))
+        self.segment_key = self.lane_offset[lane_of_segment] + self.segment_cumulative
+
+        if weighted and L > 0 and np.sum(self.lengths) > 0:
+            self.p = self.lengths / np.sum(self.lengths)
+        else:
+            self.p = None
 
-    if only_straight:
-        choices = [_ for _ in choices if is_straight(_)]
+    def __len__(self) -> int:
+        return len(self.lane_segments)
 
-    choice = random.choice(choices)
-    ls: LaneSegment = choice.object
+    def poses_at(self, lanes, along_lane, lateral=0.0, relative_heading=0.0) -> np.ndarray:
+        """
+            Returns the poses at the given lane coordinates, shape (N, 3, 3).
 
-    lp: LanePose = ls.lane_pose(along_lane, 0.0, 0.0)
-    rel: SE2Transform = ls.SE2Transform_from_lane_pose(lp)
+            :param lanes: indices of the lane segments, shape (N,)
+            :param along_lane: between 0 and the length of the lane segment;
+                               a scalar or an array of shape (N,); the same for lateral and relative_heading
+        """
+        lanes = np.asarray(lanes, dtype=int)
+        N = len(lanes)
+        along_lane = np.broadcast_to(np.asarray(along_lane, dtype='float64'), (N,))
+        if np.any(along_lane < 0) or np.any(along_lane > self.lengths[lanes]):
+            msg = 'The coordinate along_lane must be between 0 and the length of the lane segment.'
+            raise ValueError(msg)
 
-    m1 = choice.transform_sequence.asmatrix2d().m
-    m2 = rel.asmatrix2d().m
-    g = np.dot(m1, m2)
+        # the pair of control points, as in LaneSegment.beta_from_along_lane()
+        i = np.searchsorted(self.segment_key, self.lane_offset[lanes] + along_lane, side='right') - 1
+        i = np.clip(i, self.segment_start[lanes], self.segment_start[lanes + 1] - 1)
+        alpha = (along_lane - self.segment_cumulative[i]) / self.segment_lengths[i]
+        center_point = se2_fast.SE2_interpolate(self.segment_q0[i], self.segment_q1[i], alpha)
 
-    t, a, s = geo.translation_angle_scale_from_E2(g)
-    g = geo.SE2_from_translation_angle(t, a)
+        xytheta = np.zeros((N, 3))
+        xytheta[:, 1] = lateral
+        xytheta[:, 2] = relative_heading
+        rel = np.matmul(center_point, se2_fast.SE2_from_xytheta(xytheta))
+        g = np.matmul(self.matrix[lanes], rel)
 
-    return g
+        # remove the scale
+        xytheta = np.stack((g[:, 0, 2], g[:, 1, 2], np.arctan2(g[:, 1, 0], g[:, 0, 0])), axis=-1)
+        return se2_fast.SE2_from_xytheta(xytheta)
+
+    def sample_lanes(self, n: int) -> np.ndarray:
+        """ Returns the indices of n lane segments. """
+        if not self.lane_segments:
+            raise ValueError('There are no lane segments to sample from.')
+        return self.random.choice(len(self), size=n, p=self.p)
+
+    def sample(self, n: int, along_lane: Optional[Union[float, np.ndarray]] = None,
+               lateral=0.0, relative_heading=0.0) -> SampledPoses:
+        """
+            Samples n poses.
+
+            :param along_lane: if None, uniform along the lane segment
+        """
+        lanes = self.sample_lanes(n)
+        if along_lane is None:
+            along_lane = self.random.uniform(0, 1, size=n) * self.lengths[lanes]
+        along_lane = np.array(np.broadcast_to(np.asarray(along_lane, dtype='float64'), (n,)))
+        poses = self.poses_at(lanes, along_lane, lateral, relative_heading)
+        return SampledPoses(poses=poses, lanes=lanes, along_lane=along_lane)
+
+
+def get_pose_sampler(m: PlacedObject, only_straight: bool = True) -> PoseSampler:
+    """
+        Returns the pose sampler for the map, with lanes chosen uniformly
+        (cached in the object, see PlacedObject.get_cached()).
+    """
+    return m.get_cached(('pose_sampler', only_straight),
+                        lambda: PoseSampler(m, only_straight=only_straight, weighted=False))
+
+
+def sample_good_starting_pose(m: PlacedObject,
+                              only_straight: bool = True,
+                              along_lane: float = 0.2) -> np.ndarray:
+    """ Samples a good starting pose on a straight lane """
+    sampler = get_pose_sampler(m, only_straight)
+    if not len(sampler):
+        raise ValueError('There are no lane segments to sample from.')
+    k = random.randrange(len(sampler))
+    return sampler.poses_at([k], along_lane)[0]
 
 
 def is_straight(choice: IterateByTestResult):
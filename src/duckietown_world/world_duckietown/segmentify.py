@@ -19,6 +19,7 @@ class SkeletonGraphResult:
 
 __all__ = [
     'get_skeleton_graph',
+    'get_cached_skeleton_graph',
     'SkeletonGraphResult',
 ]
 
@@ -163,6 +164,16 @@ def get_skeleton_graph(po):
     return SkeletonGraphResult(root=root, root2=root2, G=G)
 
 
+def get_cached_skeleton_graph(po: PlacedObject) -> SkeletonGraphResult:
+    """
+        As get_skeleton_graph(), but the result is cached in the object
+        until the map is modified (see PlacedObject.get_cached()).
+
+        The result is shared between the callers, so it must not be modified.
+    """
+    return po.get_cached('skeleton_graph', lambda: get_skeleton_graph(po))
+
+
 def transform_lane_segment(lane_segment, transformation):
     M = transformation.m
 
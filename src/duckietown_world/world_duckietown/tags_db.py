@@ -3,7 +3,7 @@ import os
 import yaml
 from duckietown_serialization_ds1 import Serializable
 from duckietown_world import PlacedObject, logger
-from duckietown_world.utils import memoized_reset
+from duckietown_world.utils import memoized_function
 
 __all__ = [
     'get_apriltagsDB_raw',
@@ -70,7 +70,7 @@ class FloorTag(PlacedObject):
         self.tag.draw_svg(drawing, g)
 
 
-@memoized_reset
+@memoized_function
 def get_apriltagsDB_raw():
     abs_path_module = os.path.realpath(__file__)
     module_dir = os.path.dirname(abs_path_module)
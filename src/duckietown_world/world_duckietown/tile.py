@@ -6,10 +6,9 @@ import numpy as np
 
 from contracts import contract
 from duckietown_world import logger
-from duckietown_world.geo import PlacedObject, RectangularArea, TransformSequence, Matrix2D, SE2Transform, Transform
+from duckietown_world.geo import PlacedObject, RectangularArea, TransformSequence, Matrix2D, SE2Transform, Transform, \
+    se2_fast
 from duckietown_world.seqs import SampledSequence
-from duckietown_world.svg_drawing import data_encoded_for_src, draw_axes, draw_children
-from duckietown_world.svg_drawing.misc import mime_from_fn
 from duckietown_world.world_duckietown.types import SE2v
 from geometry import extract_pieces
 
@@ -54,6 +53,7 @@ class SignSlot(PlacedObject):
                             stroke_width="0.005",
                             stroke="pink", )
         g.add(rect)
+        from duckietown_world.svg_drawing import draw_axes
         draw_axes(drawing, g, 0.04)
 
 
@@ -111,7 +111,7 @@ class Tile(PlacedObject):
 
     def _copy(self):
         return type(self)(self.kind, self.drivable,
-                          children=dict(**self.children), spatial_relations=dict(**self.spatial_relations))
+                          children=dict(self.children), spatial_relations=dict(self.spatial_relations))
 
     def params_to_json_dict(self):
         return dict(kind=self.kind, drivable=self.drivable)
@@ -120,6 +120,9 @@ class Tile(PlacedObject):
         return RectangularArea([-0.5, -0.5], [0.5, 0.5])
 
     def draw_svg(self, drawing, g):
+        from duckietown_world.svg_drawing import data_encoded_for_src, draw_axes, draw_children
+        from duckietown_world.svg_drawing.misc import mime_from_fn
+
         T = 0.562 / 0.585
         S = 1.0
         rect = drawing.rect(insert=(-S / 2, -S / 2),
@@ -155,57 +158,55 @@ class Tile(PlacedObject):
         draw_children(drawing, self, g)
 
 
-def get_lane_poses(dw, q: SE2v, tol=0.000001):
-    from duckietown_world.geo.measurements_utils import iterate_by_class, IterateByTestResult
-    from .lane_segment import LaneSegment
-    from duckietown_world import TileCoords
-
-    for it in iterate_by_class(dw, Tile):
-        assert isinstance(it, IterateByTestResult), it
-        assert isinstance(it.object, Tile), it.object
-        tile = it.object
-        tile_fqn = it.fqn
-        tile_transform = it.transform_sequence
-        for _ in tile_transform.transforms:
-            if isinstance(_, TileCoords):
-                tile_coords = _
-                break
-        else:
-            msg = 'Could not find tile coords in %s' % tile_transform
-            assert False, msg
-        # print('tile_transform: %s' % tile_transform.asmatrix2d().m)
-        tile_relative_pose = relative_pose(tile_transform.asmatrix2d().m, q)
+def get_lane_poses(dw, q: SE2v, tol=0.000001, tile_index=None):
+    """
+        Yields a GetLanePoseResult for each lane that contains the pose q.
+
+        The candidate tiles are looked up in the tile index,
+        which is computed using get_tile_index() if not given.
+        Within a tile, the lane segments whose bounding box does not contain
+        the point are skipped; see LaneGeometryCache.
+    """
+    from .tile_index import get_tile_index, TileIndex
+
+    if tile_index is None:
+        tile_index = get_tile_index(dw)
+    assert isinstance(tile_index, TileIndex), tile_index
+    geometry = tile_index.lane_geometry
+
+    x, y = float(q[0, 2]), float(q[1, 2])
+    for entry in tile_index.get_tiles_at((x, y)):
+        tile = entry.tile
+        tile_fqn = entry.tile_fqn
+        tile_transform = entry.tile_transform
+        tile_coords = entry.tile_coords
+        tile_relative_pose = np.dot(entry.tile_matrix_inv, q)
         p = translation_from_O3(tile_relative_pose)
         # print('tile_relative_pose: %s' % tile_relative_pose)
         if not tile.get_footprint().contains(p):
             continue
         nresults = 0
-        for it2 in iterate_by_class(tile, LaneSegment):
-            lane_segment = it2.object
-            lane_segment_fqn = tile_fqn + it2.fqn
-            assert isinstance(lane_segment, LaneSegment), lane_segment
-            lane_segment_wrt_tile = it2.transform_sequence.asmatrix2d()
-            lane_segment_relative_pose = relative_pose(lane_segment_wrt_tile.m, tile_relative_pose)
-            lane_segment_transform = TransformSequence(tile_transform.transforms + it2.transform_sequence.transforms)
+        for tls in entry.lane_segments:
+            k = tls.geometry_index
+            if not geometry.bbox_contains(k, x, y):
+                continue
+            lane_segment = tls.lane_segment
+            lane_segment_relative_pose = np.dot(geometry.matrix_inv[k], q)
             lane_pose = lane_segment.lane_pose_from_SE2(lane_segment_relative_pose, tol=tol)
 
-            M = lane_segment_transform.asmatrix2d().m
-            center_point = lane_pose.center_point.as_SE2()
-
-            center_point_abs = np.dot(M, center_point)
-            center_point_abs_t = Matrix2D(center_point_abs)
-
             if lane_pose.along_inside and lane_pose.inside and lane_pose.correct_direction:
+                center_point = lane_pose.center_point.as_SE2()
+                center_point_abs = np.dot(geometry.matrix[k], center_point)
                 yield GetLanePoseResult(tile=tile, tile_fqn=tile_fqn,
                                         tile_transform=tile_transform,
                                         tile_relative_pose=Matrix2D(tile_relative_pose),
                                         lane_segment=lane_segment,
                                         lane_segment_relative_pose=Matrix2D(lane_segment_relative_pose),
                                         lane_pose=lane_pose,
-                                        lane_segment_fqn=lane_segment_fqn,
-                                        lane_segment_transform=lane_segment_transform,
+                                        lane_segment_fqn=tls.lane_segment_fqn,
+                                        lane_segment_transform=tls.lane_segment_transform,
                                         tile_coords=tile_coords,
-                                        center_point=center_point_abs_t)
+                                        center_point=Matrix2D(center_point_abs))
                 nresults += 1
 
         # if nresults == 0:
@@ -232,18 +233,20 @@ def translation_from_O3(pose) -> np.ndarray:
 def relative_pose(base, pose):
     assert isinstance(base, np.ndarray), base
     assert isinstance(pose, np.ndarray), pose
-    return np.dot(np.linalg.inv(base), pose)
+    return np.dot(se2_fast.E2_inverse(base), pose)
 
 
 class GetClosestLane(object):
     def __init__(self, dw):
+        from .tile_index import get_tile_index
         self.no_matches_for = []
         self.dw = dw
+        self.tile_index = get_tile_index(dw)
 
     def __call__(self, transform):
         if isinstance(transform, SE2Transform):
             transform = transform.as_SE2()
-        poses = list(get_lane_poses(self.dw, transform))
+        poses = list(get_lane_poses(self.dw, transform, tile_index=self.tile_index))
         # if not poses:
         #     self.no_matches_for.append(transform)
         #     return None
@@ -261,6 +264,7 @@ class Anchor(PlacedObject):
         return self._simplecopy()
 
     def draw_svg(self, drawing, g):
+        from duckietown_world.svg_drawing import draw_axes
         draw_axes(drawing, g, klass='anchor-axes')
         c = drawing.circle(center=(0, 0), r=0.03,
                            fill='blue', stroke='black', stroke_width=0.001)
@@ -0,0 +1,252 @@
+# coding=utf-8
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from duckietown_world.geo import PlacedObject, TransformSequence, FQN, se2_fast
+from duckietown_world.geo.measurements_utils import iterate_by_class
+from .lane_geometry import LaneGeometryCache, get_lane_geometry_cache
+from .lane_segment import LaneSegment
+from .tile import Tile
+from .tile_coords import TileCoords
+
+__all__ = [
+    'TileIndex',
+    'TileIndexEntry',
+    'TileLaneSegment',
+    'get_tile_index',
+]
+
+
+@dataclass
+class TileLaneSegment:
+    # position in TileIndex.lane_segments
+    index: int
+    lane_segment: LaneSegment
+    # FQN with respect to the root
+    lane_segment_fqn: FQN
+    # position in LaneGeometryCache.lane_segments
+    geometry_index: int
+    # pose of the lane segment with respect to the tile, and its inverse
+    lane_segment_wrt_tile: np.ndarray
+    lane_segment_wrt_tile_inv: np.ndarray
+    # pose of the lane segment with respect to the root
+    lane_segment_transform: TransformSequence
+    lane_segment_matrix: np.ndarray
+
+
+@dataclass
+class TileIndexEntry:
+    tile: Tile
+    tile_fqn: FQN
+    tile_transform: TransformSequence
+    tile_coords: TileCoords
+    # inverse of the pose of the tile with respect to the root
+    tile_matrix_inv: np.ndarray
+    lane_segments: List[TileLaneSegment]
+    # position in the order given by iterate_by_class()
+    order: int
+
+
+@dataclass
+class TileGrid:
+    # inverse of the pose of the tile map frame with respect to the root
+    frame_inv: np.ndarray
+    ij2entries: Dict[Tuple[int, int], List[TileIndexEntry]]
+
+
+@dataclass
+class TileGridArrays:
+    frame_inv: np.ndarray
+    # coordinates of the cell cells[0, 0]
+    i0: int
+    j0: int
+    # shape (ni, nj, K): indices of the tiles in each cell, padded with -1
+    cells: np.ndarray
+
+
+@dataclass
+class TileIndexArrays:
+    """ The content of a TileIndex as arrays, for vectorized queries. """
+    # shape (T, 3, 3)
+    tile_matrix_inv: np.ndarray
+    # shape (T, 2): footprint of the tiles
+    footprint_min: np.ndarray
+    footprint_max: np.ndarray
+    # shape (T,): the lane segments of tile t are
+    # tile_lanes_start[t]:tile_lanes_start[t] + tile_lanes_count[t]
+    tile_lanes_start: np.ndarray
+    tile_lanes_count: np.ndarray
+    # shape (L, 3, 3)
+    lane_wrt_tile_inv: np.ndarray
+    # shape (L,): index in lane_segment_objects
+    lane_object: np.ndarray
+    # the distinct LaneSegment objects (the templates are shared among tiles)
+    lane_segment_objects: List[LaneSegment]
+    grids: List[TileGridArrays]
+    # indices of the tiles to check for every query
+    others: np.ndarray
+
+
+class TileIndex(object):
+    """
+        A grid index over the tiles contained in a world.
+
+        The poses of the lane segments are taken from the LaneGeometryCache
+        of the world (available as the attribute lane_geometry).
+
+        For each tile map, a point is converted to the tile map frame;
+        the cell containing it is then found in constant time.
+
+        Tiles whose placement is not a plain TileCoords are kept aside
+        and checked for every query.
+    """
+
+    # tolerance (in tile units) used to also return the neighbors
+    # of points lying on the boundary between tiles
+    eps = 1e-6
+
+    def __init__(self, root: PlacedObject):
+        self.entries = []
+        self.lane_segments = []
+        self.grids = []
+        self.others = []
+        self._arrays = None
+        self.lane_geometry: LaneGeometryCache = get_lane_geometry_cache(root)
+
+        fqn2grid = defaultdict(lambda: TileGrid(frame_inv=None, ij2entries=defaultdict(list)))
+        for order, it in enumerate(iterate_by_class(root, Tile)):
+            tile = it.object
+            tile_transform = it.transform_sequence
+            for k, _ in enumerate(tile_transform.transforms):
+                if isinstance(_, TileCoords):
+                    tile_coords = _
+                    break
+            else:
+                msg = 'Could not find tile coords in %s' % tile_transform
+                assert False, msg
+
+            tile_matrix_inv = se2_fast.E2_inverse(tile_transform.asmatrix2d().m)
+
+            lane_segments = []
+            for it2 in iterate_by_class(tile, LaneSegment):
+                lane_segment_fqn = it.fqn + it2.fqn
+                geometry_index = self.lane_geometry.fqn2index[lane_segment_fqn]
+                lane_segment_wrt_tile = it2.transform_sequence.asmatrix2d().m
+                lane_segment_transform = TransformSequence(tile_transform.transforms +
+                                                           it2.transform_sequence.transforms)
+                tls = TileLaneSegment(index=len(self.lane_segments),
+                                      lane_segment=it2.object,
+                                      lane_segment_fqn=lane_segment_fqn,
+                                      geometry_index=geometry_index,
+                                      lane_segment_wrt_tile=lane_segment_wrt_tile,
+                                      lane_segment_wrt_tile_inv=se2_fast.E2_inverse(lane_segment_wrt_tile),
+                                      lane_segment_transform=lane_segment_transform,
+                                      lane_segment_matrix=self.lane_geometry.matrix[geometry_index])
+                lane_segments.append(tls)
+                self.lane_segments.append(tls)
+
+            entry = TileIndexEntry(tile=tile, tile_fqn=it.fqn, tile_transform=tile_transform,
+                                   tile_coords=tile_coords, tile_matrix_inv=tile_matrix_inv,
+                                   lane_segments=lane_segments, order=order)
+            self.entries.append(entry)
+
+            if k != len(tile_transform.transforms) - 1:
+                self.others.append(entry)
+                continue
+
+            grid = fqn2grid[it.fqn[:-1]]
+            if grid.frame_inv is None:
+                frame = TransformSequence(tile_transform.transforms[:k]).asmatrix2d().m if k else np.eye(3)
+                grid.frame_inv = se2_fast.E2_inverse(frame)
+            grid.ij2entries[(tile_coords.i, tile_coords.j)].append(entry)
+
+        self.grids = list(fqn2grid.values())
+
+    def get_tiles_at(self, p) -> List[TileIndexEntry]:
+        """
+            Returns the tiles that might contain the point p,
+            in the same order as iterate_by_class().
+
+            The caller still has to check the footprint of the tile.
+        """
+        found = list(self.others)
+        eps = self.eps
+        for grid in self.grids:
+            u = np.dot(grid.frame_inv, [p[0], p[1], 1.0])
+            i0, i1 = int(math.floor(u[0] - eps)), int(math.floor(u[0] + eps))
+            j0, j1 = int(math.floor(u[1] - eps)), int(math.floor(u[1] + eps))
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    found.extend(grid.ij2entries.get((i, j), ()))
+
+        if len(found) > 1:
+            found.sort(key=lambda _: _.order)
+        return found
+
+    def get_arrays(self) -> TileIndexArrays:
+        """ Returns the index as arrays (computed on the first call). """
+        if self._arrays is None:
+            self._arrays = self._get_arrays()
+        return self._arrays
+
+    def _get_arrays(self) -> TileIndexArrays:
+        T = len(self.entries)
+        tile_matrix_inv = np.zeros((T, 3, 3))
+        footprint_min = np.zeros((T, 2))
+        footprint_max = np.zeros((T, 2))
+        tile_lanes_start = np.zeros(T, dtype=int)
+        tile_lanes_count = np.zeros(T, dtype=int)
+        for t, entry in enumerate(self.entries):
+            tile_matrix_inv[t] = entry.tile_matrix_inv
+            footprint = entry.tile.get_footprint()
+            footprint_min[t] = footprint.pmin
+            footprint_max[t] = footprint.pmax
+            tile_lanes_count[t] = len(entry.lane_segments)
+            if entry.lane_segments:
+                tile_lanes_start[t] = entry.lane_segments[0].index
+
+        L = len(self.lane_segments)
+        lane_wrt_tile_inv = np.zeros((L, 3, 3))
+        lane_object = np.zeros(L, dtype=int)
+        lane_segment_objects = []
+        id2object = {}
+        for tls in self.lane_segments:
+            lane_wrt_tile_inv[tls.index] = tls.lane_segment_wrt_tile_inv
+            k = id(tls.lane_segment)
+            if k not in id2object:
+                id2object[k] = len(lane_segment_objects)
+                lane_segment_objects.append(tls.lane_segment)
+            lane_object[tls.index] = id2object[k]
+
+        grids = []
+        for grid in self.grids:
+            ijs = np.array(list(grid.ij2entries), dtype=int).reshape(-1, 2)
+            i0, j0 = ijs.min(axis=0)
+            ni, nj = ijs.max(axis=0) - (i0, j0) + 1
+            K = max(len(_) for _ in grid.ij2entries.values())
+            cells = np.full((ni, nj, K), -1, dtype=int)
+            for (i, j), entries in grid.ij2entries.items():
+                for k, entry in enumerate(entries):
+                    cells[i - i0, j - j0, k] = entry.order
+            grids.append(TileGridArrays(frame_inv=grid.frame_inv, i0=int(i0), j0=int(j0), cells=cells))
+
+        others = np.array([_.order for _ in self.others], dtype=int)
+        return TileIndexArrays(tile_matrix_inv=tile_matrix_inv,
+                               footprint_min=footprint_min,
+                               footprint_max=footprint_max,
+                               tile_lanes_start=tile_lanes_start,
+                               tile_lanes_count=tile_lanes_count,
+                               lane_wrt_tile_inv=lane_wrt_tile_inv,
+                               lane_object=lane_object,
+                               lane_segment_objects=lane_segment_objects,
+                               grids=grids,
+                               others=others)
+
+
+def get_tile_index(root: PlacedObject) -> TileIndex:
+    """ Returns the tile index for the world (cached in the object, see PlacedObject.get_cached()). """
+    return root.get_cached('tile_index', lambda: TileIndex(root))
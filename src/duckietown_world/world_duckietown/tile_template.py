@@ -4,7 +4,7 @@ import yaml
 from duckietown_serialization_ds1 import Serializable
 
 
-from duckietown_world.utils.memoizing import memoized_reset
+from duckietown_world.utils.memoizing import memoized_function
 
 # language=yaml
 data = """
@@ -134,7 +134,7 @@ curve_left: &curve_left
 """
 
 
-@memoized_reset
+@memoized_function
 def load_tile_types():
     s = yaml.load(data, Loader=yaml.SafeLoader)
     templates = Serializable.from_json_dict(s)
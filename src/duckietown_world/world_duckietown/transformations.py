@@ -1,8 +1,13 @@
 # coding=utf-8
-from duckietown_world import Sequence, TransformSequence
+from typing import Dict
+
+from duckietown_world import Sequence, TransformSequence, PlacedObject, SpatialRelation
+from duckietown_world.seqs import UndefinedAtTime
 
 __all__ = [
     'ChooseTime',
+    'TimeSnapshots',
+    'get_time_snapshots',
     # 'RemoveVariable',
     # 'RemoveStatic',
     'get_sampling_points',
@@ -19,6 +24,67 @@ class ChooseTime(object):
             return ob
         else:
             return ob
+
+
+class TimeSnapshots(object):
+    """
+        Gives the same result as root.filter_all(ChooseTime(t)),
+        without visiting the whole tree for each t.
+
+        The objects that have a relation given by a Sequence,
+        or such a descendant, are found once. For each t, only those are copied;
+        the other subtrees are shared by reference with the original tree.
+    """
+
+    def __init__(self, root: PlacedObject):
+        self.root = root
+        # id() of the objects that change with time
+        self.varying = set()
+        self._find_varying(root)
+
+    def _find_varying(self, po: PlacedObject) -> bool:
+        varying = False
+        for child in po.children.values():
+            # not short-circuited: all the subtree is visited
+            varying = self._find_varying(child) or varying
+        if any(isinstance(sr.transform, Sequence) for sr in po.spatial_relations.values()):
+            varying = True
+        if varying:
+            self.varying.add(id(po))
+        return varying
+
+    def at(self, t) -> PlacedObject:
+        """ Returns the tree at time t. """
+        return self._snapshot(self.root, t)
+
+    def _snapshot(self, po: PlacedObject, t) -> PlacedObject:
+        if id(po) not in self.varying:
+            return po
+
+        children = {}
+        for child_name, child in po.children.items():
+            children[child_name] = self._snapshot(child, t)
+
+        spatial_relations: Dict[str, SpatialRelation] = {}
+        for sr_name, sr in po.spatial_relations.items():
+            if isinstance(sr.transform, Sequence):
+                try:
+                    transform = sr.transform.at(t)
+                except UndefinedAtTime:
+                    continue
+                sr = SpatialRelation(sr.a, transform, sr.b)
+            spatial_relations[sr_name] = sr
+
+        x = po._copy()
+        x.children = children
+        x.spatial_relations = spatial_relations
+        return x
+
+
+def get_time_snapshots(root: PlacedObject) -> TimeSnapshots:
+    """ Returns the TimeSnapshots for the tree (cached in the object, see PlacedObject.get_cached()). """
+    return root.get_cached('time_snapshots', lambda: TimeSnapshots(root))
+
 #
 #
 # class RemoveVariable(object):
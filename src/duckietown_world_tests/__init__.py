@@ -8,6 +8,12 @@ from .tags import *
 from .world_building import *
 from .sampling_poses import *
 from .pwm_dynamics import *
+from .sequences import *
+from .batch_evaluation import *
+from .startup import *
+from .transforms import *
+from .memoizing import *
+from .rules import *
 #
 # def jobs_comptests(context):
 #     # instantiation
@@ -0,0 +1,100 @@
+# coding=utf-8
+import json
+import os
+
+import numpy as np
+from comptests import comptest, run_module_tests, get_comptests_output_dir
+
+import geometry as geo
+from duckietown_world import SE2Transform
+from duckietown_world.rules import EpisodeJob, evaluate_episodes, evaluate_rules, evaluate_episodes_main, \
+    IncrementalRulesEvaluator
+from duckietown_world.seqs import SampledSequence
+from duckietown_world.world_duckietown.map_loading import load_map
+
+
+def random_walk(seed, n=50):
+    np.random.seed(seed)
+    q = geo.SE2_from_translation_angle([1.8, 0.7], 0.3)
+    timestamps = []
+    poses = []
+    for i in range(n):
+        timestamps.append(i * 0.1)
+        poses.append(SE2Transform.from_SE2(q))
+        q = geo.SE2.multiply(q, geo.SE2_from_translation_angle([0.02, 0], np.random.uniform(-0.2, 0.3)))
+    return SampledSequence[SE2Transform](timestamps, poses)
+
+
+@comptest
+def batch_evaluation():
+    sequences = [random_walk(i) for i in range(3)]
+    jobs = [EpisodeJob.from_sequence('udem1', _, name='ep%d' % i) for i, _ in enumerate(sequences)]
+    jobs.append(EpisodeJob('not-a-map', np.zeros(1), np.zeros((1, 3)), name='invalid'))
+
+    results = list(evaluate_episodes(jobs, processes=2))
+    assert sorted(_.index for _ in results) == [0, 1, 2, 3]
+    results = sorted(results, key=lambda _: _.index)
+    assert results[3].error is not None
+
+    for sequence, res in zip(sequences, results):
+        assert res.error is None, res.error
+        dw = load_map('udem1')
+        interval = SampledSequence.from_iterator(enumerate(sequence.timestamps))
+        evaluated = evaluate_rules(poses_sequence=sequence, interval=interval, world=dw, ego_name='ego')
+        expected = {}
+        for k, rer in evaluated.items():
+            for km, em in rer.metrics.items():
+                expected["/".join((k,) + km)] = em.total
+        assert sorted(expected) == sorted(res.totals)
+        for k, v in expected.items():
+            np.testing.assert_allclose(res.totals[k], v, err_msg=k)
+
+    in_process = sorted(evaluate_episodes(jobs[:3], processes=0), key=lambda _: _.index)
+    assert [_.totals for _ in in_process] == [_.totals for _ in results[:3]]
+
+    # command line
+    outdir = get_comptests_output_dir()
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    fn = os.path.join(outdir, 'episodes.jsonl')
+    with open(fn, 'w') as f:
+        for job in jobs[:2]:
+            d = dict(map_name=job.map_name, name=job.name,
+                     timestamps=job.timestamps.tolist(), poses=job.poses.tolist())
+            f.write(json.dumps(d) + '\n')
+    out = os.path.join(outdir, 'results.jsonl')
+    evaluate_episodes_main(['--processes', '0', '--output', out, fn])
+    with open(out) as f:
+        lines = [json.loads(_) for _ in f]
+    assert [_['totals'] for _ in lines] == [_.totals for _ in results[:2]]
+
+
+@comptest
+def incremental_rules():
+    sequence = random_walk(5, n=60)
+    dw = load_map('udem1')
+    evaluator = IncrementalRulesEvaluator(dw)
+    for i, (t, pose) in enumerate(sequence):
+        current = evaluator.update(t, pose)
+
+        if i in [2, 20, len(sequence) - 1]:
+            prefix = SampledSequence[SE2Transform](sequence.timestamps[:i + 1], sequence.values[:i + 1])
+            interval = SampledSequence.from_iterator(enumerate(prefix.timestamps))
+            evaluated = evaluate_rules(poses_sequence=prefix, interval=interval,
+                                       world=load_map('udem1'), ego_name='ego')
+            assert list(evaluated) == list(current)
+            for k, rer in evaluated.items():
+                assert sorted(rer.metrics) == sorted(current[k])
+                for km, em in rer.metrics.items():
+                    np.testing.assert_allclose(current[k][km], em.total, err_msg=str((i, k, km)))
+
+    try:
+        evaluator.update(sequence.timestamps[-1], sequence.values[-1])
+    except ValueError:
+        pass
+    else:
+        raise Exception()
+
+
+if __name__ == '__main__':
+    run_module_tests()
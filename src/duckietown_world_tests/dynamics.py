@@ -7,6 +7,9 @@ import geometry as geo
 from duckietown_world.world_duckietown import Integrator2D, GenericKinematicsSE2
 from duckietown_world.world_duckietown.differential_drive_dynamics import DifferentialDriveDynamicsParameters, \
     WheelVelocityCommands
+from duckietown_world.world_duckietown.batch_dynamics import BatchDifferentialDriveDynamics, BatchDynamicModel, \
+    BatchGenericKinematicsSE2, rollout_batch
+from duckietown_world.world_duckietown.pwm_dynamics import DynamicModelParameters, PWMCommands
 
 
 @comptest
@@ -97,5 +100,89 @@ def dd_test():
     # assert_almost_equal(p1[0], [dt * radius * omega_left / 2, 0])
 
 
+def random_initial_states(factories, seed: int):
+    np.random.seed(seed)
+    res = []
+    for factory in factories:
+        q0 = geo.SE2_from_translation_angle(np.random.uniform(-1, 1, size=2), np.random.uniform(-np.pi, np.pi))
+        v0 = geo.se2_from_linear_angular([np.random.uniform(0, 0.5), 0], np.random.uniform(-1, 1))
+        res.append(factory.initialize((q0, v0)))
+    return res
+
+
+def assert_same_rollout(states, batch, commands, dt):
+    """ Integrates the robots one by one and checks that the results are equal to the batch ones. """
+    rollout = rollout_batch(batch, dt, commands)
+    for i, state in enumerate(states):
+        for k, u in enumerate(commands):
+            u_i = u[i] if isinstance(u, (list, np.ndarray)) else u
+            state = state.integrate(dt, u_i)
+            q, v = state.TSE2_from_state()
+            assert np.array_equal(q, rollout.poses[k + 1, i]), (i, k)
+            assert rollout.velocities[k + 1, i, 2] == v[1, 0]
+        assert state.t0 == rollout.final.t0
+        q, v = rollout.final.get_state(i).TSE2_from_state()
+        assert np.array_equal(q, state.q0) and np.array_equal(v, state.v0)
+
+
+@comptest
+def batch_dynamics_bit_exact():
+    M = 10
+    K = 30
+    dt = 0.05
+    np.random.seed(1)
+
+    # differential drive, with different parameters for each robot
+    factories = [DifferentialDriveDynamicsParameters(radius_left=np.random.uniform(0.03, 0.04),
+                                                     radius_right=np.random.uniform(0.03, 0.04),
+                                                     wheel_distance=np.random.uniform(0.09, 0.11))
+                 for _ in range(M)]
+    states = random_initial_states(factories, seed=2)
+    commands = [[WheelVelocityCommands(*np.random.uniform(-10, 10, size=2)) for _ in range(M)] for _ in range(K)]
+    assert_same_rollout(states, BatchDifferentialDriveDynamics.from_states(states), commands, dt)
+
+    # PWM dynamics; the commands are clipped to [-1, 1]
+    factories = [DynamicModelParameters(u1=np.random.uniform(4, 6), u2=0, u3=0, w1=np.random.uniform(3, 5),
+                                        w2=0, w3=np.random.uniform(0, 0.1), uar=1.5, ual=1.5, war=15, wal=15)
+                 for _ in range(M)]
+    states = random_initial_states(factories, seed=3)
+    commands = [[PWMCommands(*np.random.uniform(-1.2, 1.2, size=2)) for _ in range(M)] for _ in range(K)]
+    assert_same_rollout(states, BatchDynamicModel.from_states(states), commands, dt)
+    # the same commands for all the robots
+    commands = [PWMCommands(0.5, 0.3)] * K
+    assert_same_rollout(states, BatchDynamicModel.from_states(states), commands, dt)
+
+    # generic kinematics, including small angular velocities
+    states = random_initial_states([GenericKinematicsSE2] * M, seed=4)
+    commands = []
+    for k in range(K):
+        w = np.random.uniform(-1, 1, size=M) * (1e-8 if k % 2 else 1)
+        commands.append([geo.se2_from_linear_angular(np.random.uniform(-1, 1, size=2), w[i]) for i in range(M)])
+    batch = BatchGenericKinematicsSE2.from_states(states)
+    assert_same_rollout(states, batch, [np.array(_) for _ in commands], dt)
+
+
+@comptest
+def batch_kinematics_commands():
+    # with 3 robots, a (3, 3) array contains the components vx, vy, omega of each robot
+    q = np.array([np.eye(3)] * 3)
+    batch = BatchGenericKinematicsSE2(q, np.zeros(3), 0.0)
+    res = batch.integrate(1.0, [[1, 0, 0], [2, 0, 0], [3, 0, 0]])
+    assert res.v.tolist() == [[1, 0, 0], [2, 0, 0], [3, 0, 0]]
+    assert res.q[:, 0, 2].tolist() == [1, 2, 3]
+
+    # the same velocity in se(2) for all the robots
+    v = geo.se2_from_linear_angular([1, 0], 0.5)
+    res1 = batch.integrate(1.0, v[np.newaxis])
+    res2 = batch.integrate(1.0, [1, 0, 0.5])
+    np.testing.assert_array_equal(res1.q, res2.q)
+    np.testing.assert_array_equal(res1.v, res2.v)
+
+    # with another number of robots, a (3, 3) array is a velocity in se(2)
+    batch = BatchGenericKinematicsSE2(np.array([np.eye(3)] * 2), np.zeros(3), 0.0)
+    res = batch.integrate(1.0, v)
+    assert res.v.tolist() == [[1, 0, 0.5], [1, 0, 0.5]]
+
+
 if __name__ == '__main__':
     run_module_tests()
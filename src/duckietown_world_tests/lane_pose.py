@@ -18,6 +18,14 @@ from duckietown_world.world_duckietown.duckiebot import DB18
 from duckietown_world.world_duckietown.lane_segment import get_distance_two
 from duckietown_world.world_duckietown.map_loading import load_map
 from duckietown_world.world_duckietown.tile_template import load_tile_types
+from duckietown_world.world_duckietown.tile import Tile, get_lane_poses, relative_pose, create_lane_highlight
+from duckietown_world.world_duckietown.transformations import is_static
+from duckietown_world.world_duckietown.lane_geometry import get_lane_geometry_cache
+from duckietown_world.world_duckietown.lane_index import get_lane_segment_index, get_lane_poses_generic
+from duckietown_world.world_duckietown.segmentify import get_skeleton_graph
+from duckietown_world.world_duckietown.tile_index import get_tile_index
+from duckietown_world.world_duckietown.lane_poses_batch import get_lane_poses_batch
+from duckietown_world.geo.measurements_utils import iterate_by_class
 
 
 def same_point(a, b):
@@ -102,6 +110,66 @@ def lane_pose4():
         assert_almost_equal(lp1.relative_heading, lp2.relative_heading, decimal=3)
 
 
+@comptest
+def lane_arc_lengths():
+    # a long lane, as the ones of the skeleton graph
+    n = 200
+    control_points = [SE2Transform([0.1 * i, 0.02 * np.sin(i)], 0.1 * np.cos(i)) for i in range(n)]
+    ls = LaneSegment(width=0.2, control_points=control_points)
+
+    lengths = ls.get_lane_lengths()
+    cumulative = ls.get_cumulative_lengths()
+    assert len(lengths) == n - 1
+    assert cumulative[0] == 0
+    assert_almost_equal(cumulative[-1], ls.get_lane_length())
+    assert_almost_equal(np.diff(cumulative), lengths)
+
+    # the control points
+    for i in [0, 1, 50, n - 1]:
+        assert_almost_equal(ls.along_lane_from_beta(i), cumulative[i])
+        assert_almost_equal(ls.beta_from_along_lane(cumulative[i]), i)
+
+    np.random.seed(0)
+    betas = np.random.uniform(-2, n + 1, size=500)
+    along = ls.along_lane_from_beta(betas)
+    assert along.shape == betas.shape
+    assert_almost_equal(ls.beta_from_along_lane(along), betas)
+    for beta, x in zip(betas[:50], along[:50]):
+        assert_almost_equal(ls.along_lane_from_beta(float(beta)), x)
+        assert_almost_equal(ls.beta_from_along_lane(float(x)), beta)
+
+
+@comptest
+def lane_pose_closest_point():
+    templates = load_tile_types()
+    np.random.seed(0)
+    for name, ls in templates.items():
+        if not isinstance(ls, LaneSegment) or ls.is_straight():
+            continue
+
+        # the projection on the center line is exact
+        for i in range(50):
+            lp1 = ls.lane_pose_random()
+            q1 = ls.SE2Transform_from_lane_pose(lp1)
+            lp2 = ls.lane_pose_from_SE2Transform(q1)
+            assert_almost_equal(lp1.along_lane, lp2.along_lane, decimal=6)
+            assert_almost_equal(lp1.lateral, lp2.lateral, decimal=6)
+            assert_almost_equal(lp1.relative_heading, lp2.relative_heading, decimal=6)
+
+            p = q1.p
+            beta, q0 = ls.find_along_lane_closest_point(p)
+            rel = relative_pose(q0, geo.SE2_from_translation_angle(p, 0))
+            assert_almost_equal(rel[0, 2], 0, decimal=6)
+
+        # before the beginning and after the end
+        for along_lane in [-0.05, ls.get_lane_length() + 0.05]:
+            lp1 = ls.lane_pose(along_lane=along_lane, lateral=0.02, relative_heading=0.1)
+            q1 = ls.SE2Transform_from_lane_pose(lp1)
+            lp2 = ls.lane_pose_from_SE2Transform(q1)
+            assert_almost_equal(lp1.along_lane, lp2.along_lane, decimal=6)
+            assert_almost_equal(lp1.lateral, lp2.lateral, decimal=6)
+
+
 @comptest
 def center_point1():
     outdir = get_comptests_output_dir()
@@ -186,6 +254,154 @@ def lane_pose_test1():
     draw_static(dw, outdir, area=area, timeseries=timeseries)
 
 
+@comptest
+def lane_pose_tile_index():
+    dw = load_map('udem1')
+    tile_index = get_tile_index(dw)
+
+    def brute_force(q):
+        """ Checks all the tiles, as get_lane_poses() used to do. """
+        for it in iterate_by_class(dw, Tile):
+            tile_relative_pose = relative_pose(it.transform_sequence.asmatrix2d().m, q)
+            if not it.object.get_footprint().contains(tile_relative_pose[:2, 2]):
+                continue
+            for it2 in iterate_by_class(it.object, LaneSegment):
+                rel = relative_pose(it2.transform_sequence.asmatrix2d().m, tile_relative_pose)
+                lp = it2.object.lane_pose_from_SE2(rel, tol=0.000001)
+                if lp.along_inside and lp.inside and lp.correct_direction:
+                    yield it.fqn + it2.fqn, lp.along_lane, lp.lateral
+
+    np.random.seed(0)
+    for i in range(50):
+        p = np.random.uniform(0, 3, size=2)
+        if i % 5 == 0:
+            # on the boundary between tiles
+            p = np.round(p / dw.tile_size) * dw.tile_size
+        q = geo.SE2_from_translation_angle(p, np.random.uniform(-np.pi, np.pi))
+        expected = list(brute_force(q))
+        found = [(_.lane_segment_fqn, _.lane_pose.along_lane, _.lane_pose.lateral)
+                 for _ in get_lane_poses(dw, q, tile_index=tile_index)]
+        assert [_[0] for _ in found] == [_[0] for _ in expected], (p, found, expected)
+        assert np.allclose([_[1:] for _ in found], [_[1:] for _ in expected], atol=1e-12), (p, found, expected)
+
+
+@comptest
+def lane_geometry_cache():
+    dw = load_map('udem1')
+    geometry = get_lane_geometry_cache(dw)
+    assert geometry is get_lane_geometry_cache(dw)
+
+    its = list(iterate_by_class(dw, LaneSegment))
+    assert len(geometry) == len(its)
+    for k, it in enumerate(its):
+        assert geometry.lane_segment_fqns[k] == it.fqn
+        M = it.transform_sequence.asmatrix2d().m
+        assert np.allclose(geometry.matrix[k], M)
+        assert np.allclose(np.dot(geometry.matrix_inv[k], M), np.eye(3))
+        polyline = geometry.get_polyline(k)
+        assert np.all(polyline >= geometry.bbox_min[k]) and np.all(polyline <= geometry.bbox_max[k])
+
+    # every point inside a lane is in its bounding box
+    np.random.seed(0)
+    for i in range(1000):
+        k = np.random.randint(len(its))
+        lane_segment = geometry.lane_segments[k]
+        beta = np.random.uniform(0, len(lane_segment.control_points) - 1)
+        lateral = np.random.uniform(-1, 1) * lane_segment.width / 2
+        q = np.dot(lane_segment.center_point(beta), geo.SE2_from_translation_angle([0, lateral], 0))
+        p = np.dot(geometry.matrix[k], q)[0:2, 2]
+        assert geometry.bbox_contains(k, p[0], p[1]), (p, geometry.lane_segment_fqns[k])
+        assert k in geometry.lanes_containing(p)
+
+
+@comptest
+def lane_pose_after_highlight():
+    # the lanes added by create_lane_highlight() are placed by a SampledSequence
+    dw = load_map('udem1')
+    reference = load_map('udem1')
+    np.random.seed(0)
+    poses = [geo.SE2_from_translation_angle(np.random.uniform(0, 3, size=2), np.random.uniform(-np.pi, np.pi))
+             for _ in range(20)]
+    create_lane_highlight(SampledSequence.from_iterator(enumerate(poses)), dw)
+    assert any(not is_static(_.transform_sequence) for _ in iterate_by_class(dw, LaneSegment))
+
+    def summary(results):
+        return [(_.lane_segment_fqn, _.lane_pose.along_lane, _.lane_pose.lateral) for _ in results]
+
+    for q in poses:
+        assert summary(get_lane_poses(dw, q)) == summary(get_lane_poses(reference, q))
+        assert summary(get_lane_poses_generic(dw, q)) == summary(get_lane_poses_generic(reference, q))
+
+
+@comptest
+def lane_segment_index():
+    # the skeleton graph has lane segments that are not inside tiles
+    root2 = get_skeleton_graph(load_map('udem1')).root2
+    index = get_lane_segment_index(root2)
+    geometry = index.geometry
+    assert len(geometry) > 0
+    its = list(iterate_by_class(root2, LaneSegment))
+
+    np.random.seed(0)
+    for i in range(200):
+        p = np.random.uniform(-0.5, 3.5, size=2)
+
+        inside = np.all((geometry.bbox_min <= p) & (p <= geometry.bbox_max), axis=1)
+        assert index.query_point(p).tolist() == np.flatnonzero(inside).tolist()
+
+        pmin, pmax = p, p + np.random.uniform(0, 1, size=2)
+        overlap = np.all((geometry.bbox_min <= pmax) & (pmin <= geometry.bbox_max), axis=1)
+        assert index.query_box(pmin, pmax).tolist() == np.flatnonzero(overlap).tolist()
+
+        r = np.random.uniform(0, 0.5)
+        d = np.maximum(np.maximum(geometry.bbox_min - p, p - geometry.bbox_max), 0)
+        near = np.hypot(d[:, 0], d[:, 1]) <= r
+        assert index.query_radius(p, r).tolist() == np.flatnonzero(near).tolist()
+
+        distances = [index.distance_from_center_line(k, p) for k in range(len(geometry))]
+        k, dk = index.nearest(p)
+        assert k == int(np.argmin(distances)) and dk == min(distances), (p, k, dk)
+
+        q = geo.SE2_from_translation_angle(p, np.random.uniform(-np.pi, np.pi))
+        expected = []
+        for it in its:
+            rel = relative_pose(it.transform_sequence.asmatrix2d().m, q)
+            lp = it.object.lane_pose_from_SE2(rel, tol=0.000001)
+            if lp.along_inside and lp.inside and lp.correct_direction:
+                expected.append(it.fqn)
+        found = [_.lane_segment_fqn for _ in get_lane_poses_generic(root2, q)]
+        assert found == expected, (p, found, expected)
+
+    assert index.nearest([100.0, 100.0], max_distance=1.0) is None
+
+
+@comptest
+def lane_pose_batch():
+    dw = load_map('robotarium2')
+    tile_index = get_tile_index(dw)
+
+    np.random.seed(0)
+    N = 200
+    poses = np.random.uniform(-0.5, 6, size=(N, 3))
+    poses[:, 2] = np.random.uniform(-np.pi, np.pi, size=N)
+    batch = get_lane_poses_batch(dw, poses, tile_index=tile_index)
+
+    found = [(int(_['pose']), batch.lane_segments[_['lane_segment']].lane_segment_fqn,
+              _['along_lane'], _['lateral'], _['relative_heading'])
+             for _ in batch.get_matches()]
+    expected = []
+    for i in range(N):
+        q = geo.SE2_from_translation_angle(poses[i, :2], poses[i, 2])
+        for r in get_lane_poses(dw, q, tile_index=tile_index):
+            lp = r.lane_pose
+            expected.append((i, r.lane_segment_fqn, lp.along_lane, lp.lateral, lp.relative_heading))
+
+    assert [_[:2] for _ in found] == [_[:2] for _ in expected]
+    # the same closed form is used for both
+    np.testing.assert_allclose(np.array([_[2:] for _ in found]),
+                               np.array([_[2:] for _ in expected]), rtol=0, atol=1e-12)
+
+
 def integrate_commands(s0, commands_sequence):
     states = [s0]
     timestamps = commands_sequence.timestamps
@@ -4,10 +4,13 @@ import os
 import numpy as np
 from comptests import comptest, run_module_tests, get_comptests_output_dir
 
-from duckietown_world.geo import PlacedObject, SE2Transform, get_meausurements_graph
-from duckietown_world.seqs import Constant
+from duckietown_world.geo import PlacedObject, SE2Transform, GroundTruth, get_meausurements_graph
+from duckietown_world.geo.measurements_utils import get_flattened_measurement_graph
+from duckietown_world.seqs import Constant, SampledSequence
 from duckietown_world.utils.gvgen_ac import ACGvGen
 from duckietown_world.world_duckietown.map_loading import load_map
+from duckietown_world.world_duckietown.duckiebot import DB18
+from duckietown_world.world_duckietown.transformations import ChooseTime, get_time_snapshots
 
 
 @comptest
@@ -47,6 +50,95 @@ def m1():
     #         # print(frozen)
 
 
+@comptest
+def flattened_graph_cache():
+    gm = load_map('udem1')
+    G1 = get_flattened_measurement_graph(gm)
+    assert get_flattened_measurement_graph(gm) is G1
+
+    # modifying a descendant invalidates the cache
+    tile = gm['tilemap/tile-0-0']
+    tile.set_object('obj', PlacedObject(), ground_truth=SE2Transform([0.1, 0.1], 0))
+    G2 = get_flattened_measurement_graph(gm)
+    assert G2 is not G1
+    assert ('tilemap', 'tile-0-0', 'obj') in G2
+    assert get_flattened_measurement_graph(gm) is G2
+
+    # modifying an unrelated object does not
+    other = PlacedObject()
+    other.set_object('x', PlacedObject())
+    assert get_flattened_measurement_graph(gm) is G2
+
+    tile.remove_object('obj')
+    G3 = get_flattened_measurement_graph(gm)
+    assert ('tilemap', 'tile-0-0', 'obj') not in G3
+
+    # modifications in place are seen after invalidate_cache()
+    tile0 = gm['tilemap/tile-0-0']
+    ob = PlacedObject()
+    tile0.children['obj2'] = ob
+    tile0.spatial_relations['obj2'] = GroundTruth(a=(), b=('obj2',), transform=SE2Transform([0.2, 0.1], 0))
+    assert get_flattened_measurement_graph(gm) is G3
+    tile0.invalidate_cache()
+    G3 = get_flattened_measurement_graph(gm)
+    assert ('tilemap', 'tile-0-0', 'obj2') in G3
+    # also for objects that were not in the tree when the value was computed
+    transform = SE2Transform([0.3, 0.1], 0)
+    ob.set_object('sub', PlacedObject(), ground_truth=transform)
+    assert ('tilemap', 'tile-0-0', 'obj2', 'sub') in get_flattened_measurement_graph(gm)
+    transform.p = np.array([0.4, 0.1])
+    ob.invalidate_cache()
+    G3 = get_flattened_measurement_graph(gm)
+
+    def matrix(fqn):
+        return G3.get_edge_data((), fqn)['transform_sequence'].asmatrix2d().m
+
+    expected = np.dot(matrix(('tilemap', 'tile-0-0', 'obj2')), transform.as_SE2())
+    assert np.allclose(matrix(('tilemap', 'tile-0-0', 'obj2', 'sub')), expected)
+    tile0.remove_object('obj2')
+    # a removed object does not invalidate the cache of its former parents
+    G3 = get_flattened_measurement_graph(gm)
+    ob.set_object('sub2', PlacedObject())
+    assert get_flattened_measurement_graph(gm) is G3
+
+    # copies created by filter_all() have their own cache
+    gm.set_object('ob', PlacedObject(), ground_truth=SampledSequence[SE2Transform]([0.0], [SE2Transform.identity()]))
+    G4 = get_flattened_measurement_graph(gm)
+    gm2 = gm.filter_all(ChooseTime(1.0))
+    assert gm2 is not gm
+    G5 = get_flattened_measurement_graph(gm2)
+    assert ('ob',) in G4
+    assert ('ob',) not in G5
+
+
+@comptest
+def time_snapshots():
+    gm = load_map('udem1')
+    timestamps = [0.1 * i for i in range(10)]
+    poses = [SE2Transform([1.0 + 0.1 * i, 0.5], 0.1 * i) for i in range(10)]
+    gm.set_object('duckiebot', DB18(), ground_truth=SampledSequence[SE2Transform](timestamps, poses))
+    # a dynamic object inside a tile, defined only at some timestamps
+    tile = gm.children['tilemap'].children['tile-0-0']
+    tile.set_object('ob', PlacedObject(), ground_truth=SampledSequence[SE2Transform](timestamps[::2], poses[::2]))
+
+    snapshots = get_time_snapshots(gm)
+    assert get_time_snapshots(gm) is snapshots
+    for t in timestamps + [5.0]:
+        expected = gm.filter_all(ChooseTime(t))
+        found = snapshots.at(t)
+        assert found == expected, t
+        # the static subtrees are shared
+        tilemap = found.children['tilemap']
+        assert tilemap is not gm.children['tilemap']
+        assert tilemap.children['tile-1-1'] is gm.children['tilemap'].children['tile-1-1']
+
+    # modifying the tree invalidates the snapshots
+    tile.remove_object('ob')
+    snapshots2 = get_time_snapshots(gm)
+    assert snapshots2 is not snapshots
+    assert snapshots2.at(0.0).children['tilemap'] is gm.children['tilemap']
+
+
 class NoMeasurements(Exception):
     pass
 
@@ -0,0 +1,123 @@
+# coding=utf-8
+import copy
+import gc
+import pickle
+import weakref
+
+from comptests import comptest, run_module_tests
+
+from duckietown_world import LaneSegment, SE2Transform
+from duckietown_world.utils import LRUCache, memoized_function, memoized_method
+from duckietown_world.world_duckietown.tile_template import load_tile_types
+
+
+@comptest
+def lru_cache():
+    cache = LRUCache(maxsize=2)
+    assert cache.get('a', lambda: 1) == 1
+    assert cache.get('b', lambda: 2) == 2
+    assert cache.get('a', lambda: None) == 1
+    # evicts "b", the least recently used
+    assert cache.get('c', lambda: 3) == 3
+    assert list(cache.data) == ['a', 'c']
+    info = cache.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 3, 2), info
+    # unhashable keys are not cached
+    assert cache.get([1], lambda: 4) == 4
+    assert cache.cache_info().currsize == 2
+
+
+@comptest
+def memoized_function_calls():
+    calls = []
+
+    @memoized_function(maxsize=2)
+    def f(x, y=0):
+        calls.append((x, y))
+        return x + y
+
+    assert f(1) == 1
+    assert f(1) == 1
+    assert f(1, y=2) == 3
+    assert f(2) == 2
+    assert f(1) == 1  # evicted
+    assert calls == [(1, 0), (1, 2), (2, 0), (1, 0)], calls
+    assert f.cache_info().hits == 1
+    f.cache_clear()
+    assert f.cache_info().currsize == 0
+    assert f.__name__ == 'f'
+
+    assert load_tile_types() is load_tile_types()
+
+    # the size must be given by keyword
+    for decorator in [memoized_function, memoized_method]:
+        try:
+            decorator(64)
+        except TypeError:
+            pass
+        else:
+            raise Exception(decorator)
+
+
+class Counter(object):
+    def __init__(self):
+        self.calls = 0
+
+    @memoized_method(maxsize=3)
+    def square(self, x):
+        self.calls += 1
+        return x * x
+
+
+@comptest
+def memoized_method_per_instance():
+    a = Counter()
+    b = Counter()
+    assert a.square(2) == 4
+    assert a.square(2) == 4
+    assert b.square(2) == 4
+    assert (a.calls, b.calls) == (1, 1)
+    assert a.square.cache_info().hits == 1
+    for x in range(10):
+        a.square(x)
+    assert a.square.cache_info().currsize == 3
+    a.square.cache_clear()
+    assert a.square.cache_info().currsize == 0
+    assert Counter.square.cache_info().hits >= 1
+
+    # the cache does not keep the object alive
+    r = weakref.ref(b)
+    del b
+    gc.collect()
+    assert r() is None
+
+
+@comptest
+def memoized_method_lane_segment():
+    control_points = [SE2Transform([0, 0], 0), SE2Transform([1, 0.5], 0.5)]
+    ls = LaneSegment(width=0.2, control_points=control_points)
+    p1 = ls.center_line_points()
+    assert ls.center_line_points() is p1
+    assert ls.lane_profile(points_per_segment=5) is ls.lane_profile(points_per_segment=5)
+    assert ls.center_line_points.cache_info().hits == 1
+
+    # not pickled
+    ls2 = pickle.loads(pickle.dumps(ls))
+    assert ls2.center_line_points.cache_info().currsize == 0
+    assert len(ls2.center_line_points()) == len(p1)
+
+    # not shared with a copy
+    ls.get_cached('key', lambda: 1)
+    ls3 = copy.copy(ls)
+    assert ls3.center_line_points.cache_info().currsize == 0
+    assert ls3.get_cached('key', lambda: 2) == 2
+    assert ls.center_line_points() is p1
+    assert ls.get_cached('key', lambda: 3) == 1
+
+    # reset when the object is modified
+    ls._modified()
+    assert ls.center_line_points() is not p1
+
+
+if __name__ == '__main__':
+    run_module_tests()
@@ -1,4 +1,7 @@
+import json
+import math
 import os
+import time
 
 import numpy as np
 
@@ -8,7 +11,11 @@ from duckietown_world import PWMCommands, SampledSequence, draw_static, \
     SE2Transform, DB18, construct_map
 from duckietown_world.seqs.tsequence import SampledSequenceBuilder
 from duckietown_world.svg_drawing.misc import TimeseriesPlot
-from duckietown_world.world_duckietown.pwm_dynamics import get_DB18_nominal
+from duckietown_world.world_duckietown.dynamics_delay import ApplyDelay, DelayedDynamics
+from duckietown_world.world_duckietown.pwm_dynamics import get_DB18_nominal, DynamicModelEvaluator, \
+    DynamicModelParameters
+from duckietown_world.world_duckietown.pwm_sysid import PWMLog, evaluate_parameters, fit_pwm_parameters, \
+    sample_parameters
 from duckietown_world.world_duckietown.types import TSE2v, se2v
 from duckietown_world.world_duckietown.utils import get_velocities_from_sequence
 
@@ -105,5 +112,248 @@ def integrate_dynamics(factory, q0, v0, dt, t_max, fixed_commands) -> SampledSeq
     return ssb.as_sequence()
 
 
+def pwm_model_reference(parameters, u, w, motor_left, motor_right):
+    """ The computation that DynamicModel.model() used to do. """
+    V = np.clip(np.array([motor_right, motor_left]).reshape(2, 1), -1, +1)
+    p = parameters
+    f_dynamic = np.array([
+        [-p.u1 * u - p.u2 * w + p.u3 * w ** 2],
+        [-p.w1 * w - p.w2 * u - p.w3 * u * w]
+    ])
+    B = np.array([
+        [p.u_alpha_r, p.u_alpha_l],
+        [p.w_alpha_r, -p.w_alpha_l]
+    ])
+    return f_dynamic + np.matmul(B, V)
+
+
+@comptest
+def pwm_evaluator():
+    np.random.seed(0)
+    N = 1000
+    parameters = [DynamicModelParameters(u1=np.random.uniform(4, 6), u2=np.random.uniform(0, 0.1),
+                                         u3=np.random.uniform(0, 0.1), w1=np.random.uniform(3, 5),
+                                         w2=np.random.uniform(0, 0.1), w3=np.random.uniform(0, 0.1),
+                                         uar=1.5, ual=1.4, war=15, wal=16) for _ in range(N)]
+    u = np.random.uniform(-1, 1, size=N)
+    w = np.random.uniform(-5, 5, size=N)
+    motor_left = np.random.uniform(-1.5, 1.5, size=N)
+    motor_right = np.random.uniform(-1.5, 1.5, size=N)
+
+    batch = DynamicModelEvaluator.from_parameters(parameters)
+    du, dw = batch.acceleration(u, w, motor_left, motor_right)
+    # parameters whose fields are arrays give the same evaluator
+    values = np.array([_.as_tuple() for _ in parameters]).T
+    du2, dw2 = DynamicModelParameters(*values).get_evaluator().acceleration(u, w, motor_left, motor_right)
+    assert np.array_equal(du, du2) and np.array_equal(dw, dw2)
+    for i in range(0, N, 10):
+        evaluator = parameters[i].get_evaluator()
+        assert parameters[i].get_evaluator() is evaluator
+        expected = pwm_model_reference(parameters[i], u[i], w[i], motor_left[i], motor_right[i])
+        found = evaluator.acceleration(float(u[i]), float(w[i]), float(motor_left[i]), float(motor_right[i]))
+        assert np.allclose(found, expected[:, 0], rtol=1e-14, atol=0)
+        # floats and arrays give the same results
+        assert found == (du[i], dw[i])
+
+    # changing the parameters creates a new evaluator
+    p = parameters[0]
+    evaluator = p.get_evaluator()
+    p.u1 = 7
+    assert p.get_evaluator() is not evaluator and p.get_evaluator().u1 == 7
+
+    # with a large dt, the higher-order methods are closer to a fine integration
+    e = get_DB18_nominal(delay=0).get_evaluator()
+    dt = 0.1
+    K = 10
+    left = np.full(K, 0.8)
+    right = np.full(K, 0.3)
+    n = 1000
+    fine_u, fine_w = e.simulate(0.0, 0.0, np.repeat(left, n), np.repeat(right, n), dt / n, method='rk4')
+    errors = {}
+    for method in DynamicModelEvaluator.methods:
+        us, ws = e.simulate(0.0, 0.0, left, right, dt, method=method)
+        assert us.shape == (K + 1,)
+        errors[method] = np.hypot(us[-1] - fine_u[-1], ws[-1] - fine_w[-1])
+    assert errors['rk4'] < errors['midpoint'] < errors['euler'], errors
+
+
+class ListDelayedDynamics(object):
+    """ The previous implementation of DelayedDynamics, which copies the lists at each step. """
+
+    def __init__(self, state, delay, t0, u0, commands=None, timestamps=None):
+        self.state = state
+        self.commands = commands or []
+        self.timestamps = timestamps or []
+        self.t = t0
+        self.delay = delay
+        self.u0 = u0
+
+        if self.timestamps:
+            i, _, _ = self.get_commands_at(self.timestamps[-1] - self.delay)
+            self.commands = self.commands[i:]
+            self.timestamps = self.timestamps[i:]
+
+    def get_commands_at(self, t):
+        if t < self.timestamps[0]:
+            return 0, 0, self.u0
+
+        a = np.array(self.timestamps)
+        idx = np.searchsorted(a, t, side="left")
+
+        if idx > 0 and (idx == len(a) or math.fabs(t - a[idx - 1]) < math.fabs(t - a[idx])):
+            return idx, a[idx], self.commands[idx - 1]
+        else:
+            return idx, a[idx], self.commands[idx]
+
+    def integrate(self, dt, commands):
+        self.commands.append(commands)
+        self.timestamps.append(self.t)
+        self.t += dt
+        i, told, use_commands = self.get_commands_at(self.t - self.delay)
+        state2 = self.state.integrate(dt, use_commands)
+        return ListDelayedDynamics(state2, self.delay, self.t, self.u0, commands=list(self.commands),
+                                   timestamps=list(self.timestamps))
+
+
+class RecordCommands(object):
+    """ Dynamics that only record the commands they receive. """
+
+    def __init__(self, received=()):
+        self.received = received
+
+    def integrate(self, dt, commands):
+        return RecordCommands(self.received + (commands,))
+
+
+@comptest
+def delayed_dynamics():
+    np.random.seed(0)
+    delay = 0.1
+    dts = np.random.uniform(0.01, 0.05, size=500)
+    new = DelayedDynamics(RecordCommands(), delay, 0.0, -1)
+    old = ListDelayedDynamics(RecordCommands(), delay, 0.0, -1)
+    states = [new]
+    # ListDelayedDynamics modifies its lists in integrate()
+    windows = [([], [])]
+    for i, dt in enumerate(dts):
+        new = new.integrate(dt, i)
+        old = old.integrate(dt, i)
+        states.append(new)
+        windows.append((list(old.commands), list(old.timestamps)))
+        assert new.t == old.t
+        assert new.state.received == old.state.received, i
+    assert len(new.timestamps) < 20
+    # the entries not needed anymore are dropped
+    assert len(new.buffer.timestamps) < 3 * DelayedDynamics.min_compact
+
+    # the previous states are not changed by the following ones
+    for k, state in enumerate(states):
+        assert state.commands == windows[k][0], k
+        assert state.timestamps == windows[k][1], k
+
+    # a state can be integrated again, giving the same result, also long after
+    for k in [len(states) - 2, len(states) - 5, len(states) // 2, 3, 0]:
+        a = states[k + 1]
+        b = states[k].integrate(dts[k], k)
+        assert b.state.received == a.state.received
+        assert b.commands == a.commands and b.timestamps == a.timestamps
+        assert b.integrate(0.03, 'x').state.received == a.integrate(0.03, 'x').state.received
+    for k, state in enumerate(states):
+        assert state.commands == windows[k][0], k
+
+
+class NoDynamics(object):
+    """ Dynamics that do nothing, to measure the overhead of the delay. """
+
+    def integrate(self, dt, commands):
+        return self
+
+
+def benchmark_delayed_rollout(nsteps: int, delay: float = 0.1, dt: float = 0.03) -> dict:
+    """
+        Times rollouts of get_DB18_nominal(delay) with the previous and the current DelayedDynamics;
+        the "overhead" entries use dynamics that do nothing.
+    """
+    factory = get_DB18_nominal(delay=delay)
+    assert isinstance(factory, ApplyDelay)
+    c0 = geo.SE2_from_R2(np.array([0, 0.8])), geo.se2_from_linear_angular(np.array([0, 0]), 0)
+    commands = PWMCommands(+0.5, 0.4)
+
+    res = dict(nsteps=nsteps, delay=delay, dt=dt)
+    initial = {
+        'before': ListDelayedDynamics(factory.factory.initialize(c0), delay, 0, factory.u0),
+        'after': factory.initialize(c0),
+        'before_overhead': ListDelayedDynamics(NoDynamics(), delay, 0, factory.u0),
+        'after_overhead': DelayedDynamics(NoDynamics(), delay, 0, factory.u0),
+    }
+    final = {}
+    for name, state in initial.items():
+        t0 = time.perf_counter()
+        for i in range(nsteps):
+            state = state.integrate(dt, commands)
+        res[name] = time.perf_counter() - t0
+        final[name] = state.state
+    assert np.allclose(final['before'].TSE2_from_state()[0], final['after'].TSE2_from_state()[0])
+    return res
+
+
+@comptest
+def delayed_dynamics_benchmark():
+    # use nsteps=10 ** 5 for more precise figures
+    res = benchmark_delayed_rollout(nsteps=10 ** 4)
+    outdir = get_comptests_output_dir()
+    os.makedirs(outdir, exist_ok=True)
+    with open(os.path.join(outdir, 'delayed_dynamics.json'), 'w') as f:
+        json.dump(res, f, indent=2)
+    print(json.dumps(res, indent=2))
+
+
+def simulate_pwm_log(parameters, dt: float, motor_left, motor_right) -> PWMLog:
+    """ Records the trajectory of the scalar DynamicModel with the given commands. """
+    state = parameters.initialize(c0=(geo.SE2_from_translation_angle([0.1, 0.2], 0.3), geo.se2.zero()), t0=0)
+    timestamps = [0.0]
+    poses = []
+    commands = np.array([motor_left, motor_right]).T
+
+    def record(s):
+        q, _ = s.TSE2_from_state()
+        poses.append([q[0, 2], q[1, 2], math.atan2(q[1, 0], q[0, 0])])
+
+    record(state)
+    for ml, mr in commands.tolist():
+        state = state.integrate(dt, PWMCommands(motor_left=ml, motor_right=mr))
+        timestamps.append(state.t0)
+        record(state)
+    return PWMLog(timestamps=np.array(timestamps), commands=commands, poses=np.array(poses))
+
+
+@comptest
+def pwm_sysid():
+    K = 100
+    k = np.arange(K)
+    motor_left = 0.5 + 0.3 * np.sin(k * 0.1)
+    motor_right = 0.5 + 0.3 * np.cos(k * 0.07)
+    nominal = get_DB18_nominal(delay=0)
+    true = sample_parameters(1, nominal, spread=0.2, fields=('u1', 'w1', 'u_alpha_r', 'u_alpha_l'), seed=1)[0]
+    log = simulate_pwm_log(true, 0.03, motor_left, motor_right)
+
+    # the true parameters reproduce the log
+    candidates = [true, nominal] + sample_parameters(30, nominal, seed=2)
+    errors = evaluate_parameters(log, candidates, processes=0, chunk_size=7)
+    assert errors[0] < 1e-9, errors[0]
+    assert errors[1] > 0.01, errors[1]
+    # the pool gives the same results
+    errors2 = evaluate_parameters(log, candidates, processes=2, chunk_size=7)
+    np.testing.assert_array_equal(errors, errors2)
+
+    res = fit_pwm_parameters(log, n=100, rounds=4, fields=('u1', 'w1', 'u_alpha_r', 'u_alpha_l'), processes=2)
+    assert abs(res.nominal_error - errors[1]) < 1e-12, (res.nominal_error, errors[1])
+    assert res.error < res.nominal_error / 2, (res.error, res.nominal_error)
+    assert res.history == sorted(res.history, reverse=True)
+    assert res.nevaluated == 1 + 4 * 100
+    assert abs(res.residuals['rms_position'] - res.error) < 1e-12
+    assert res.residuals['max_position'] >= res.residuals['rms_position'] >= res.residuals['mean_position']
+
+
 if __name__ == '__main__':
     run_module_tests()
@@ -0,0 +1,407 @@
+# coding=utf-8
+import textwrap
+from collections import OrderedDict
+from typing import cast
+
+import numpy as np
+from comptests import comptest, run_module_tests
+
+import geometry as geo
+from duckietown_world import SE2Transform, DB18
+from duckietown_world.rules import evaluate_rules, SurvivalTime
+from duckietown_world.rules.in_drivable_lane import integrate, accumulate
+from duckietown_world.rules.rule import Rule, RuleEvaluationContext, RuleEvaluationResult, evaluate_rules_in_context
+from duckietown_world.seqs import SampledSequence, UndefinedAtTime, iterate_with_dt
+from duckietown_world.seqs.tsequence import SampledSequenceBuilder
+from duckietown_world.world_duckietown import LanePose, GetLanePoseResult, create_lane_highlight
+from duckietown_world.world_duckietown.differential_drive_dynamics import WheelVelocityCommands
+from duckietown_world.world_duckietown.map_loading import load_map
+from duckietown_world.world_duckietown.tile import relative_pose
+from .batch_evaluation import random_walk
+from .lane_pose import get_robot_trajectory, reasonable_duckiebot
+
+# The rules as they were before the shared quantities were introduced:
+# each one loops over the interval on its own.
+
+
+class ReferenceDeviationFromCenterLine(Rule):
+
+    def evaluate(self, context: RuleEvaluationContext, result: RuleEvaluationResult):
+
+        interval = cast(SampledSequence, context.get_interval())
+        lane_pose_seq = context.get_lane_pose_seq()
+
+        timestamps = []
+        values = []
+
+        for i, timestamp in interval:
+            try:
+                name2lpr = lane_pose_seq.at(timestamp)
+            except UndefinedAtTime:
+                d = 0.0
+            else:
+                if name2lpr:
+                    first = name2lpr[sorted(name2lpr)[0]]
+                    assert isinstance(first, GetLanePoseResult)
+
+                    lp = first.lane_pose
+                    assert isinstance(lp, LanePose)
+
+                    d = lp.distance_from_center
+                else:
+                    # no lp
+                    d = 0.0
+
+            values.append(d)
+            timestamps.append(timestamp)
+
+        sequence = SampledSequence[float](timestamps, values)
+
+        if len(sequence) <= 1:
+            cumulative = 0
+            dtot = 0
+        else:
+            cumulative = integrate(sequence)
+            dtot = cumulative.values[-1]
+
+        title = "Deviation from center line"
+        description = textwrap.dedent("""\
+            This metric describes the amount of deviation from the center line.
+        """)
+        result.set_metric(name=(), total=dtot, incremental=sequence,
+                          title=title, description=description, cumulative=cumulative)
+
+
+class ReferenceDeviationHeading(Rule):
+
+    def evaluate(self, context: RuleEvaluationContext, result: RuleEvaluationResult):
+
+        interval = cast(SampledSequence, context.get_interval())
+        lane_pose_seq = context.get_lane_pose_seq()
+
+        timestamps = []
+        values = []
+
+        for i, timestamp in interval:
+            try:
+                name2lpr = lane_pose_seq.at(timestamp)
+            except UndefinedAtTime:
+                d = 0.0
+            else:
+                if name2lpr:
+                    first = name2lpr[sorted(name2lpr)[0]]
+                    assert isinstance(first, GetLanePoseResult)
+
+                    lp = first.lane_pose
+                    assert isinstance(lp, LanePose)
+
+                    d = np.abs(lp.relative_heading)
+                else:
+                    # no lp
+                    d = 0.0
+
+            values.append(d)
+            timestamps.append(timestamp)
+
+        sequence = SampledSequence[float](timestamps, values)
+        if len(sequence) <= 1:
+            cumulative = 0.0
+            dtot = 0.0
+        else:
+            cumulative = integrate(sequence)
+            dtot = cumulative.values[-1]
+
+        # result.set_metric((), dtot, sequence, description, cumulative=cumulative)
+        title = "Deviation from lane direction"
+        description = textwrap.dedent("""\
+            This metric describes the amount of deviation from the relative heading.
+        """)
+        result.set_metric(name=(), total=dtot, incremental=sequence,
+                          title=title, description=description, cumulative=cumulative)
+
+
+class ReferenceInDrivableLane(Rule):
+
+    def evaluate(self, context: RuleEvaluationContext, result: RuleEvaluationResult):
+        interval = cast(SampledSequence, context.get_interval())
+        lane_pose_seq = context.get_lane_pose_seq()
+
+        timestamps = []
+        values = []
+
+        for i, timestamp in interval:
+            try:
+                name2lpr = lane_pose_seq.at(timestamp)
+            except UndefinedAtTime:
+                d = 1.0
+            else:
+                if name2lpr:
+                    d = 0.0
+                else:
+                    # no lp
+                    d = 1.0
+
+            values.append(d)
+            timestamps.append(timestamp)
+
+        sequence = SampledSequence[float](timestamps, values)
+        if len(sequence) <= 1:
+            cumulative = 0
+            dtot = 0
+        else:
+            cumulative = integrate(sequence)
+            dtot = cumulative.values[-1]
+
+        title = "Drivable areas"
+        description = textwrap.dedent("""\
+            This metric computes whether the robot was in a drivable area.
+            
+            Note that we check that the robot is in the lane in a correct heading 
+            (up to 90deg deviation from the lane direction). 
+        """)
+
+        result.set_metric(name=(), total=dtot, incremental=sequence,
+                          title=title, description=description, cumulative=cumulative)
+
+
+class ReferenceDrivenLength(Rule):
+
+    def evaluate(self, context: RuleEvaluationContext, result: RuleEvaluationResult):
+        interval = context.get_interval()
+        lane_pose_seq = context.get_lane_pose_seq()
+        ego_pose_sequence = context.get_ego_pose_global()
+
+        driven_any_builder = SampledSequenceBuilder[float]()
+        driven_lanedir_builder = SampledSequenceBuilder[float]()
+
+        for idt in iterate_with_dt(interval):
+            t0, t1 = idt.v0, idt.v1  # not v
+            try:
+                name2lpr = lane_pose_seq.at(t0)
+
+                p0 = ego_pose_sequence.at(t0).as_SE2()
+                p1 = ego_pose_sequence.at(t1).as_SE2()
+            except UndefinedAtTime:
+                dr_any = dr_lanedir = 0.0
+
+            else:
+                prel = relative_pose(p0, p1)
+                translation, _ = geo.translation_angle_from_SE2(prel)
+                dr_any = np.linalg.norm(translation)
+
+                if name2lpr:
+
+                    ds = []
+                    for k, lpr in name2lpr.items():
+                        assert isinstance(lpr, GetLanePoseResult)
+                        c0 = lpr.center_point
+                        ctas = geo.translation_angle_scale_from_E2(c0.asmatrix2d().m)
+                        c0_ = geo.SE2_from_translation_angle(ctas.translation, ctas.angle)
+                        prelc0 = relative_pose(c0_, p1)
+                        tas = geo.translation_angle_scale_from_E2(prelc0)
+
+                        # otherwise this lane should not be reported
+                        # assert tas.translation[0] >= 0, tas
+                        ds.append(tas.translation[0])
+
+                    dr_lanedir = max(ds)
+                else:
+                    # no lp
+                    dr_lanedir = 0.0
+
+            driven_any_builder.add(t0, dr_any)
+            driven_lanedir_builder.add(t0, dr_lanedir)
+
+        driven_any_incremental = driven_any_builder.as_sequence()
+
+        driven_any_cumulative = accumulate(driven_any_incremental)
+
+        if len(driven_any_incremental) <= 1:
+            total = 0
+        else:
+            total = driven_any_cumulative.values[-1]
+
+        title = "Distance"
+        description = textwrap.dedent("""\
+            This metric computes how far the robot drove.
+        """)
+
+        result.set_metric(name=('driven_any',), total=total,
+                          incremental=driven_any_incremental,
+                          title=title, description=description, cumulative=driven_any_cumulative)
+        title = "Lane distance"
+
+        driven_lanedir_incremental = driven_lanedir_builder.as_sequence()
+        driven_lanedir_cumulative = accumulate(driven_lanedir_incremental)
+
+        if len(driven_lanedir_incremental) <= 1:
+            total = 0
+        else:
+            total = driven_lanedir_cumulative.values[-1]
+
+        description = textwrap.dedent("""\
+            This metric computes how far the robot drove
+            **in the direction of the lane**.
+        """)
+        result.set_metric(name=('driven_lanedir',), total=total,
+                          incremental=driven_lanedir_incremental,
+                          title=title, description=description, cumulative=driven_lanedir_cumulative)
+
+
+class ReferenceDrivenLengthConsecutive(Rule):
+
+    def evaluate(self, context: RuleEvaluationContext, result: RuleEvaluationResult):
+        interval = context.get_interval()
+        lane_pose_seq = context.get_lane_pose_seq()
+        ego_pose_sequence = context.get_ego_pose_global()
+
+        timestamps = []
+        driven_any = []
+        driven_lanedir = []
+
+        tile_fqn2lane_fqn = {}
+        for idt in iterate_with_dt(interval):
+            t0, t1 = idt.v0, idt.v1  # not v
+            try:
+                name2lpr = lane_pose_seq.at(t0)
+
+                p0 = ego_pose_sequence.at(t0).as_SE2()
+                p1 = ego_pose_sequence.at(t1).as_SE2()
+            except UndefinedAtTime:
+                dr_any = dr_lanedir = 0.0
+
+            else:
+                prel = relative_pose(p0, p1)
+                translation, _ = geo.translation_angle_from_SE2(prel)
+                dr_any = np.linalg.norm(translation)
+
+                if name2lpr:
+
+                    ds = []
+                    for k, lpr in name2lpr.items():
+                        if lpr.tile_fqn in tile_fqn2lane_fqn:
+                            if lpr.lane_segment_fqn != tile_fqn2lane_fqn[lpr.tile_fqn]:
+                                # msg = 'Backwards detected'
+                                # print(msg)
+                                continue
+
+                        tile_fqn2lane_fqn[lpr.tile_fqn] = lpr.lane_segment_fqn
+
+                        assert isinstance(lpr, GetLanePoseResult)
+                        c0 = lpr.center_point
+                        ctas = geo.translation_angle_scale_from_E2(c0.asmatrix2d().m)
+                        c0_ = geo.SE2_from_translation_angle(ctas.translation, ctas.angle)
+                        prelc0 = relative_pose(c0_, p1)
+                        tas = geo.translation_angle_scale_from_E2(prelc0)
+
+                        # otherwise this lane should not be reported
+                        # assert tas.translation[0] >= 0, tas
+                        ds.append(tas.translation[0])
+
+                    dr_lanedir = max(ds) if ds else 0.0
+                else:
+                    # no lp
+                    dr_lanedir = 0.0
+
+            driven_any.append(dr_any)
+            driven_lanedir.append(dr_lanedir)
+            timestamps.append(t0)
+
+        title = "Consecutive lane distance"
+
+        driven_lanedir_incremental = SampledSequence[float](timestamps, driven_lanedir)
+        driven_lanedir_cumulative = accumulate(driven_lanedir_incremental)
+
+        if len(driven_lanedir_incremental) <= 1:
+            total = 0
+        else:
+            total = driven_lanedir_cumulative.values[-1]
+        description = textwrap.dedent("""\
+            This metric computes how far the robot drove **in the direction of the correct lane**,
+            discounting whenever it was driven in the wrong direction with respect to the start.
+        """)
+        result.set_metric(name=('driven_lanedir_consec',), total=total,
+                          incremental=driven_lanedir_incremental,
+                          title=title, description=description, cumulative=driven_lanedir_cumulative)
+
+
+def get_reference_rules():
+    rules = OrderedDict()
+    rules['deviation-heading'] = ReferenceDeviationHeading()
+    rules['in-drivable-lane'] = ReferenceInDrivableLane()
+    rules['deviation-center-line'] = ReferenceDeviationFromCenterLine()
+    rules['driving-distance'] = ReferenceDrivenLength()
+    rules['driving-distance-consecutive'] = ReferenceDrivenLengthConsecutive()
+    rules['survival_time'] = SurvivalTime()
+    return rules
+
+
+def lane_pose_test1_episode():
+    """ The episode of lane_pose_test1: returns the poses and the interval. """
+    v = 5
+    commands_sequence = SampledSequence.from_iterator([
+        (1.0, WheelVelocityCommands(0.1 * v, 0.1 * v)),
+        (2.0, WheelVelocityCommands(0.1 * v, 0.4 * v)),
+        (4.0, WheelVelocityCommands(0.1 * v, 0.4 * v)),
+        (5.0, WheelVelocityCommands(0.1 * v, 0.2 * v)),
+        (6.0, WheelVelocityCommands(0.1 * v, 0.1 * v)),
+    ]).upsample(5)
+    q0 = geo.SE2_from_translation_angle([1.8, 0.7], 0)
+    poses_sequence = get_robot_trajectory(reasonable_duckiebot(), q0, commands_sequence)
+    transforms_sequence = poses_sequence.transform_values(SE2Transform.from_SE2)
+    interval = SampledSequence.from_iterator(enumerate(commands_sequence.timestamps))
+    return transforms_sequence, interval
+
+
+def assert_same_sequence(a, b, msg):
+    if not isinstance(a, SampledSequence):
+        assert a == b, (msg, a, b)
+        return
+    assert list(a.timestamps) == list(b.timestamps), msg
+    np.testing.assert_array_equal(list(a.values), list(b.values), err_msg=msg)
+
+
+@comptest
+def rules_same_as_reference():
+    episodes = [('udem1',) + lane_pose_test1_episode()]
+    for map_name, seed in [('udem1', 0), ('udem1', 1), ('udem1', 2)]:
+        poses = random_walk(seed, n=80)
+        episodes.append((map_name, poses, SampledSequence.from_iterator(enumerate(poses.timestamps))))
+
+    for map_name, poses, interval in episodes:
+        world = load_map(map_name)
+        world.set_object('duckiebot', DB18(), ground_truth=poses)
+        lane_pose_seq = create_lane_highlight(poses, world)
+
+        def context():
+            return RuleEvaluationContext(interval=interval, world=world, ego_name='duckiebot',
+                                         lane_pose_seq=lane_pose_seq, pose_seq=poses)
+
+        evaluated = evaluate_rules_in_context(context())
+        expected = evaluate_rules_in_context(context(), rules=get_reference_rules())
+        assert list(evaluated) == list(expected)
+        for name in expected:
+            metrics, expected_metrics = evaluated[name].metrics, expected[name].metrics
+            assert list(metrics) == list(expected_metrics), name
+            for k, em in expected_metrics.items():
+                m = metrics[k]
+                msg = '%s %s %s' % (map_name, name, k)
+                assert m.total == em.total, (msg, m.total, em.total)
+                assert_same_sequence(m.incremental, em.incremental, msg)
+                assert_same_sequence(m.cumulative, em.cumulative, msg)
+
+
+@comptest
+def rules_timing():
+    poses, interval = lane_pose_test1_episode()
+    world = load_map('udem1')
+    world.set_object('duckiebot', DB18(), ground_truth=poses)
+    timing = {}
+    evaluated = evaluate_rules(poses_sequence=poses, interval=interval, world=world, ego_name='duckiebot',
+                               timing=timing)
+    assert set(evaluated) | {'lane_poses', 'shared'} == set(timing), timing
+    assert all(_ >= 0 for _ in timing.values()), timing
+
+
+if __name__ == '__main__':
+    run_module_tests()
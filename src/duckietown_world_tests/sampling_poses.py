@@ -1,7 +1,10 @@
 # coding=utf-8
+import numpy as np
+
+import geometry as geo
 from comptests import comptest, get_comptests_output_dir, run_module_tests
-from duckietown_world import draw_static
-from duckietown_world.world_duckietown.sampling_poses import sample_good_starting_pose
+from duckietown_world import draw_static, iterate_by_class, LaneSegment
+from duckietown_world.world_duckietown.sampling_poses import sample_good_starting_pose, PoseSampler, is_straight
 
 
 @comptest
@@ -20,5 +23,68 @@ def test_pose_sampling_1():
     draw_static(m, outdir)
 
 
+def starting_pose_reference(choice, along_lane, lateral=0.0, relative_heading=0.0):
+    """ The pose computed one lane segment at a time. """
+    ls = choice.object
+    lp = ls.lane_pose(along_lane, lateral, relative_heading)
+    rel = ls.SE2Transform_from_lane_pose(lp)
+    g = np.dot(choice.transform_sequence.asmatrix2d().m, rel.asmatrix2d().m)
+    t, a, s = geo.translation_angle_scale_from_E2(g)
+    return geo.SE2_from_translation_angle(t, a)
+
+
+@comptest
+def pose_sampler():
+    import duckietown_world as dw
+    m = dw.load_map('udem1')
+
+    for only_straight in [True, False]:
+        choices = list(iterate_by_class(m, LaneSegment))
+        if only_straight:
+            choices = [_ for _ in choices if is_straight(_)]
+        sampler = PoseSampler(m, only_straight=only_straight, seed=0)
+        assert sampler.lane_segment_fqns == [_.fqn for _ in choices]
+
+        # the same poses as the ones computed one at a time
+        lanes = np.arange(len(sampler))
+        for u in [0.0, 0.2, 0.5, 1.0]:
+            along_lane = u * sampler.lengths
+            poses = sampler.poses_at(lanes, along_lane, 0.03, 0.2)
+            for k in lanes.tolist():
+                expected = starting_pose_reference(choices[k], float(along_lane[k]), 0.03, 0.2)
+                assert np.allclose(poses[k], expected, atol=1e-9), (k, u, poses[k], expected)
+
+        res = sampler.sample(20000)
+        assert res.poses.shape == (20000, 3, 3)
+        assert np.all((0 <= res.along_lane) & (res.along_lane <= sampler.lengths[res.lanes]))
+        # the lane segments are chosen proportionally to their length
+        counts = np.bincount(res.lanes, minlength=len(sampler))
+        expected = 20000 * sampler.lengths / np.sum(sampler.lengths)
+        assert np.all(np.abs(counts - expected) < 5 * np.sqrt(expected) + 1), (counts, expected)
+
+        # the same seed gives the same poses
+        res2 = PoseSampler(m, only_straight=only_straight, seed=0).sample(20000)
+        np.testing.assert_array_equal(res.poses, res2.poses)
+
+    q = sample_good_starting_pose(m, only_straight=True, along_lane=0.2)
+    assert q.shape == (3, 3)
+
+
+@comptest
+def pose_sampler_after_highlight():
+    import duckietown_world as dw
+    m = dw.load_map('udem1')
+    reference = dw.load_map('udem1')
+    # adds lane segments placed by a SampledSequence
+    poses = [sample_good_starting_pose(reference, only_straight=False) for _ in range(10)]
+    dw.create_lane_highlight(dw.SampledSequence.from_iterator(enumerate(poses)), m)
+
+    for only_straight in [True, False]:
+        sampler = PoseSampler(m, only_straight=only_straight)
+        assert sampler.lane_segment_fqns == PoseSampler(reference, only_straight=only_straight).lane_segment_fqns
+        q = sample_good_starting_pose(m, only_straight=only_straight)
+        assert q.shape == (3, 3)
+
+
 if __name__ == '__main__':
     run_module_tests()
@@ -1,11 +1,13 @@
 # coding=utf-8
+import networkx as nx
+import numpy as np
 
 from comptests import comptest, run_module_tests, get_comptests_output_dir
-from duckietown_world import get_object_tree
+from duckietown_world import get_object_tree, get_road_network, RoadNetwork
 
 from duckietown_world.svg_drawing import draw_static
 from duckietown_world.world_duckietown.map_loading import load_map
-from duckietown_world.world_duckietown.segmentify import get_skeleton_graph
+from duckietown_world.world_duckietown.segmentify import get_skeleton_graph, get_cached_skeleton_graph
 
 
 @comptest
@@ -26,5 +28,61 @@ def lane_pose_test1():
     print(get_object_tree(res.root2, attributes=True))
 
 
+@comptest
+def road_network_routes():
+    dm = load_map('udem1')
+    network = get_road_network(dm)
+    assert get_road_network(dm) is network
+    assert network.skeleton is get_cached_skeleton_graph(dm)
+    # without the table, the searches are used
+    network2 = RoadNetwork(network.skeleton, all_pairs_max_nodes=0)
+    assert network2.distance is None
+
+    G = nx.DiGraph()
+    for e, lane in enumerate(network.lane_names):
+        i, j = network.lane_start[e], network.lane_end[e]
+        assert network.get_lane_segment(lane).get_lane_length() == network.lane_length[e]
+        assert e in network.out_lanes[network.out_start[i]:network.out_start[i + 1]]
+        if not G.has_edge(i, j) or G[i][j]['length'] > network.lane_length[e]:
+            G.add_edge(i, j, length=network.lane_length[e])
+    expected = dict(nx.all_pairs_dijkstra_path_length(G, weight='length'))
+
+    N = len(network)
+    for i in range(N):
+        for j in range(N):
+            d = expected.get(i, {}).get(j, None)
+            for method in ['table', 'dijkstra', 'astar']:
+                res = network.shortest_path(i, j, method)
+                if d is None:
+                    assert res is None
+                    continue
+                length, lanes = res
+                assert abs(length - d) < 1e-9, (i, j, method, length, d)
+                assert abs(np.sum(network.lane_length[lanes]) - d) < 1e-9
+                # the lanes are consecutive
+                nodes = [i] + network.lane_end[lanes].tolist()
+                assert nodes[-1] == j
+                assert network.lane_start[lanes].tolist() == nodes[:-1]
+            assert network2.shortest_path(i, j) == network.shortest_path(i, j, 'astar')
+
+    lane0, lane1 = network.lane_names[0], network.lane_names[-1]
+    route = network.route(lane0, 0.05, lane0, 0.1)
+    assert route.lanes == [lane0] and abs(route.distance - 0.05) < 1e-12
+    # going back on the same lane requires a loop
+    route = network.route(lane0, 0.1, lane0, 0.05)
+    assert route.lanes[0] == route.lanes[-1] == lane0 and len(route.lanes) > 1
+
+    route = network.route(lane0, 0.1, lane1, 0.05)
+    assert route.lanes[0] == lane0 and route.lanes[-1] == lane1
+    # the poses on the lanes are located on the same lanes
+    q0 = network.get_lane_segment(lane0).center_point(0.5)
+    q1 = network.get_lane_segment(lane1).center_point(0.5)
+    located = network.locate(q0)
+    assert located[0] == lane0
+    route2 = network.route_between_poses(q0, q1)
+    assert route2.lanes[0] == lane0 and route2.lanes[-1] == lane1
+    assert network.locate(np.array([[1, 0, -10], [0, 1, -10], [0, 0, 1.0]])) is None
+
+
 if __name__ == '__main__':
     run_module_tests()
@@ -0,0 +1,108 @@
+# coding=utf-8
+import numpy as np
+from comptests import comptest, run_module_tests
+from numpy.testing import assert_allclose
+
+from duckietown_world.rules.in_drivable_lane import integrate, accumulate
+from duckietown_world.seqs import Constant, SampledSequence, UndefinedAtTime, ArraySampledSequence, iterate_with_dt
+
+
+@comptest
+def sampled_sequence_at():
+    timestamps = [0.0, 0.5, 1.0, 2.0, 3.5]
+    values = ['a', 'b', 'c', 'd', 'e']
+    seq = SampledSequence[str](timestamps, values)
+
+    for t, v in zip(timestamps, values):
+        assert seq.at(t) == v
+        assert seq.at_or_previous(t) == v
+        assert seq.at_or_next(t) == v
+    assert seq.at(2) == 'd'
+
+    try:
+        seq.at(0.7)
+    except UndefinedAtTime:
+        pass
+    else:
+        raise Exception()
+
+    assert seq.at_or_previous(0.7) == 'b'
+    assert seq.at_or_next(0.7) == 'c'
+    assert seq.at_or_previous(-1.0) == 'a'
+    assert seq.at_or_next(-1.0) == 'a'
+    assert seq.at_or_previous(10.0) == 'e'
+    assert seq.at_or_next(10.0) == 'e'
+
+    assert seq.at_many([3.5, 0.0, 1.0]) == ['e', 'a', 'c']
+    assert seq.at_many([]) == []
+    for ts in [[0.0, 0.7], [10.0], [-1.0]]:
+        try:
+            seq.at_many(ts)
+        except UndefinedAtTime:
+            pass
+        else:
+            raise Exception(ts)
+
+    # the index follows changes to the timestamps
+    seq.timestamps.append(4.0)
+    seq.values.append('f')
+    assert seq.at(4.0) == 'f'
+    assert seq.at_many([4.0]) == ['f']
+
+    c = Constant[int](always=1)
+    assert c.at_or_next(2.0) == 1
+    assert c.at_many([0.0, 1.0]) == [1, 1]
+
+
+@comptest
+def array_sampled_sequence():
+    timestamps = [0.0, 0.1, 0.3, 0.4, 1.0]
+    values = [1.0, -2.0, 0.5, 3.0, 2.0]
+    seq = SampledSequence[float](timestamps, values)
+    aseq = ArraySampledSequence.from_sequence(seq)
+    assert isinstance(aseq, SampledSequence)
+    assert len(aseq) == 5
+    assert aseq.get_start() == 0.0 and aseq.get_end() == 1.0
+    assert aseq.at(0.3) == 0.5
+    assert aseq.at_or_previous(0.35) == seq.at_or_previous(0.35)
+    assert aseq.at_or_next(0.35) == seq.at_or_next(0.35)
+    assert_allclose(aseq.at_many([1.0, 0.1]), [2.0, -2.0])
+
+    def same(a, b):
+        assert_allclose(a.timestamps, b.timestamps)
+        assert_allclose(np.array(a.values, dtype='float64'), np.array(b.values, dtype='float64'))
+
+    same(aseq.upsample(3), seq.upsample(3))
+    same(integrate(aseq), integrate(seq))
+    same(accumulate(aseq), accumulate(seq))
+    same(aseq.transform_values(np.abs, vectorized=True), seq.transform_values(abs))
+    same(aseq.transform_values(lambda x: x * 2), seq.transform_values(lambda x: x * 2))
+    assert isinstance(aseq.transform_values(lambda x: x * 2), ArraySampledSequence)
+    # as for SampledSequence, the samples for which f returns None are dropped
+    res = aseq.transform_values(lambda x: x if x > 0 else None)
+    assert res.timestamps.tolist() == [0.0, 0.3, 0.4, 1.0]
+    assert res.values.tolist() == [1.0, 0.5, 3.0, 2.0]
+    # the values that are not numbers are kept as they are, even if they could be converted
+    for f in [str, lambda x: 'a%s' % x, lambda x: x if x > 0 else 'negative', complex]:
+        res = aseq.transform_values(f)
+        assert not isinstance(res, ArraySampledSequence)
+        assert res.values == seq.transform_values(f).values
+
+    for a, b in zip(iterate_with_dt(aseq), iterate_with_dt(seq)):
+        assert_allclose([a.t0, a.t1, a.dt, a.v0, a.v1], [b.t0, b.t1, b.dt, b.v0, b.v1])
+
+    # vector payloads
+    vseq = ArraySampledSequence(timestamps, np.random.randn(5, 2))
+    assert vseq.integrate().values.shape == (4, 2)
+    assert_allclose(vseq.accumulate().values[-1], np.sum(vseq.values, axis=0))
+
+    try:
+        ArraySampledSequence([0.0, 0.0], [1.0, 2.0])
+    except ValueError:
+        pass
+    else:
+        raise Exception()
+
+
+if __name__ == '__main__':
+    run_module_tests()
@@ -0,0 +1,59 @@
+# coding=utf-8
+import json
+import os
+import subprocess
+import sys
+
+from comptests import comptest, run_module_tests, get_comptests_output_dir
+
+import duckietown_world
+
+# Run in a new interpreter, so that nothing is imported yet.
+STARTUP_SCRIPT = '''
+import json, sys, time
+t0 = time.perf_counter()
+from duckietown_world import load_map
+t1 = time.perf_counter()
+load_map('udem1')
+t2 = time.perf_counter()
+from duckietown_world.rules import evaluate_rules
+t3 = time.perf_counter()
+heavy = ['svgwrite', 'bs4', 'networkx', 'plotly', 'PIL']
+res = dict(import_load_map=t1 - t0, load_map=t2 - t1, import_rules=t3 - t2,
+           nmodules=len(sys.modules),
+           heavy_modules=[_ for _ in heavy if _ in sys.modules])
+print(json.dumps(res))
+'''
+
+
+def measure_startup() -> dict:
+    """
+        Returns the time needed for "from duckietown_world import load_map"
+        and for loading a map (without the cache on disk) in a new process.
+    """
+    env = dict(os.environ)
+    src = os.path.dirname(os.path.dirname(duckietown_world.__file__))
+    env['PYTHONPATH'] = os.pathsep.join([src] + [_ for _ in [env.get('PYTHONPATH')] if _])
+    # without the cache on disk, so that the map is always constructed
+    env['DUCKIETOWN_WORLD_CACHE_DIR'] = ''
+    out = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT], env=env,
+                                  stderr=subprocess.DEVNULL)
+    return json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+
+@comptest
+def startup_time():
+    outdir = get_comptests_output_dir()
+    res = measure_startup()
+
+    os.makedirs(outdir, exist_ok=True)
+    with open(os.path.join(outdir, 'startup.json'), 'w') as f:
+        json.dump(res, f, indent=2)
+    print(json.dumps(res, indent=2))
+
+    # these are only needed for drawing and are imported on first use
+    assert not res['heavy_modules'], res
+
+
+if __name__ == '__main__':
+    run_module_tests()
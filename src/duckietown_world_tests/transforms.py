@@ -0,0 +1,126 @@
+# coding=utf-8
+import pickle
+
+import numpy as np
+from comptests import comptest, run_module_tests
+from numpy.testing import assert_allclose
+
+import geometry as geo
+from duckietown_world.geo import Matrix2D, SE2Array, SE2Transform, se2_fast
+
+
+def random_poses(n: int, seed: int = 0) -> np.ndarray:
+    rs = np.random.RandomState(seed)
+    return np.column_stack((rs.uniform(-5, 5, size=(n, 2)), rs.uniform(-np.pi, np.pi, size=n)))
+
+
+@comptest
+def se2_transform_matrix():
+    q = SE2Transform([1.0, 2.0], 0.3)
+    M = geo.SE2_from_translation_angle(q.p, q.theta)
+    assert_allclose(q.as_SE2(), M)
+
+    # the matrix is not shared with the caller...
+    q.as_SE2()[0, 2] = 100
+    assert_allclose(q.as_SE2(), M)
+    # ...and it follows changes of p and theta
+    q.p = np.array([3.0, 4.0])
+    q.theta = -1.0
+    assert_allclose(q.as_SE2(), geo.SE2_from_translation_angle([3.0, 4.0], -1.0))
+    q.p[0] = 5.0
+    assert_allclose(q.as_SE2(), geo.SE2_from_translation_angle([5.0, 4.0], -1.0))
+
+    q2 = SE2Transform.from_SE2(q.as_SE2())
+    assert_allclose(q2.p, q.p)
+    assert_allclose(q2.theta, q.theta)
+    q3 = pickle.loads(pickle.dumps(q))
+    assert_allclose(q3.as_SE2(), q.as_SE2())
+    # nothing is stored besides p and theta
+    assert set(q.__dict__) == {'p', 'theta'}, q.__dict__
+
+    # Matrix2D does not lose precision
+    m = np.eye(3)
+    m[0, 2] = 1e9 + 0.125
+    assert Matrix2D(m).m[0, 2] == m[0, 2]
+
+
+@comptest
+def se2_array():
+    a = SE2Array(random_poses(20, 0))
+    b = SE2Array(random_poses(20, 1))
+    assert len(a) == 20
+    assert a.data.dtype == np.float64
+
+    Ma = a.as_SE2()
+    Mb = b.as_SE2()
+    for i in range(len(a)):
+        assert_allclose(Ma[i], a[i].as_SE2(), atol=1e-12)
+
+    assert_allclose(a.compose(b).as_SE2(), np.matmul(Ma, Mb), atol=1e-12)
+    assert_allclose(a.inverse().as_SE2(), np.linalg.inv(Ma), atol=1e-12)
+    assert_allclose(a.relative(b).as_SE2(), np.matmul(np.linalg.inv(Ma), Mb), atol=1e-12)
+    assert_allclose(SE2Array.from_SE2(Ma).as_SE2(), Ma, atol=1e-12)
+    assert_allclose(a.compose(a.inverse()).data, SE2Array.identity(20).data, atol=1e-12)
+
+    # with a single transform
+    q = SE2Transform([1.0, -2.0], 0.5)
+    assert_allclose(a.compose(q).as_SE2(), np.matmul(Ma, q.as_SE2()), atol=1e-12)
+
+    points = random_poses(20, 2)[:, :2]
+    expected = np.matmul(Ma, np.column_stack((points, np.ones(20)))[:, :, None])[:, :2, 0]
+    assert_allclose(a.apply(points), expected, atol=1e-12)
+    assert_allclose(a.apply([1.0, 2.0]), a.apply(np.tile([1.0, 2.0], (20, 1))))
+
+    transforms = a.as_transforms()
+    assert_allclose(SE2Array.from_transforms(transforms).data, a.data)
+    assert len(a[2:5]) == 3
+
+
+@comptest
+def se2_fast_vs_geometry():
+    xytheta = random_poses(50, 3)
+    # include small and limit angles
+    xytheta[:4, 2] = [0.0, 1e-9, -1e-7, 3.0]
+    qs = np.array([geo.SE2_from_translation_angle(_[:2], _[2]) for _ in xytheta])
+    assert_allclose(se2_fast.SE2_from_xytheta(xytheta), qs, atol=1e-12)
+    assert_allclose(se2_fast.xytheta_from_SE2(qs), xytheta, atol=1e-12)
+
+    q1s = np.roll(qs, 1, axis=0)
+    scaled = qs.copy()
+    scaled[:, 0:2, 0:2] *= 0.585
+    for i, q in enumerate(qs):
+        assert_allclose(se2_fast.SE2_inverse(q), geo.SE2.inverse(q), atol=1e-12)
+        assert_allclose(se2_fast.E2_inverse(scaled[i]), np.linalg.inv(scaled[i]), atol=1e-12)
+
+        v = geo.SE2.algebra_from_group(q)
+        assert_allclose(se2_fast.SE2_log(q), v, atol=1e-9)
+        assert_allclose(se2_fast.se2_exp(v), geo.SE2.group_from_algebra(v), atol=1e-9)
+
+        rel = geo.SE2.multiply(geo.SE2.inverse(q), q1s[i])
+        assert_allclose(se2_fast.SE2_relative(q, q1s[i]), rel, atol=1e-12)
+        linear, _ = geo.linear_angular_from_se2(geo.SE2.algebra_from_group(rel))
+        assert_allclose(se2_fast.SE2_distance(q, q1s[i]), np.linalg.norm(linear), atol=1e-9)
+        for alpha in [0.0, 0.3, 1.0]:
+            expected = np.dot(q, geo.SE2.group_from_algebra(alpha * geo.SE2.algebra_from_group(rel)))
+            assert_allclose(se2_fast.SE2_interpolate(q, q1s[i], alpha), expected, atol=1e-9)
+
+    # batched versions agree with the single ones
+    batch = se2_fast.SE2_interpolate(qs, q1s, np.linspace(0, 1, len(qs)))
+    for i, alpha in enumerate(np.linspace(0, 1, len(qs))):
+        assert_allclose(batch[i], se2_fast.SE2_interpolate(qs[i], q1s[i], alpha), atol=1e-12)
+    assert_allclose(se2_fast.se2_exp(se2_fast.SE2_log(qs)), qs, atol=1e-9)
+    assert_allclose(se2_fast.SE2_inverse(qs), np.linalg.inv(qs), atol=1e-12)
+
+    se2_fast.SE2_belongs(qs[0])
+    se2_fast.se2_belongs(se2_fast.SE2_log(qs[0]))
+    for f, x in [(se2_fast.SE2_belongs, scaled[0]), (se2_fast.se2_belongs, qs[0])]:
+        try:
+            f(x)
+        except ValueError:
+            pass
+        else:
+            raise Exception()
+
+
+if __name__ == '__main__':
+    run_module_tests()
@@ -1,4 +1,7 @@
 # coding=utf-8
+import json
+import os
+import time
 
 from comptests import comptest, run_module_tests, get_comptests_output_dir
 
@@ -8,6 +11,7 @@ from duckietown_world.geo import PlacedObject, SE2Transform
 from duckietown_world.seqs import Constant
 from duckietown_world.seqs.tsequence import SampledSequenceBuilder
 from duckietown_world.world_duckietown import create_map
+from duckietown_world.world_duckietown import map_loading
 from duckietown_world.world_duckietown.map_loading import load_map
 
 
@@ -60,6 +64,95 @@ def wb2():
 
 
 
+@comptest
+def map_cache():
+    outdir = get_comptests_output_dir()
+    os.environ['DUCKIETOWN_WORLD_CACHE_DIR'] = os.path.join(outdir, 'maps-cache')
+    try:
+        expected = json.dumps(load_map('udem1', use_cache=False).as_json_dict(), sort_keys=True)
+
+        map_loading._maps_lru.clear()
+        dw1 = load_map('udem1')  # constructed
+        dw1.set_object('extra', PlacedObject())
+        dw2 = load_map('udem1')  # from memory
+        map_loading._maps_lru.clear()
+        dw3 = load_map('udem1')  # from disk
+
+        assert dw1 is not dw2
+        for dw in [dw2, dw3]:
+            assert 'extra' not in dw.children
+            assert json.dumps(dw.as_json_dict(), sort_keys=True) == expected
+
+        # an invalid file is ignored and replaced
+        key = map_loading._get_map_cache_key(map_loading._get_map_yaml('udem1'))
+        fn = os.path.join(os.environ['DUCKIETOWN_WORLD_CACHE_DIR'], key + '.pickle')
+        assert os.path.exists(fn)
+        with open(fn, 'wb') as f:
+            f.write(b'not a pickle')
+        map_loading._maps_lru.clear()
+        dw4 = load_map('udem1')
+        assert json.dumps(dw4.as_json_dict(), sort_keys=True) == expected
+        with open(fn, 'rb') as f:
+            assert f.read() != b'not a pickle'
+
+        # the key depends on the tile templates
+        data = map_loading.tile_template.data
+        try:
+            map_loading.tile_template.data = data + '\n'
+            map_loading._code_hash = None
+            assert map_loading._get_map_cache_key(map_loading._get_map_yaml('udem1')) != key
+        finally:
+            map_loading.tile_template.data = data
+            map_loading._code_hash = None
+        assert map_loading._get_map_cache_key(map_loading._get_map_yaml('udem1')) == key
+        # and on the code of all the classes in the maps
+        code_files = map_loading._get_code_files()
+        for fn in ['geo/transforms.py', 'geo/placed_object.py', 'seqs/tsequence.py', 'world_duckietown/tile.py']:
+            assert os.path.join(*fn.split('/')) in code_files, fn
+
+        # only the most recently used maps are kept on disk
+        d = os.environ['DUCKIETOWN_WORLD_CACHE_DIR']
+
+        def cache_file(map_name):
+            return map_loading._get_map_cache_key(map_loading._get_map_yaml(map_name)) + '.pickle'
+
+        size = map_loading.MAPS_CACHE_DIR_SIZE
+        try:
+            map_loading.MAPS_CACHE_DIR_SIZE = 2
+            load_map('4way')
+            assert sorted(os.listdir(d)) == sorted([cache_file('udem1'), cache_file('4way')])
+            t = time.time() - 100
+            os.utime(os.path.join(d, cache_file('udem1')), (t, t))
+            os.utime(os.path.join(d, cache_file('4way')), (t + 1, t + 1))
+            # reading a map marks it as used
+            map_loading._maps_lru.clear()
+            load_map('udem1')
+            load_map('loop_empty')
+            assert sorted(os.listdir(d)) == sorted([cache_file('udem1'), cache_file('loop_empty')])
+        finally:
+            map_loading.MAPS_CACHE_DIR_SIZE = size
+    finally:
+        del os.environ['DUCKIETOWN_WORLD_CACHE_DIR']
+
+
+@comptest
+def texture_index():
+    for name in ['asphalt', 'straight', '3way_left', 'tag36_11_00005.png']:
+        fn = map_loading.get_texture_file(name)
+        assert os.path.exists(fn), fn
+    try:
+        map_loading.get_texture_file('not-a-texture')
+    except KeyError:
+        pass
+    else:
+        raise Exception()
+
+    index = map_loading.get_texture_index()
+    map_loading.refresh_texture_index()
+    assert map_loading.get_texture_index() is not index
+    assert map_loading.get_texture_index() == index
+
+
 @comptest
 def sb1():
     a = SampledSequenceBuilder[float]()